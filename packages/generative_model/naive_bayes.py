@@ -2,8 +2,12 @@
 Implementation of Naive Bayes classifier for metagenomics data generated from encoding2 module.
 '''
 from sklearn.metrics import recall_score
+from scipy.sparse import csr_matrix
+from scipy.special import logsumexp
 import numpy as np
 
+from packages.metagenomics import sampling2, encoding2
+
 
 def run_naive_bayes(X_train, X_test, y_train, y_test):
     '''
@@ -16,14 +20,9 @@ def run_naive_bayes(X_train, X_test, y_train, y_test):
     :return: the recall score for the predictions given by the "test_new_data" function
     '''
 
-    taxid_probabilities = taxid_probability(y_train)
-    sparse_list = split_sparsemtx_by_taxid(X_train, y_train)
-
-    prediction_list = []
-    for i in range(X_test.shape[0]):
-        new_prediction = test_new_data(X_test[i, :], sparse_list, taxid_probabilities)
-        prediction_list.append(max(new_prediction, key=new_prediction.get))
-
+    model = NaiveBayes()
+    model.fit(X_train, y_train)
+    prediction_list = model.predict(X_test)
 
     score = recall_score(y_test, prediction_list, average='weighted')
     return score
@@ -55,19 +54,45 @@ def split_sparsemtx_by_taxid(matrix, taxids):
     :return: a list of sparse matrices, one for each taxid
     '''
 
-    taxids_list, taxid_counts = np.unique(taxids, return_counts=True)
-    sparse_mtx_list = []
+    taxids_list, taxid_idx = np.unique(taxids, return_inverse=True)
 
-    for each in taxids_list:
-        index_list = np.array([i for i, val in enumerate(taxids) if val == each])
+    # group row indexes by taxid in a single sort rather than scanning all taxids for each taxid
+    order = np.argsort(taxid_idx.reshape(-1), kind='stable')
+    boundaries = np.cumsum(np.bincount(taxid_idx.reshape(-1), minlength=len(taxids_list)))[:-1]
+
+    sparse_mtx_list = []
+    for index_list in np.split(order, boundaries):
         sparse_mtx_list.append(matrix[index_list,:])
 
     return sparse_mtx_list
 
 
+def count_features_by_taxid(matrix, taxids):
+    '''
+    Sums the rows of a sparse matrix for each taxid in a single pass, without building a submatrix for each taxid.
+    Rows are summed by multiplying with a sparse one-hot matrix of the taxids (Y^T X), where Y is L x K and
+    Y_lk = 1 if the lth row belongs to the kth taxid.
+
+    :param matrix: L x J sparse matrix
+    :param taxids: L x 1 array of taxids
+    :return: (K x 1 array, K x 1 array, K x J sparse matrix) Tuple representing (sorted unique taxids,
+            number of rows for each taxid, sum of rows for each taxid)
+    '''
+    taxids_list, taxid_idx, taxid_counts = np.unique(taxids, return_inverse=True, return_counts=True)
+
+    # build Y^T directly as K x L
+    n_rows = len(taxid_idx.reshape(-1))
+    Y_T = csr_matrix((np.ones(n_rows), (taxid_idx.reshape(-1), np.arange(n_rows))), shape=(len(taxids_list), n_rows))
+
+    feature_counts = Y_T @ csr_matrix(matrix)
+    return taxids_list, taxid_counts, feature_counts.tocsr()
+
+
 def test_new_data(encoded, sparse_list, taxid_probabilities):
     '''
-    Calculates the probability that the encoded data belongs to each class
+    Calculates the probability that the encoded data belongs to each class.
+    Scoring is done in log space, as the sum of the log likelihoods of the features plus the log prior of the taxid,
+    so long fragments do not underflow. Feature probabilities use Laplace smoothing.
 
     :param encoded: a csr.matrix, corresponds to one row of the overall test matrix
     :param sparse_list:, a list of sparse matrices, each element corresponding to one taxid
@@ -76,19 +101,204 @@ def test_new_data(encoded, sparse_list, taxid_probabilities):
         to that taxid
     '''
 
-    final_probabilities = {}
     taxid_keys = list(taxid_probabilities.keys())
+    n_features = encoded.shape[1]
 
-    encoded_to_array = encoded.toarray()
+    # smoothed log probability of each feature for each taxid
+    feature_counts = np.vstack([np.asarray(each.sum(axis=0)) for each in sparse_list])
+    totals = feature_counts.sum(axis=1).reshape(-1, 1)
+    log_prob = np.log(feature_counts + 1) - np.log(totals + n_features)
+    log_prior = np.log([taxid_probabilities[key] for key in taxid_keys])
 
-    for i in range(len(sparse_list)):
-        col_sum = sparse_list[i].sum(axis=0)
-        col_sum /= sparse_list[i].shape[0]
+    # normalize log likelihoods into posterior probabilities
+    jll = np.asarray(csr_matrix(encoded) @ log_prob.T).reshape(-1) + log_prior
+    posteriors = np.exp(jll - logsumexp(jll))
 
-        prod = np.multiply(encoded_to_array, col_sum)
-        # multiplying by the taxid probability
-        total_prod = np.multiply(prod, taxid_probabilities[taxid_keys[i]])
-        # print(total_prod)
-        final_probabilities[taxid_keys[i]] = total_prod.sum().max()
+    final_probabilities = {}
+    for i in range(len(taxid_keys)):
+        final_probabilities[taxid_keys[i]] = posteriors[i]
 
     return final_probabilities
+
+
+def _expand_rows(matrix, row_idx, n_rows):
+    '''
+    Places the rows of a sparse matrix into a larger sparse matrix filled with zeros.
+
+    :param matrix: K x J sparse matrix
+    :param row_idx: K x 1 array, row of the larger matrix for each row of matrix
+    :param n_rows: int, number of rows in the larger matrix
+    :return: n_rows x J sparse matrix
+    '''
+    n = len(row_idx)
+    placement = csr_matrix((np.ones(n), (row_idx, np.arange(n))), shape=(n_rows, n))
+    return placement @ matrix
+
+
+def partial_fit_fragment_files(model, input_dir, pattern, k):
+    '''
+    Trains a NaiveBayes model one fragment file at a time (i.e. the fragments-*.npy files written by
+    sampling2.generate_fragment_data), so the fragment data never needs to fit in memory at once. Each file is encoded
+    with encoding2.encode_fragment_dataset_fixed_width(), so all files must use the same sample length.
+    Test data must be encoded the same way.
+
+    :param model: NaiveBayes model. May already contain counts from other fragment files.
+    :param input_dir: str, path to directory where fragments are stored
+    :param pattern: str, unix-like pattern to match (i.e. 'fragments*.npy')
+    :param k: int, size of k-mer to subdivide fragments into
+    :return: model
+    '''
+    for fragments in sampling2.iter_fragments(input_dir, pattern):
+        X, y = encoding2.encode_fragment_dataset_fixed_width(fragments, k)
+        model.partial_fit(X, y)
+
+    return model
+
+
+class NaiveBayes:
+    '''
+    Multinomial Naive Bayes classifier with Laplace smoothing.
+
+    Fitting precomputes the log probability of every feature for every taxid once, so the whole test set is classified
+    with a single sparse matrix multiplication instead of one row at a time. Scoring is done in log space, so fragments
+    of any length can be scored without underflow.
+
+    The smoothed probability of feature j given taxid k is
+
+        theta_kj = (count_kj + alpha) / (total_k + alpha * J)
+
+    Most counts are zero in k-mer data, so the K x J matrix of log(theta_kj) is stored in two parts which keep it
+    sparse:
+
+        log(theta_kj) = feature_log_prob[k, j] + feature_log_prob_offset[k]
+
+    where feature_log_prob = log(1 + count_kj / alpha) is zero wherever the count is zero, and
+    feature_log_prob_offset = log(alpha) - log(total_k + alpha * J) is shared by all features of the taxid.
+    '''
+
+    def __init__(self, alpha=1.0):
+        '''
+        Initializes an instance.
+
+        :param alpha: float, additive (Laplace) smoothing parameter. Default is 1.0.
+        '''
+        self.alpha = alpha
+        self.classes = None
+        self.class_count = None
+        self.feature_count = None
+        self.class_log_prior = None
+        self.feature_log_prob = None
+        self.feature_log_prob_offset = None
+
+    def fit(self, X, y):
+        '''
+        Counts features for each taxid and precomputes the log probabilities used for predictions.
+        Any counts from previous calls to fit() or partial_fit() are discarded.
+
+        :param X: L x J sparse matrix, one-hot encoded training sequences
+        :param y: L x 1 array, taxid of each training sequence
+        :return: self
+        '''
+        self.classes = None
+        return self.partial_fit(X, y)
+
+    def partial_fit(self, X, y):
+        '''
+        Adds the feature and taxid counts of another batch of training sequences to the counts already in the model,
+        then updates the log probabilities used for predictions. Taxids not seen before are added to the model, so new
+        genomes can be added without retraining on the previous data.
+
+        Every batch must be encoded with the same columns, i.e. with encoding2.encode_fragment_dataset_fixed_width()
+        using the same sample length and k.
+
+        :param X: L x J sparse matrix, one-hot encoded training sequences
+        :param y: L x 1 array, taxid of each training sequence
+        :return: self
+        '''
+        # sum features over the sequences of each taxid
+        classes, class_count, feature_count = count_features_by_taxid(X, y)
+
+        if self.classes is None:
+            self.classes, self.class_count, self.feature_count = classes, class_count, feature_count
+        else:
+            if feature_count.shape[1] != self.feature_count.shape[1]:
+                msg = 'Number of features does not match previous training data (expected, actual):'
+                raise ValueError(msg, self.feature_count.shape[1], feature_count.shape[1])
+
+            # place previous and new counts in the rows of the combined taxids
+            all_classes = np.union1d(self.classes, classes)
+            prev_idx = np.searchsorted(all_classes, self.classes)
+            new_idx = np.searchsorted(all_classes, classes)
+
+            all_class_count = np.zeros(len(all_classes), dtype=np.int64)
+            all_class_count[prev_idx] += self.class_count
+            all_class_count[new_idx] += class_count
+
+            self.feature_count = (_expand_rows(self.feature_count, prev_idx, len(all_classes))
+                                  + _expand_rows(feature_count, new_idx, len(all_classes))).tocsr()
+            self.classes = all_classes
+            self.class_count = all_class_count
+
+        self._update_log_probabilities()
+        return self
+
+    def _update_log_probabilities(self):
+        '''
+        Calculates log priors and smoothed log feature probabilities from the current counts.
+
+        :return: None
+        '''
+        n_features = self.feature_count.shape[1]
+
+        self.class_log_prior = np.log(self.class_count) - np.log(self.class_count.sum())
+
+        # log(1 + count / alpha) keeps the sparsity of the counts
+        self.feature_log_prob = self.feature_count.astype(np.float64)
+        self.feature_log_prob.data = np.log1p(self.feature_log_prob.data / self.alpha)
+
+        totals = np.asarray(self.feature_count.sum(axis=1)).reshape(-1)
+        self.feature_log_prob_offset = np.log(self.alpha) - np.log(totals + self.alpha * n_features)
+
+    def _joint_log_likelihood(self, X):
+        '''
+        Calculates log P(taxid) + SUM_j x_j log P(feature j | taxid) for every sequence and every taxid.
+
+        :param X: L x J sparse matrix, one-hot encoded sequences
+        :return: L x K array, where K is the number of taxids
+        '''
+        X_sparse = csr_matrix(X)
+        n_features_per_row = np.asarray(X_sparse.sum(axis=1))  # L x 1
+
+        jll = (X_sparse @ self.feature_log_prob.T).toarray()
+        jll += n_features_per_row * self.feature_log_prob_offset
+        jll += self.class_log_prior
+        return jll
+
+    def predict(self, X):
+        '''
+        Predicts the most probable taxid for each sequence.
+
+        :param X: L x J sparse matrix, one-hot encoded sequences
+        :return: L x 1 array of taxids
+        '''
+        jll = self._joint_log_likelihood(X)
+        return self.classes[np.argmax(jll, axis=1)]
+
+    def predict_log_proba(self, X):
+        '''
+        Calculates the log posterior probability of each taxid for each sequence.
+
+        :param X: L x J sparse matrix, one-hot encoded sequences
+        :return: L x K array, where K is the number of taxids. Columns are ordered as in self.classes.
+        '''
+        jll = self._joint_log_likelihood(X)
+        return jll - logsumexp(jll, axis=1).reshape(-1, 1)
+
+    def predict_proba(self, X):
+        '''
+        Calculates the posterior probability of each taxid for each sequence. Probabilities for each sequence sum to 1.
+
+        :param X: L x J sparse matrix, one-hot encoded sequences
+        :return: L x K array, where K is the number of taxids. Columns are ordered as in self.classes.
+        '''
+        return np.exp(self.predict_log_proba(X))
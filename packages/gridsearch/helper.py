@@ -3,16 +3,42 @@ Common functions used in grid search process.
 """
 
 import csv
+import hashlib
+import io
+import json
+import os
 import shutil
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from glob import glob
 
 import numpy as np
 import pandas as pd
+from scipy.sparse import load_npz, save_npz
 from sklearn import preprocessing
 from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import train_test_split
 
 from packages.metagenomics import sampling2, encoding2
 
+ENCODED_MATRIX = 'X.npz'
+ENCODED_TAXIDS = 'y.npy'
+ENCODED_CATEGORIES = 'categories.npz'
+LEDGER_SUFFIX = '.ledger'
+
+# stages timed for each grid search row, in column order
+STAGES = ['sampling', 'reading', 'encoding', 'splitting', 'fitting', 'predicting']
+TOTAL_TIME = 'total_time'
+SPLITS = ['fragment', 'sequence', 'strain']
+
+# file hashes already calculated, keyed by (path, size, modification time)
+_FILE_HASHES = {}
+_CV_DATA = {}  # encoded data shared by cross-validation fits in this process (see cross_validate())
+_FIT_DATA = {}  # split encoding used by the latest fit job in this process (see _score_saved_encoding())
+
 
 def append_results_to_file(filename, fields=None, rows=None):
     """
@@ -34,76 +60,629 @@ def append_results_to_file(filename, fields=None, rows=None):
             write.writerows(rows)
 
 
-def build_fragments(seq_file, taxid_file, output_dir, sample_length, coverage, seed):
+def timing_fields():
+    """
+    Lists the timing columns added to grid search results: the wall time in seconds (<stage>_time) and the peak memory
+    allocated during the stage in MB (<stage>_peak_memory) for each stage in STAGES. Peak memory is left empty unless
+    memory is traced (see memory_tracing()).
+
+    :return: List
+    """
+    return [name.format(stage) for stage in STAGES for name in ('{}_time', '{}_peak_memory')]
+
+
+# tested
+@contextmanager
+def timed_stage(timings, stage):
+    """
+    Context manager which records the wall time and peak memory of the enclosed block under the given stage name.
+    Time spent in several blocks with the same stage name is added together, and the largest peak is kept.
+
+    Peak memory is only recorded while memory allocations are traced (see memory_tracing()), as the highest amount of
+    memory allocated during the block beyond what was allocated when the block started, so each stage is measured
+    separately from the stages which ran before it. Only memory allocated through Python and numpy is traced (i.e. not
+    memory allocated internally by compiled libraries).
+
+    Usage:
+        timings = {}
+        with timed_stage(timings, 'fitting'):
+            model.fit(X, y)
+
+    :param timings: dictionary where results are stored (keys <stage>_time and <stage>_peak_memory), or None to skip
+            timing
+    :param stage: str, name of the stage (i.e. one of STAGES)
+    :return: None
+    """
+    if timings is None:
+        yield
+        return
+
+    trace_memory = tracemalloc.is_tracing()
+    if trace_memory:
+        tracemalloc.reset_peak()
+        start_memory, _ = tracemalloc.get_traced_memory()
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage + '_time'] = timings.get(stage + '_time', 0) + time.perf_counter() - start
+
+        if trace_memory and tracemalloc.is_tracing():
+            _, peak_memory = tracemalloc.get_traced_memory()
+            peak_memory = max(peak_memory - start_memory, 0) / 1024 ** 2
+            timings[stage + '_peak_memory'] = max(timings.get(stage + '_peak_memory', 0), peak_memory)
+
+
+# tested
+@contextmanager
+def memory_tracing(enabled=True):
+    """
+    Context manager which traces memory allocations with tracemalloc in the enclosed block, so that timed_stage() also
+    records the peak memory of each stage. Tracing makes allocation-heavy code many times slower (i.e. encoding
+    fragments took about 10 times as long), which inflates the recorded wall times, so memory should be measured in a
+    separate run from timing. Does nothing if enabled is False or memory is already being traced.
+
+    :param enabled: boolean, whether to trace memory. Default is True.
+    :return: None
+    """
+    started = enabled and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        yield
+    finally:
+        if started:
+            tracemalloc.stop()
+
+
+def _start_memory_tracing():
+    """
+    Starts tracing memory allocations for the rest of the process. Used as the initializer of worker processes when
+    memory is traced.
+
+    :return: None
+    """
+    tracemalloc.start()
+
+
+def _run_with_timings(func, *args, **kwargs):
+    """
+    Calls a function which records stage timings, so that timings can be returned from another process.
+
+    :param func: function which accepts a timings keyword argument
+    :return: (object, dictionary) Tuple representing (return value of func, timings)
+    """
+    timings = {}
+    result = func(*args, timings=timings, **kwargs)
+    return result, timings
+
+
+def _hash_file(filename):
+    """
+    Calculates the SHA-256 digest of a file's contents. Digests are remembered for the life of the process and
+    recalculated only if the file's size or modification time changes, so large sequence files are read once.
+
+    :param filename: path to the file
+    :return: str, hexadecimal digest
+    """
+    stat = os.stat(filename)
+    file_id = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+
+    if file_id not in _FILE_HASHES:
+        sha = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        _FILE_HASHES[file_id] = sha.hexdigest()
+
+    return _FILE_HASHES[file_id]
+
+
+# tested
+def fragment_cache_key(seq_file, taxid_file, sample_length, coverage, seed):
+    """
+    Builds the cache key for a set of fragments. The key depends on the contents of the input files rather than their
+    paths, so renamed or copied files are still served from cache and edited files are not.
+
+    :param seq_file: Path to file containing sequence data in .fasta format.
+    :param taxid_file: Path to file containing matching species for all sequences.
+    :param sample_length: int, Length of the fragments to extract from each sequence.
+    :param coverage: float, desired coverage percent for each sequence letter
+    :param seed: Random seed, for reproducibility
+    :return: str, hexadecimal key
+    """
+    parts = [_hash_file(seq_file), _hash_file(taxid_file), str(sample_length), repr(float(coverage)), str(seed)]
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+
+def _get_directory_size(path):
+    """
+    Calculates the total size of all files in a directory.
+
+    :param path: path to the directory
+    :return: int, size in bytes
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for each in files:
+            total += os.path.getsize(os.path.join(root, each))
+    return total
+
+
+# tested
+def evict_cache(cache_dir, max_cache_size, keep=None):
+    """
+    Deletes the least recently used entries in a cache directory until its total size is at most the given size.
+    Entries are subdirectories of the cache directory, ordered by their modification time, which is updated whenever
+    the entry is used. Temporary directories of entries still being written are ignored.
+
+    :param cache_dir: path to the cache directory
+    :param max_cache_size: int, maximum total size of the cache in bytes
+    :param keep: str, name of an entry which should not be deleted (i.e. the entry currently in use). Default is None.
+    :return: List, names of deleted entries
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if os.path.isdir(path) and not name.startswith('.'):
+            entries.append((os.path.getmtime(path), name, _get_directory_size(path)))
+
+    # oldest entries first
+    entries.sort()
+    total = sum(size for _, _, size in entries)
+
+    deleted = []
+    for _, name, size in entries:
+        if total <= max_cache_size:
+            break
+
+        if name != keep:
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+            deleted.append(name)
+            total -= size
+
+    return deleted
+
+
+# tested
+def build_fragments(seq_file, taxid_file, output_dir, sample_length, coverage, seed, cache_dir=None,
+                    max_cache_size=None, timings=None):
     """
     Deletes output directory if it exists. Populates output directory with fragment data.
 
+    If a cache directory is given, fragments are instead stored in the cache under a key derived from the contents of
+    the input files, sample length, coverage, and seed (see fragment_cache_key()), and fragments previously generated
+    for the same key are reused without sampling again. Unseeded fragments are not reproducible, so they are always
+    generated again (in output_dir) when no seed is given (sampling treats a seed of 0 or None as unseeded).
+
     :param seq_file: Path to file containing sequence data in .fasta format.
     :param taxid_file: Path to file containing matching species for all sequences.
     :param output_dir: Path where fragments should be written. Directory will be deleted if it exists.
     :param sample_length: int, Length of the fragments to extract from each sequence.
     :param coverage: float, desired coverage percent for each sequence letter
     :param seed: Random seed, for reproducibility
-    :return: None
+    :param cache_dir: Path to directory where fragment sets are cached. Default is None, in which case fragments are
+            always generated in output_dir.
+    :param max_cache_size: int, maximum total size of the cache in bytes. Least recently used fragment sets are deleted
+            when the cache grows larger. Default is None, in which case the cache is not limited.
+    :param timings: dictionary where the time spent sampling is recorded (see timed_stage()). Default is None.
+    :return: str, path to the directory containing the fragments
     """
-    # delete output directory if it previously exists
-    try:
-        shutil.rmtree(output_dir)
-    except FileNotFoundError:
-        print('Existing directory was not found. Process will generate a directory.')
+    if cache_dir is None or not seed:
+        # delete output directory if it previously exists
+        try:
+            shutil.rmtree(output_dir)
+        except FileNotFoundError:
+            print('Existing directory was not found. Process will generate a directory.')
+
+        # build fragments
+        print('Building fragments...')
+        with timed_stage(timings, 'sampling'):
+            sampling2.generate_fragment_data(seq_file, taxid_file, output_dir, sample_length, coverage, seed)
+        return output_dir
+
+    os.makedirs(cache_dir, exist_ok=True)
+    key = fragment_cache_key(seq_file, taxid_file, sample_length, coverage, seed)
+    fragment_dir = os.path.join(cache_dir, key)
+
+    if os.path.isdir(fragment_dir):
+        print('Using cached fragments...')
+        os.utime(fragment_dir)  # mark as recently used
+    else:
+        # build fragments in a temporary directory so that an interrupted run never leaves a partial entry
+        print('Building fragments...')
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=cache_dir)
+        try:
+            tmp_fragment_dir = os.path.join(tmp_dir, key)
+            with timed_stage(timings, 'sampling'):
+                sampling2.generate_fragment_data(seq_file, taxid_file, tmp_fragment_dir, sample_length, coverage,
+                                                 seed)
+            try:
+                os.rename(tmp_fragment_dir, fragment_dir)
+            except OSError:
+                # another process cached the same fragments first
+                if not os.path.isdir(fragment_dir):
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if max_cache_size is not None:
+        evict_cache(cache_dir, max_cache_size, keep=key)
+
+    return fragment_dir
+
+
+# tested
+def encoding_cache_key(output_dir, pattern, k, dtype=np.float64):
+    """
+    Builds the cache key for an encoded fragment set. The key depends on the contents of the fragment files, so
+    fragment sets which are sampled again (i.e. without a seed) are never confused with previously encoded sets.
+
+    :param output_dir: Path where fragments were written.
+    :param pattern: str, bash-like pattern defining types of files to read from the output directory.
+    :param k: int, size of k-mer to subdivide fragments into
+    :param dtype: type of the values stored in the encoded matrix. Default is np.float64.
+    :return: str, hexadecimal key
+    """
+    files = sorted(glob(os.path.join(output_dir, pattern)))
+    # v2: rows are stored in sorted file order, so they can be matched to their sequences
+    # v3: entries include the kmers of the encoded columns
+    parts = ['encoded-v3', str(k), np.dtype(dtype).name] + [_hash_file(each) for each in files]
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()
 
-    # build fragments
-    print('Building fragments...')
-    sampling2.generate_fragment_data(seq_file, taxid_file, output_dir, sample_length, coverage, seed)
 
+# tested
+def load_encoded_fragments(output_dir, pattern, k, dtype=np.float64, cache_dir=None, max_cache_size=None,
+                           timings=None, return_categories=False):
+    """
+    Reads fragment data from file and encodes it. If a cache directory is given, the encoded matrix and taxids are
+    stored in the cache under a key derived from the contents of the fragment files, k, and dtype
+    (see encoding_cache_key()), and later calls with the same key read them from the cache instead of encoding again.
 
-def encode_fragments(output_dir, pattern, k, seed=None):
+    :param output_dir: Path where fragments were written.
+    :param pattern: str, bash-like pattern defining types of files to read from the output directory.
+    :param k: int, size of k-mer to subdivide fragments into
+    :param dtype: type of the values stored in the encoded matrix. Default is np.float64.
+    :param cache_dir: Path to directory where encoded fragment sets are cached. Default is None, in which case
+            fragments are always encoded.
+    :param max_cache_size: int, maximum total size of the cache in bytes. Least recently used entries are deleted
+            when the cache grows larger. Default is None, in which case the cache is not limited.
+    :param timings: dictionary where the time spent reading and encoding is recorded (see timed_stage()). Reading a
+            cached encoding is recorded as reading. Default is None.
+    :param return_categories: boolean, if True, also returns the kmers of the encoded columns
+            (see encoding2.encode_fragment_dataset()). Default is False.
+    :return: (sparse matrix, L x 1 array) Tuple representing (encoded kmers, taxids), or
+            (sparse matrix, L x 1 array, List of arrays) Tuple representing (encoded kmers, taxids, kmers of the encoded
+            columns) if return_categories is True
+    """
+    if cache_dir is None:
+        with timed_stage(timings, 'reading'):
+            fragments = sampling2.read_fragments(output_dir, pattern)
+        with timed_stage(timings, 'encoding'):
+            return encoding2.encode_fragment_dataset(fragments, k, dtype, return_categories)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    key = encoding_cache_key(output_dir, pattern, k, dtype)
+    entry_dir = os.path.join(cache_dir, key)
+
+    if os.path.isdir(entry_dir):
+        print('Using cached encoding...')
+        os.utime(entry_dir)  # mark as recently used
+        with timed_stage(timings, 'reading'):
+            X_enc = load_npz(os.path.join(entry_dir, ENCODED_MATRIX)).tocsr()
+            y = np.load(os.path.join(entry_dir, ENCODED_TAXIDS))
+            categories = None
+            if return_categories:
+                with np.load(os.path.join(entry_dir, ENCODED_CATEGORIES)) as f:
+                    categories = [f['arr_{}'.format(i)] for i in range(len(f.files))]
+    else:
+        with timed_stage(timings, 'reading'):
+            fragments = sampling2.read_fragments(output_dir, pattern)
+        with timed_stage(timings, 'encoding'):
+            X_enc, y, categories = encoding2.encode_fragment_dataset(fragments, k, dtype, return_categories=True)
+
+        # write to a temporary directory so that an interrupted run never leaves a partial entry
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=cache_dir)
+        try:
+            tmp_entry_dir = os.path.join(tmp_dir, key)
+            os.mkdir(tmp_entry_dir)
+            save_npz(os.path.join(tmp_entry_dir, ENCODED_MATRIX), X_enc.tocsr(), compressed=False)
+            np.save(os.path.join(tmp_entry_dir, ENCODED_TAXIDS), y)
+            np.savez(os.path.join(tmp_entry_dir, ENCODED_CATEGORIES), *categories)
+            try:
+                os.rename(tmp_entry_dir, entry_dir)
+            except OSError:
+                # another process cached the same encoding first
+                if not os.path.isdir(entry_dir):
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if max_cache_size is not None:
+        evict_cache(cache_dir, max_cache_size, keep=key)
+
+    if return_categories:
+        return X_enc, y, categories
+    return X_enc, y
+
+
+def encode_fragments(output_dir, pattern, k, seed=None, dtype=np.float64, cache_dir=None, max_cache_size=None,
+                     timings=None, test_size=0.33, return_indices=False, record_groups=None, return_encoding=False):
     """
     Reads fragment data from file, encodes data for processing, and splits data into training and test sets.
-    Performs an additional check to ensure that both test and training sets contain all classes in the data.
+    The split is stratified so that both test and training sets contain all classes in the data
+    (see stratified_split_indices()).
+
+    If record_groups is given, fragments are split by the sequence they were drawn from instead, so that all fragments
+    of a sequence (or of a group of sequences, i.e. a strain) are in the same set (see group_split_indices()).
 
     :param output_dir: Path where fragments were written.
     :param pattern: str, bash-like pattern defining types of files to read from the output directory.
                 (i.e. "*.npy" to read all files that end with .npy)
     :param k: int, size of k-mer to subdivide fragments into
     :param seed: Random seed, for reproducibility
-    :return: L x J sparse matrix, where L is the number of fragments and J is the number of dimensions
-            for each fragment.
+    :param dtype: type of the values stored in the encoded matrix. Default is np.float64.
+    :param cache_dir: Path to directory where encoded fragment sets are cached and reused
+            (see load_encoded_fragments()). Default is None, in which case fragments are always encoded.
+    :param max_cache_size: int, maximum total size of the cache in bytes. Default is None.
+    :param timings: dictionary where the time spent reading, encoding, and splitting is recorded
+            (see timed_stage()). Default is None.
+    :param test_size: float, fraction of the fragments of each class placed in the test set. Default is 0.33.
+    :param return_indices: boolean, if True, returns the whole encoded data set with the row indices of the
+            training and test sets instead of copying the rows into separate matrices, for callers which only use a
+            subset of the training rows (i.e. successive halving), so only that subset is copied. Otherwise, the rows
+            are copied into X_train and X_test, and memory use peaks at about twice the encoded data set while
+            splitting. Only successive halving uses indices; run_grid_search() and work_queue.run_worker() pass
+            matrices to score functions, so they copy. Default is False.
+    :param record_groups: m x 1 array, group of each sequence in the .fasta file the fragments were drawn from
+            (see get_record_groups()). Default is None, in which case fragments are split individually.
+    :param return_encoding: boolean, if True, also returns a dictionary describing the encoding, which is needed to
+            use a trained model on other fragments: 'classes' (taxid of each encoded label, i.e.
+            LabelEncoder.classes_) and 'categories' (kmers of the encoded columns, see
+            encoding2.encode_fragment_dataset()). Default is False.
+    :return: (X_train, X_test, y_train, y_test), where X_train and X_test are sparse matrices with one row per fragment,
+            or (X_enc, y_enc, train_idx, test_idx) if return_indices is True. The encoding dictionary is added at the
+            end if return_encoding is True.
     """
 
     # encode data and labels
-    fragments = sampling2.read_fragments(output_dir, pattern)
-    X_enc, y = encoding2.encode_fragment_dataset(fragments, k)
+    encoded = load_encoded_fragments(output_dir, pattern, k, dtype, cache_dir, max_cache_size, timings,
+                                     return_encoding)
+    X_enc, y = encoded[:2]
     le = preprocessing.LabelEncoder()
     y_enc = le.fit_transform(y)
+    extra = ({'classes': le.classes_, 'categories': encoded[2]},) if return_encoding else ()
 
     print('Encoded fragments...')
     print(X_enc.shape)
 
-    # perform check so that randomly split training and test sets both contain all classes in the data
-    n_classes = len(np.unique(y_enc))
-    n_classes_train = 0
-    n_classes_test = 0
-    X_train, X_test, y_train, y_test = None, None, None, None
-    count = 0
-    while n_classes_train < n_classes or n_classes_test < n_classes:
-        if n_classes_train != 0:
-            print('Encoding failed')
-
-        # split data into test and training
-        X_train, X_test, y_train, y_test = train_test_split(X_enc, y_enc, test_size=0.33, random_state=seed)
-        n_classes_train = len(np.unique(y_train))
-        n_classes_test = len(np.unique(y_test))
-        count += 1
-
-        if count > 1000:
-            # there must be an issue and we are stuck in an infinite loop
-            msg = 'Not possible for both training and test sets to contain all classes.'
-            msg2 = ' (n_classes, training set length, test set length):'
-            raise ValueError(msg + msg2 + str(n_classes), len(y_train), len(y_test))
+    # split so that training and test sets both contain all classes in the data
+    with timed_stage(timings, 'splitting'):
+        if record_groups is None:
+            train_idx, test_idx = stratified_split_indices(y_enc, test_size, seed)
+        else:
+            records = sampling2.read_fragment_records(output_dir, pattern)
+            if len(records) != len(y_enc):
+                raise ValueError('Fragment files do not match the encoded fragments:', output_dir)
+            groups = np.asarray(record_groups)[records]
+            train_idx, test_idx = group_split_indices(y_enc, groups, test_size, seed)
+
+        if return_indices:
+            print('Encoding succeeded.')
+            return (X_enc, y_enc, train_idx, test_idx) + extra
+
+        X_train, X_test = X_enc[train_idx], X_enc[test_idx]
+        y_train, y_test = y_enc[train_idx], y_enc[test_idx]
 
     print('Encoding succeeded.')
-    return X_train, X_test, y_train, y_test
+    return (X_train, X_test, y_train, y_test) + extra
+
+
+# tested
+def stratified_split_indices(y, test_size=0.33, seed=None):
+    """
+    Splits rows into training and test sets in a single pass, so that both sets contain every class. Each class
+    contributes round(test_size * n) of its n rows to the test set, limited to between 1 and n - 1 rows, so class
+    proportions are the same in both sets.
+
+    Rows are shuffled once, grouped by class with a stable sort, and the first rows of each group are assigned to the
+    test set, which gives a uniformly random split within each class.
+
+    :param y: L x 1 array, class of each row
+    :param test_size: float, fraction of each class to place in the test set. Default is 0.33.
+    :param seed: Random seed, for reproducibility
+    :return: (array, array) Tuple representing (sorted training row indices, sorted test row indices)
+    """
+    y = np.asarray(y).reshape(-1)
+    classes, y_idx, class_counts = np.unique(y, return_inverse=True, return_counts=True)
+
+    if np.any(class_counts < 2):
+        msg = 'Not possible for both training and test sets to contain all classes.'
+        msg2 = ' Classes with fewer than two rows:'
+        raise ValueError(msg + msg2, classes[class_counts < 2])
+
+    n_test = np.clip(np.round(class_counts * test_size).astype(np.int64), 1, class_counts - 1)
+    rank = _rank_within_class(y_idx, len(classes), seed)
+
+    is_test = rank < n_test[y_idx]
+    return np.flatnonzero(~is_test), np.flatnonzero(is_test)
+
+
+def _rank_within_class(y_idx, n_classes, seed=None):
+    """
+    Numbers the rows of each class 0, 1, ... in a random order, in a single pass. Rows are shuffled once and grouped by
+    class with a stable sort, so the first m rows of each class are a uniformly random sample of the class. For a given
+    seed, the rows ranked below m are contained in the rows ranked below any larger m.
+
+    :param y_idx: L x 1 array, class index of each row (i.e. from np.unique(y, return_inverse=True))
+    :param n_classes: int, number of classes
+    :param seed: Random seed, for reproducibility
+    :return: L x 1 array, rank of each row within its class
+    """
+    y_idx = np.asarray(y_idx).reshape(-1)
+    class_counts = np.bincount(y_idx, minlength=n_classes)
+
+    # shuffle, then group rows by class keeping the shuffled order
+    permutation = np.random.RandomState(seed).permutation(len(y_idx))
+    grouped = permutation[np.argsort(y_idx[permutation], kind='stable')]
+
+    # position of each grouped row within its class
+    class_starts = np.concatenate(([0], np.cumsum(class_counts)[:-1]))
+    rank = np.empty(len(y_idx), dtype=np.int64)
+    rank[grouped] = np.arange(len(y_idx)) - class_starts[y_idx[grouped]]
+    return rank
+
+
+def _get_group_classes(y, groups):
+    """
+    Determines the class of each group of rows, and which groups belong to classes with at least two groups (and can
+    therefore be placed in either set).
+
+    :param y: L x 1 array, class of each row
+    :param groups: L x 1 array, group of each row. All rows of a group must have the same class.
+    :return: (array, array, array) Tuple representing (group index of each row, class of each group, indices of groups
+            whose class has at least two groups)
+    """
+    y = np.asarray(y).reshape(-1)
+    group_ids, row_group = np.unique(np.asarray(groups).reshape(-1), return_inverse=True)
+
+    group_class = np.empty(len(group_ids), dtype=y.dtype)
+    group_class[row_group] = y
+    if np.any(group_class[row_group] != y):
+        raise ValueError('Rows of a group must all have the same class.')
+
+    classes, class_idx, class_counts = np.unique(group_class, return_inverse=True, return_counts=True)
+    if np.any(class_counts < 2):
+        print('Classes with a single group are only used for training:', classes[class_counts < 2])
+
+    return row_group, group_class, np.flatnonzero(class_counts[class_idx] >= 2)
+
+
+# tested
+def group_split_indices(y, groups, test_size=0.33, seed=None):
+    """
+    Splits rows into training and test sets so that all rows of a group are in the same set (i.e. all fragments of a
+    sequence), which prevents a model from being scored on fragments overlapping the fragments it was trained on.
+    Groups are split with stratified_split_indices(), using the class of each group, so each class contributes
+    round(test_size * n) of its n groups to the test set. Classes with a single group cannot be split and are placed in
+    the training set. Raises ValueError if no class has more than one group, since the test set would be empty.
+
+    :param y: L x 1 array, class of each row
+    :param groups: L x 1 array, group of each row. All rows of a group must have the same class.
+    :param test_size: float, fraction of the groups of each class to place in the test set. Default is 0.33.
+    :param seed: Random seed, for reproducibility
+    :return: (array, array) Tuple representing (sorted training row indices, sorted test row indices)
+    """
+    row_group, group_class, splittable = _get_group_classes(y, groups)
+    if len(splittable) == 0:
+        raise ValueError('Not possible to split by group: every class has a single group.')
+
+    is_test_group = np.zeros(len(group_class), dtype=bool)
+    _, test_groups = stratified_split_indices(group_class[splittable], test_size, seed)
+    is_test_group[splittable[test_groups]] = True
+
+    is_test = is_test_group[row_group]
+    return np.flatnonzero(~is_test), np.flatnonzero(is_test)
+
+
+# tested
+def get_record_groups(seq_file, split, meta_file=None):
+    """
+    Assigns each sequence in the .fasta file to a group for splitting fragments into training and test sets:
+    - 'sequence': each sequence is its own group, so no sequence has fragments in both sets
+    - 'strain': sequences are grouped by strain (taxid.strain column of the metadata file, matched by genome.id), so
+        no strain has fragments in both sets
+
+    :param seq_file: Path to file containing sequence data in .fasta format.
+    :param split: str, 'sequence' or 'strain'
+    :param meta_file: Path to tab-separated metadata file (i.e. train_small-db.meta). Required for 'strain'.
+    :return: m x 1 array, group of each sequence
+    """
+    ids = sampling2.read_sequence_ids(seq_file)
+
+    if split == 'sequence':
+        return np.arange(len(ids))
+
+    elif split == 'strain':
+        if meta_file is None:
+            raise ValueError('Metadata file is required to split by strain.')
+
+        meta = pd.read_csv(meta_file, sep='\t', dtype=str)
+        strains = dict(zip(meta['genome.id'], meta['taxid.strain']))
+        missing = [each for each in ids if each not in strains]
+        if missing:
+            raise ValueError('Sequences missing from metadata file:', missing)
+        return np.array([strains[each] for each in ids])
+
+    else:
+        raise ValueError('Split must be one of:', SPLITS)
+
+
+def _assign_folds(y, n_folds, seed=None):
+    """
+    Assigns each row to a fold so that every class is spread evenly across folds. Rows are shuffled once, grouped by
+    class with a stable sort, and dealt to the folds in turn, so the number of rows of a class in any two folds differs
+    by at most one.
+
+    :param y: L x 1 array, class of each row
+    :param n_folds: int, number of folds
+    :param seed: Random seed, for reproducibility
+    :return: L x 1 array, fold of each row
+    """
+    y = np.asarray(y).reshape(-1)
+    _, y_idx = np.unique(y, return_inverse=True)
+
+    permutation = np.random.RandomState(seed).permutation(len(y))
+    grouped = permutation[np.argsort(y_idx[permutation], kind='stable')]
+
+    folds = np.empty(len(y), dtype=np.int64)
+    folds[grouped] = np.arange(len(y)) % n_folds
+    return folds
+
+
+# tested
+def stratified_kfold_indices(y, n_folds=5, seed=None, groups=None):
+    """
+    Splits rows into stratified folds for cross-validation. Each fold is used once as the test set, with the remaining
+    folds as the training set. Folds are assigned in a single pass (see _assign_folds()).
+
+    If groups are given, whole groups are assigned to folds (i.e. all fragments of a sequence), stratified by the
+    class of each group. Classes with a single group are only used for training. Raises ValueError if there are fewer
+    rows (or groups of classes with more than one group) than folds, since some test sets would be empty.
+
+    :param y: L x 1 array, class of each row
+    :param n_folds: int, number of folds. Default is 5.
+    :param seed: Random seed, for reproducibility
+    :param groups: L x 1 array, group of each row. Default is None, in which case rows are assigned individually.
+    :return: List of (array, array) Tuples representing (sorted training row indices, sorted test row indices) for
+            each fold
+    """
+    if n_folds < 2:
+        raise ValueError('Number of folds must be at least 2:', n_folds)
+
+    if groups is None:
+        classes, class_counts = np.unique(y, return_counts=True)
+        if np.any(class_counts < 2):
+            msg = 'Not possible for every training set to contain all classes.'
+            msg2 = ' Classes with fewer than two rows:'
+            raise ValueError(msg + msg2, classes[class_counts < 2])
+        if len(y) < n_folds:
+            raise ValueError('Not possible for every test set to contain a row. Number of rows:', len(y))
+        folds = _assign_folds(y, n_folds, seed)
+    else:
+        row_group, group_class, splittable = _get_group_classes(y, groups)
+        if len(splittable) == 0:
+            raise ValueError('Not possible to split by group: every class has a single group.')
+        if len(splittable) < n_folds:
+            msg = 'Not possible for every test set to contain a group.'
+            msg2 = ' Number of groups in classes with more than one group:'
+            raise ValueError(msg + msg2, len(splittable))
+        group_folds = np.full(len(group_class), -1, dtype=np.int64)  # -1 is never in a test set
+        group_folds[splittable] = _assign_folds(group_class[splittable], n_folds, seed)
+        folds = group_folds[row_group]
+
+    return [(np.flatnonzero(folds != fold), np.flatnonzero(folds == fold)) for fold in range(n_folds)]
 
 
 def calc_number_combinations(*args):
@@ -134,21 +713,680 @@ def parameter_generator(list_sample_length, list_coverage, list_k):
                 yield L, c, k
 
 
+def _combination_key(sample_length, coverage, trial, k, params, fold=None):
+    """
+    Builds the ledger key of a single combination. Sample lengths and coverages may be repeated in a grid
+    (i.e. [100, 200, 400] * 5) to run several trials, so the key includes the trial number of the
+    (sample length, coverage) combination. Cross-validated combinations have one key per fold.
+
+    :return: str
+    """
+    key = [sample_length, coverage, trial, k, list(params)]
+    if fold is not None:
+        key.append(fold)
+    return json.dumps(key, default=str)
+
+
+def _format_row(row):
+    """
+    Formats a row as a single line of csv text, the same as append_results_to_file() would write it.
+
+    :param row: List, row of data
+    :return: str
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(row)
+    return buffer.getvalue()
+
+
+def _append_durably(filename, text):
+    """
+    Appends text to a file with a single write, and waits until the data is on disk.
+
+    :param filename: path to the file
+    :param text: str, text to append
+    :return: None
+    """
+    with open(filename, 'a', newline='') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _truncate_partial_line(filename):
+    """
+    Removes a partially written last line (i.e. from a run which was killed while writing) from a file.
+
+    :param filename: path to the file
+    :return: str, contents of the file after truncation
+    """
+    with open(filename, newline='') as f:
+        contents = f.read()
+
+    if contents and not contents.endswith('\n'):
+        contents = contents[:contents.rfind('\n') + 1]
+        with open(filename, 'w', newline='') as f:
+            f.write(contents)
+
+    return contents
+
+
+# tested
+def read_ledger(grid_search_file):
+    """
+    Reads the ledger of completed combinations for a grid search results file. The ledger is written next to the
+    results file, with LEDGER_SUFFIX appended to its name, and contains one json line for each completed combination.
+
+    Each combination is recorded in the ledger before its row is appended to the results file. Rows of ledger entries
+    which are missing from the results file (i.e. a previous run was killed between the two writes, or the results
+    file was deleted) are appended to the results file here, in ledger order, so that the results file again matches
+    the ledger. Partially written lines are removed from both files.
+
+    :param grid_search_file: Path to the results file
+    :return: dictionary mapping the key of each completed combination to its results row (as csv text)
+    """
+    ledger_file = grid_search_file + LEDGER_SUFFIX
+    if not os.path.exists(ledger_file):
+        return {}
+
+    completed = {}
+    for line in _truncate_partial_line(ledger_file).splitlines():
+        entry = json.loads(line)
+        completed[entry['key']] = entry['row']
+
+    # restore rows which were not written to the results file
+    contents = _truncate_partial_line(grid_search_file) if os.path.exists(grid_search_file) else ''
+    written = Counter(contents.splitlines(keepends=True))
+    missing = []
+    for row in completed.values():
+        if written[row] > 0:
+            written[row] -= 1
+        else:
+            missing.append(row)
+    if missing:
+        _append_durably(grid_search_file, ''.join(missing))
+
+    return completed
+
+
+def _record_result(grid_search_file, key, row):
+    """
+    Records a completed combination in the ledger, then appends its row to the results file. Both writes are flushed to
+    disk, so that a combination is only skipped on restart if its row is in the ledger.
+
+    :param grid_search_file: Path to the results file
+    :param key: str, ledger key of the combination
+    :param row: List, results row
+    :return: None
+    """
+    line = _format_row(row)
+    _append_durably(grid_search_file + LEDGER_SUFFIX, json.dumps({'key': key, 'row': line}) + '\n')
+    _append_durably(grid_search_file, line)
+
+
+def _score_combination(score_func, X_train, X_test, y_train, y_test, params, timings=None, model=None):
+    """
+    Trains and scores a model for a single hyperparameter combination.
+
+    :param score_func: function which trains a model and returns its score. Called as
+            score_func(X_train, X_test, y_train, y_test, *params, timings=timings), with model=model added if a model
+            is given.
+    :param X_train: training data
+    :param X_test: test data
+    :param y_train: training labels
+    :param y_test: test labels
+    :param params: tuple, hyperparameter combination
+    :param timings: dictionary of timings recorded so far for this combination. Default is None.
+    :param model: model to be trained by score_func (see run_grid_search()). Default is None.
+    :return: (score, dictionary) Tuple representing (score, timings including fitting and predicting)
+    """
+    timings = dict(timings or {})
+    if model is None:
+        score = score_func(X_train, X_test, y_train, y_test, *params, timings=timings)
+    else:
+        score = score_func(X_train, X_test, y_train, y_test, *params, model=model, timings=timings)
+    return score, timings
+
+
+def _build_row(row_prefix, row_suffix, training_shape, sample_length, coverage, k, params, score, timings=None):
+    """
+    Builds the results row for a single combination in the column order used by all grid search files:
+    row_prefix, training shape, sample length, coverage, k, hyperparameters, score, row_suffix, and the timing columns
+    (see timing_fields()) if timings are given. Stages which did not run (i.e. sampling for cached fragments) are left
+    empty.
+
+    :return: List
+    """
+    row = list(row_prefix) + [training_shape, sample_length, coverage, k] + list(params) + [score] + list(row_suffix)
+    if timings is not None:
+        row += [timings.get(field, '') for field in timing_fields()]
+    return row
+
+
+def _encode_to_dir(fragment_dir, pattern, k, seed, dtype, cache_dir, max_cache_size, encoding_dir, record_groups=None,
+                   timings=None):
+    """
+    Encodes and splits fragments (see encode_fragments()), then saves the training and test sets to a directory, so
+    that fit jobs in other processes can load them once rather than receiving them with every fit.
+
+    :param encoding_dir: Path to the directory where the training and test sets are saved
+    :return: Tuple, shape of the training data
+    """
+    X_train, X_test, y_train, y_test = encode_fragments(fragment_dir, pattern, k, seed, dtype, cache_dir,
+                                                        max_cache_size, timings, record_groups=record_groups)
+    os.makedirs(encoding_dir, exist_ok=True)
+    save_npz(os.path.join(encoding_dir, 'X_train.npz'), X_train.tocsr(), compressed=False)
+    save_npz(os.path.join(encoding_dir, 'X_test.npz'), X_test.tocsr(), compressed=False)
+    np.save(os.path.join(encoding_dir, 'y_train.npy'), y_train)
+    np.save(os.path.join(encoding_dir, 'y_test.npy'), y_test)
+    return X_train.shape
+
+
+def _score_saved_encoding(score_func, encoding_dir, params, timings=None):
+    """
+    Trains and scores a model on training and test sets saved by _encode_to_dir(). The sets are loaded once and kept
+    for the following fits in this process, since fits of the same encoding are scheduled together.
+
+    :return: (score, dictionary) Tuple representing (score, timings including fitting and predicting)
+    """
+    if _FIT_DATA.get('dir') != encoding_dir:
+        _FIT_DATA.clear()
+        _FIT_DATA['data'] = (load_npz(os.path.join(encoding_dir, 'X_train.npz')).tocsr(),
+                             load_npz(os.path.join(encoding_dir, 'X_test.npz')).tocsr(),
+                             np.load(os.path.join(encoding_dir, 'y_train.npy')),
+                             np.load(os.path.join(encoding_dir, 'y_test.npy')))
+        _FIT_DATA['dir'] = encoding_dir
+
+    X_train, X_test, y_train, y_test = _FIT_DATA['data']
+    return _score_combination(score_func, X_train, X_test, y_train, y_test, params, timings)
+
+
+def _set_cv_data(X_enc, y_enc, trace_memory=False):
+    """
+    Stores the encoded data used by cross-validation fits. Used as the initializer of worker processes, so the data is
+    sent to each worker once rather than once per fit.
+
+    :param X_enc: sparse matrix, encoded fragments
+    :param y_enc: L x 1 array, encoded taxids
+    :param trace_memory: boolean, if True, starts tracing memory allocations in the worker (see memory_tracing()).
+            Default is False.
+    :return: None
+    """
+    _CV_DATA['X'] = X_enc
+    _CV_DATA['y'] = y_enc
+    if trace_memory:
+        _start_memory_tracing()
+
+
+def _score_fold(score_func, train_idx, test_idx, params, timings=None):
+    """
+    Trains and scores a model on a single fold of the data stored by _set_cv_data().
+
+    :return: (score, dictionary) Tuple representing (score, timings including splitting, fitting and predicting)
+    """
+    timings = dict(timings or {})
+    with timed_stage(timings, 'splitting'):
+        X_enc, y_enc = _CV_DATA['X'], _CV_DATA['y']
+        X_train, X_test = X_enc[train_idx], X_enc[test_idx]
+        y_train, y_test = y_enc[train_idx], y_enc[test_idx]
+
+    return _score_combination(score_func, X_train, X_test, y_train, y_test, params, timings)
+
+
+# tested
+def cross_validate(output_dir, pattern, k, score_func, hyperparameters, n_folds=5, seed=None, dtype=np.float64,
+                   cache_dir=None, max_cache_size=None, n_jobs=1, record_groups=None, timings=None, completed=None):
+    """
+    Runs k-fold cross-validation of every hyperparameter combination on a single fragment set. Fragments are read and
+    encoded once and split into stratified folds (see stratified_kfold_indices()), so each fold only costs a fit.
+    With n_jobs > 1, fits run in a pool of processes which each receive the encoded matrix once, when the process
+    starts, and afterwards only receive the row indices of their fold. Worker processes trace memory if this process
+    is tracing memory (see memory_tracing()).
+
+    Results are yielded as fits finish, so they can be recorded before the remaining fits are done.
+
+    :param output_dir: Path where fragments were written.
+    :param pattern: str, bash-like pattern defining types of files to read from the output directory.
+    :param k: int, size of k-mer to subdivide fragments into
+    :param score_func: function which trains a model and returns its score (see run_grid_search()).
+    :param hyperparameters: List of tuples, hyperparameter combinations to be tested. Use [()] for models without
+            hyperparameters.
+    :param n_folds: int, number of folds. Default is 5.
+    :param seed: Random seed, for reproducibility
+    :param dtype: type of the values stored in the encoded matrix. Default is np.float64.
+    :param cache_dir: Path to directory where encoded fragment sets are cached and reused
+            (see load_encoded_fragments()). Default is None.
+    :param max_cache_size: int, maximum total size of the cache in bytes. Default is None.
+    :param n_jobs: int, number of processes to use. Default is 1.
+    :param record_groups: m x 1 array, group of each sequence in the .fasta file (see get_record_groups()), to keep
+            all fragments of a group in the same fold. Default is None.
+    :param timings: dictionary of timings recorded so far (i.e. sampling). Default is None.
+    :param completed: collection of (hyperparameters, fold) Tuples which are already complete (i.e. from a previous
+            run) and are not fit again. Default is None.
+    :return: generator of (hyperparameters, fold, training shape, score, timings) Tuples
+    """
+    hyperparameters = list(hyperparameters)
+    timings = dict(timings or {})
+
+    # encode data and labels once for all folds
+    X_enc, y = load_encoded_fragments(output_dir, pattern, k, dtype, cache_dir, max_cache_size, timings)
+    y_enc = preprocessing.LabelEncoder().fit_transform(y)
+
+    with timed_stage(timings, 'splitting'):
+        groups = None
+        if record_groups is not None:
+            records = sampling2.read_fragment_records(output_dir, pattern)
+            if len(records) != len(y_enc):
+                raise ValueError('Fragment files do not match the encoded fragments:', output_dir)
+            groups = np.asarray(record_groups)[records]
+        folds = stratified_kfold_indices(y_enc, n_folds, seed, groups)
+
+    completed = set() if completed is None else {(tuple(params), fold) for params, fold in completed}
+    tasks = [(params, fold) for params in hyperparameters for fold in range(n_folds)
+             if (tuple(params), fold) not in completed]
+
+    if n_jobs == 1:
+        _set_cv_data(X_enc, y_enc)
+        try:
+            for params, fold in tasks:
+                train_idx, test_idx = folds[fold]
+                score, fold_timings = _score_fold(score_func, train_idx, test_idx, params, timings)
+                yield params, fold, (len(train_idx), X_enc.shape[1]), score, fold_timings
+        finally:
+            _CV_DATA.clear()
+        return
+
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_set_cv_data,
+                             initargs=(X_enc, y_enc, tracemalloc.is_tracing())) as executor:
+        pending = {}
+        for params, fold in tasks:
+            train_idx, test_idx = folds[fold]
+            future = executor.submit(_score_fold, score_func, train_idx, test_idx, params, timings)
+            pending[future] = (params, fold, (len(train_idx), X_enc.shape[1]))
+
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    params, fold, training_shape = pending.pop(future)
+                    score, fold_timings = future.result()
+                    yield params, fold, training_shape, score, fold_timings
+        except BaseException:
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+
+def _plan_grid_search(list_sample_length, list_coverage, list_k, hyperparameters, completed, n_folds=None):
+    """
+    Lists the combinations of a grid search which have not been completed, grouped by the data they depend on.
+    A cross-validated combination is complete once all of its folds are complete.
+
+    :param list_sample_length: List, sample lengths to be tested
+    :param list_coverage: List, coverages to be tested
+    :param list_k: List, k-mers to be tested
+    :param hyperparameters: List of tuples, hyperparameter combinations to be tested
+    :param completed: dictionary (or set) containing the keys of completed combinations
+    :param n_folds: int, number of cross-validation folds. Default is None, in which case combinations are not
+            cross-validated.
+    :return: List of (sample length, coverage, trial, List of (k, List of hyperparameter combinations)) tuples
+    """
+    plan = []
+    n_trials = {}
+    for sample_length, coverage in ((L, c) for L in list_sample_length for c in list_coverage):
+        trial = n_trials.get((sample_length, coverage), 0)
+        n_trials[(sample_length, coverage)] = trial + 1
+
+        encodings = []
+        for k in list_k:
+            folds = [None] if n_folds is None else range(n_folds)
+            remaining = [params for params in hyperparameters
+                         if any(_combination_key(sample_length, coverage, trial, k, params, fold) not in completed
+                                for fold in folds)]
+            if remaining:
+                encodings.append((k, remaining))
+
+        if encodings:
+            plan.append((sample_length, coverage, trial, encodings))
+
+    return plan
+
+
+# tested
+def run_grid_search(seq_file,
+                    taxid_file,
+                    output_dir,
+                    pattern,
+                    list_sample_length,
+                    list_coverage,
+                    list_k,
+                    hyperparameters,
+                    score_func,
+                    seed,
+                    grid_search_file,
+                    fields,
+                    row_prefix,
+                    row_suffix,
+                    n_jobs=1,
+                    dtype=np.float64,
+                    cache_dir=None,
+                    max_cache_size=None,
+                    split='fragment',
+                    meta_file=None,
+                    n_folds=None,
+                    model_factory=None,
+                    result_hook=None,
+                    trace_memory=False):
+    """
+    Runs a grid search over every (sample length, coverage, k) combination and every hyperparameter combination,
+    appending one results row per combination to the grid search file.
+
+    With n_jobs=1, or if model_factory or result_hook is given, combinations are processed serially in order in this
+    process. Otherwise, jobs are scheduled onto a pool of
+    processes as soon as the data they depend on is ready: a fragment job for each (sample length, coverage), an
+    encoding job for each k once its fragments are built, and a fit job for each hyperparameter combination once its
+    encoding is ready. Rows are appended as fits finish, so the order of rows is not fixed. Fragments which are not
+    cached are written to a numbered subdirectory of output_dir for each fragment job and deleted once encoded.
+    Training and test sets are saved by the encoding job to another subdirectory, which fit jobs load once per process
+    instead of receiving the data with every fit, and deleted once all of their fits are done.
+
+    Completed combinations are recorded in a ledger next to the results file (see read_ledger()). If the grid search is
+    run again with the same results file (i.e. after the process was killed), completed combinations are skipped, and
+    fragments and encodings are only built for the remaining combinations. Results files should therefore be named
+    after the experiment rather than the time the grid search started, so that running an experiment again resumes it.
+
+    If n_folds is given, each combination is cross-validated instead of scored on a single split, and one row is
+    written for each fold. Each fragment set is encoded once for all of its folds and hyperparameter combinations
+    (see cross_validate()), and n_jobs processes are used for the fits of each encoding.
+
+    :param seq_file: Path to file containing sequence data in .fasta format.
+    :param taxid_file: Path to file containing matching species for all sequences.
+    :param output_dir: Path where fragments should be written.
+    :param pattern: str, bash-like pattern defining types of files to read from the fragment directory.
+    :param list_sample_length: List, sample lengths to be tested
+    :param list_coverage: List, coverages to be tested
+    :param list_k: List, k-mers to be tested
+    :param hyperparameters: List of tuples, hyperparameter combinations to be tested (i.e. from a hyperparameter
+            generator). Use [()] for models without hyperparameters.
+    :param score_func: function which trains a model and returns its score. Called as
+            score_func(X_train, X_test, y_train, y_test, *params, timings=timings), and expected to record its
+            'fitting' and 'predicting' stages in timings (see timed_stage()). Must be defined at module level (or be a
+            functools.partial of such a function) so it can be sent to other processes.
+    :param seed: Random seed, for reproducibility
+    :param grid_search_file: Path to the results file
+    :param fields: List, header row for the results file. The timing columns (see timing_fields()) are added at the
+            end. Not written if the results file already has contents.
+    :param row_prefix: List, values written before the training shape in each row (i.e. [experiment, classifier])
+    :param row_suffix: List, values written after the score in each row (i.e. [score_type])
+    :param n_jobs: int, number of processes to use. Default is 1.
+    :param dtype: type of the values stored in the encoded matrix. Default is np.float64.
+    :param cache_dir: Path to directory where fragment sets and encodings are cached (see build_fragments() and
+            encode_fragments()). The cache size limit should be larger than the data in use by running jobs.
+            Default is None.
+    :param max_cache_size: int, maximum total size of the cache in bytes. Default is None.
+    :param split: str, how fragments are split into training and test sets. 'fragment' splits fragments individually;
+            'sequence' and 'strain' keep all fragments of a sequence or strain in the same set (see
+            get_record_groups()). Default is 'fragment'.
+    :param meta_file: Path to metadata file, required if split is 'strain'. Default is None.
+    :param n_folds: int, number of cross-validation folds. Default is None, in which case each combination is scored
+            on a single training and test split.
+    :param model_factory: function called as model_factory(sample_length, coverage, k) before the hyperparameter
+            combinations of each encoding are scored. The model it returns is passed to score_func as its model
+            keyword argument for each of those combinations (i.e. a model with warm starts, so each fit starts from
+            the weights of the previous fit). Not supported with n_folds. Default is None.
+    :param result_hook: function called after the row of each combination is recorded, as result_hook(result), where
+            result is a dictionary with keys 'sample_length', 'coverage', 'trial', 'k', 'params', 'training_shape',
+            'score', 'model' (the model from model_factory, or None), and 'classes' and 'categories' (describing the
+            encoding, see encode_fragments()). Not supported with n_folds. Default is None.
+    :param trace_memory: boolean, if True, the peak memory of each stage is recorded (see memory_tracing()). Tracing
+            makes the grid search several times slower and inflates the recorded times. Default is False, in which
+            case only wall times are recorded.
+    :return: None
+    """
+    hyperparameters = list(hyperparameters)
+    if n_folds is not None and (model_factory is not None or result_hook is not None):
+        raise ValueError('model_factory and result_hook are not supported with cross-validation.')
+
+    with memory_tracing(trace_memory):
+        _run_grid_search(seq_file, taxid_file, output_dir, pattern, list_sample_length, list_coverage, list_k,
+                         hyperparameters, score_func, seed, grid_search_file, fields, row_prefix, row_suffix, n_jobs,
+                         dtype, cache_dir, max_cache_size, split, meta_file, n_folds, model_factory, result_hook)
+
+
+def _run_grid_search(seq_file, taxid_file, output_dir, pattern, list_sample_length, list_coverage, list_k,
+                     hyperparameters, score_func, seed, grid_search_file, fields, row_prefix, row_suffix, n_jobs, dtype,
+                     cache_dir, max_cache_size, split, meta_file, n_folds, model_factory, result_hook):
+    """
+    Runs the grid search for run_grid_search(), once the arguments are checked and memory tracing is set up.
+
+    :return: None
+    """
+    record_groups = None if split == 'fragment' else get_record_groups(seq_file, split, meta_file)
+
+    # set up grid search results file, writing the header before any rows are restored from the ledger
+    if not os.path.exists(grid_search_file) or os.path.getsize(grid_search_file) == 0:
+        append_results_to_file(grid_search_file, fields=list(fields) + timing_fields())
+    completed = read_ledger(grid_search_file)
+
+    # calculate number of combinations
+    n_combinations = calc_number_combinations(list_sample_length, list_coverage, list_k, hyperparameters)
+    plan = _plan_grid_search(list_sample_length, list_coverage, list_k, hyperparameters, completed, n_folds)
+    count = n_combinations - sum(len(remaining) for _, _, _, encodings in plan for _, remaining in encodings)
+    if count:
+        print('Skipping {} completed combinations.'.format(count))
+
+    if n_folds is not None:
+        n_combinations *= n_folds
+        count *= n_folds
+        for sample_length, coverage, trial, encodings in plan:
+            fragment_timings = {}
+            fragment_dir = build_fragments(seq_file, taxid_file, output_dir, sample_length, coverage, seed,
+                                           cache_dir, max_cache_size, fragment_timings)
+
+            for k, remaining in encodings:
+                print(sample_length, coverage, k)
+
+                # folds finished before the grid search was interrupted are not fit again
+                completed_folds = [(params, fold) for params in remaining for fold in range(n_folds)
+                                   if _combination_key(sample_length, coverage, trial, k, params, fold) in completed]
+                count += len(completed_folds)
+
+                results = cross_validate(fragment_dir, pattern, k, score_func, remaining, n_folds, seed, dtype,
+                                         cache_dir, max_cache_size, n_jobs, record_groups, fragment_timings,
+                                         completed_folds)
+                for params, fold, training_shape, score, timings in results:
+                    count += 1
+                    key = _combination_key(sample_length, coverage, trial, k, params, fold)
+                    row = _build_row(row_prefix, row_suffix, training_shape, sample_length, coverage, k, params, score,
+                                     timings)
+                    _record_result(grid_search_file, key, row)
+                    print('Percent complete: {}'.format(count / n_combinations * 100))  # display progress
+        return
+
+    if n_jobs == 1 or model_factory is not None or result_hook is not None:
+        for sample_length, coverage, trial, encodings in plan:
+            # fragment combination
+            fragment_timings = {}
+            fragment_dir = build_fragments(seq_file, taxid_file, output_dir, sample_length, coverage, seed,
+                                           cache_dir, max_cache_size, fragment_timings)
+
+            for k, remaining in encodings:
+                print(sample_length, coverage, k)
+
+                # kmer from fragments
+                encoding_timings = dict(fragment_timings)
+                encoded = encode_fragments(fragment_dir, pattern, k, seed, dtype, cache_dir, max_cache_size,
+                                           encoding_timings, record_groups=record_groups,
+                                           return_encoding=result_hook is not None)
+                X_train, X_test, y_train, y_test = encoded[:4]
+                encoding = encoded[4] if result_hook is not None else None
+
+                # model shared by the hyperparameter combinations of this encoding
+                model = None if model_factory is None else model_factory(sample_length, coverage, k)
+
+                # hyperparameter combinations
+                for params in remaining:
+                    print(*params)
+                    score, timings = _score_combination(score_func, X_train, X_test, y_train, y_test, params,
+                                                        encoding_timings, model)
+                    count += 1
+
+                    row = _build_row(row_prefix, row_suffix, X_train.shape, sample_length, coverage, k, params, score,
+                                     timings)
+                    _record_result(grid_search_file, _combination_key(sample_length, coverage, trial, k, params), row)
+
+                    if result_hook is not None:
+                        result_hook({'sample_length': sample_length, 'coverage': coverage, 'trial': trial, 'k': k,
+                                     'params': params, 'training_shape': X_train.shape, 'score': score,
+                                     'model': model, 'classes': encoding['classes'],
+                                     'categories': encoding['categories']})
+
+                print('Percent complete: {}'.format(count / n_combinations * 100))  # display progress
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    initializer = _start_memory_tracing if tracemalloc.is_tracing() else None
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=initializer) as executor:
+        pending = {}  # future -> (job type, job details)
+        n_encodings_left = {}  # fragment job -> number of encoding jobs not yet finished
+        n_fits_left = {}  # encoding directory -> number of fit jobs not yet finished
+
+        # fragment jobs do not depend on anything
+        for i, (sample_length, coverage, trial, encodings) in enumerate(plan):
+            job_dir = os.path.join(output_dir, str(i).zfill(5))
+            future = executor.submit(_run_with_timings, build_fragments, seq_file, taxid_file, job_dir, sample_length,
+                                     coverage, seed, cache_dir, max_cache_size)
+            pending[future] = ('fragments', (i, job_dir))
+
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_type, details = pending.pop(future)
+                    result, timings = future.result()
+
+                    if job_type == 'fragments':
+                        # encoding jobs depend on fragments
+                        i, job_dir = details
+                        sample_length, coverage, trial, encodings = plan[i]
+                        n_encodings_left[i] = len(encodings)
+                        for k, remaining in encodings:
+                            encoding_dir = '{}-k{}'.format(job_dir, k)
+                            encode_future = executor.submit(_run_with_timings, _encode_to_dir, result, pattern, k,
+                                                            seed, dtype, cache_dir, max_cache_size, encoding_dir,
+                                                            record_groups=record_groups)
+                            pending[encode_future] = ('encoding', (i, k, remaining, result, job_dir, encoding_dir,
+                                                                   timings))
+
+                    elif job_type == 'encoding':
+                        # fit jobs depend on the encoding
+                        i, k, remaining, fragment_dir, job_dir, encoding_dir, fragment_timings = details
+                        timings.update(fragment_timings)
+                        n_fits_left[encoding_dir] = len(remaining)
+                        for params in remaining:
+                            fit_future = executor.submit(_score_saved_encoding, score_func, encoding_dir, params,
+                                                         timings)
+                            pending[fit_future] = ('fit', (i, k, result, params, encoding_dir))
+
+                        # fragments which were not cached are no longer needed
+                        n_encodings_left[i] -= 1
+                        if n_encodings_left[i] == 0 and fragment_dir == job_dir:
+                            shutil.rmtree(job_dir, ignore_errors=True)
+
+                    else:
+                        i, k, training_shape, params, encoding_dir = details
+                        sample_length, coverage, trial, _ = plan[i]
+                        count += 1
+
+                        # saved training and test sets are no longer needed once all of their fits are done
+                        n_fits_left[encoding_dir] -= 1
+                        if n_fits_left[encoding_dir] == 0:
+                            shutil.rmtree(encoding_dir, ignore_errors=True)
+
+                        row = _build_row(row_prefix, row_suffix, training_shape, sample_length, coverage, k, params,
+                                         result, timings)
+                        _record_result(grid_search_file, _combination_key(sample_length, coverage, trial, k, params),
+                                       row)
+                        print('Percent complete: {}'.format(count / n_combinations * 100))  # display progress
+        except BaseException:
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+
 def calc_hyperparameter_relationship(filename, droplist, score_col):
     """
     Runs linear regression over hyperparameters to find the regression coefficients.
     This should give some indicator of how hyperparameters are affecting the score.
+    Timing columns (see timing_fields()) are outcomes rather than hyperparameters, so they are never used as features.
 
     :param filename: Path to file containing search results.
     :param droplist: All columns to drop from the dataset before performing linear regression.
                     (i.e. ['experiment', 'score', 'category', 'classifier'])
+    :param score_col: str, column to regress (i.e. 'score', or a timing column such as 'total_time')
     :return: coefficients for each of the remaining feature columns
     """
     # read in grid search results
-    df = pd.read_csv(filename)
-    X = df.drop(droplist, axis=1)
+    df = _read_results(filename)
+    X = df.drop(droplist + [col for col in _get_cost_columns(df) if col not in droplist], axis=1)
     y = df[score_col]
 
     lr = LinearRegression()
     lr.fit(X, y)
     return lr.coef_
+
+
+def _get_cost_columns(df):
+    """
+    Lists the timing columns (see timing_fields()) and total time column present in grid search results.
+
+    :param df: DataFrame of grid search results
+    :return: List
+    """
+    return [col for col in timing_fields() + [TOTAL_TIME] if col in df.columns]
+
+
+def _read_results(filename):
+    """
+    Reads grid search results, adding a total_time column with the sum of the stage times if the results contain
+    timing columns. Stages which did not run count as zero time.
+
+    :param filename: Path to file containing search results.
+    :return: DataFrame
+    """
+    df = pd.read_csv(filename)
+    time_cols = [stage + '_time' for stage in STAGES if stage + '_time' in df.columns]
+    if time_cols:
+        df[TOTAL_TIME] = df[time_cols].fillna(0).sum(axis=1)
+    return df
+
+
+def calc_cost_relationship(filename, droplist, cost_col=TOTAL_TIME):
+    """
+    Runs linear regression over hyperparameters to find how they affect the cost of a combination, in the same way
+    calc_hyperparameter_relationship() does for the score. Timing columns are never used as features.
+
+    :param filename: Path to file containing search results with timing columns.
+    :param droplist: All columns to drop from the dataset before performing linear regression.
+                    (i.e. ['experiment', 'score', 'category', 'classifier'])
+    :param cost_col: str, cost to regress (i.e. 'fitting_time' or 'fitting_peak_memory'). Default is the total time
+            over all stages.
+    :return: coefficients for each of the remaining feature columns
+    """
+    return calc_hyperparameter_relationship(filename, droplist, cost_col)
+
+
+def calc_cost_frontier(filename, score_col='score', cost_col=TOTAL_TIME):
+    """
+    Finds the combinations on the cost/score frontier: combinations for which no other combination has both a higher
+    score and a lower cost.
+
+    :param filename: Path to file containing search results with timing columns.
+    :param score_col: str, score column (higher is better). Default is 'score'.
+    :param cost_col: str, cost column (lower is better). Default is the total time over all stages.
+    :return: DataFrame of the frontier combinations, ordered by increasing cost
+    """
+    df = _read_results(filename).sort_values([cost_col, score_col], ascending=[True, False])
+
+    # a combination is on the frontier if it scores higher than every cheaper combination
+    best_so_far = df[score_col].cummax().shift(fill_value=-np.inf)
+    return df[df[score_col] > best_so_far]
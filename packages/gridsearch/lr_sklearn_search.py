@@ -1,10 +1,9 @@
-import datetime
+from functools import partial
 
 from sklearn.metrics import recall_score
 from sklearn.linear_model import LogisticRegression
 
-from packages.gridsearch.helper import append_results_to_file, build_fragments, encode_fragments, \
-    calc_number_combinations, parameter_generator
+from packages.gridsearch.helper import run_grid_search, timed_stage
 
 
 def hyperparameter_generator_lr(list_penalty, list_multiclass, list_classweight, list_solver):
@@ -23,7 +22,8 @@ def hyperparameter_generator_lr(list_penalty, list_multiclass, list_classweight,
                     yield penalty, multiclass, classweight, solver
 
 
-def run_lr_classification_recall(X_train, X_test, y_train, y_test, penalty, multiclass, classweight, solver, seed):
+def run_lr_classification_recall(X_train, X_test, y_train, y_test, penalty, multiclass, classweight, solver, seed,
+                                 timings=None):
     """
     Score is species level recall.
     Todo - add ability to Sets solver to 'saga' for l1 penalty. Uses default solver for l2 penalty. solver='saga'
@@ -37,6 +37,8 @@ def run_lr_classification_recall(X_train, X_test, y_train, y_test, penalty, mult
     :param classweight:
     :param solver:
     :param seed:
+    :param timings: dictionary where the time spent fitting and predicting is recorded (see helper.timed_stage()).
+            Default is None.
     :return:
     """
     lr = LogisticRegression(penalty=penalty,
@@ -44,8 +46,10 @@ def run_lr_classification_recall(X_train, X_test, y_train, y_test, penalty, mult
                             class_weight=classweight,
                             solver=solver,
                             random_state=seed)
-    lr.fit(X_train, y_train)
-    y_pred = lr.predict(X_test)
+    with timed_stage(timings, 'fitting'):
+        lr.fit(X_train, y_train)
+    with timed_stage(timings, 'predicting'):
+        y_pred = lr.predict(X_test)
     score = recall_score(y_test, y_pred, average='weighted')
     return score
 
@@ -65,7 +69,13 @@ def grid_search_multiclass_lr(seq_file,
                               grid_search_file,
                               fields,
                               experiment,
-                              score_type):
+                              score_type,
+                              cache_dir=None,
+                              max_cache_size=None,
+                              n_jobs=1,
+                              split='fragment',
+                              meta_file=None,
+                              n_folds=None):
     """
 
     :param seq_file:
@@ -84,56 +94,25 @@ def grid_search_multiclass_lr(seq_file,
     :param fields:
     :param experiment:
     :param score_type:
+    :param cache_dir: str, directory where fragment sets and their encodings are cached and reused across runs
+            (see helper.build_fragments and helper.encode_fragments). Default is None, in which case fragments are
+            generated in output_dir and encoded each time.
+    :param max_cache_size: int, maximum size of the fragment cache in bytes. Default is None.
+    :param n_jobs: int, number of processes used to build fragments, encode, and train models in parallel
+            (see helper.run_grid_search). Default is 1.
+    :param split: str, 'fragment', 'sequence', or 'strain'. How fragments are split into training and test sets
+            (see helper.run_grid_search). Default is 'fragment'.
+    :param meta_file: str, path to metadata file, required if split is 'strain'. Default is None.
+    :param n_folds: int, number of cross-validation folds, with one results row per fold (see helper.run_grid_search).
+            Default is None, in which case each combination is scored on a single split.
     :return:
     """
-    # set up grid search results file
-    append_results_to_file(grid_search_file, fields=fields)
-
-    # calculate number of combinations
-    n_combinations = calc_number_combinations(list_sample_length,
-                                              list_coverage,
-                                              list_k,
-                                              list_penalty,
-                                              list_multiclass,
-                                              list_classweight,
-                                              list_solver)
-
-    # process combinations
-    count = 0
-    sample_length_prev = -1
-    coverage_prev = -1
-
-    # parameter combinations
-    for sample_length, coverage, k in parameter_generator(list_sample_length, list_coverage, list_k):
-        print(sample_length, coverage, k)
-
-        if sample_length != sample_length_prev or coverage != coverage_prev:
-            # fragment combination
-            build_fragments(seq_file, taxid_file, output_dir, sample_length, coverage, seed)
-
-            # update previous values
-            sample_length_prev = sample_length
-            coverage_prev = coverage
-
-        # kmer from fragments
-        X_train, X_test, y_train, y_test = encode_fragments(output_dir, pattern, k, seed)
-
-        # hyperparameter combinations
-        for penalty, multiclass, classweight, solver in hyperparameter_generator_lr(list_penalty, list_multiclass,
-                                                                                    list_classweight, list_solver):
-            print(penalty, multiclass, classweight, solver)
-
-            # train and score model
-            score = run_lr_classification_recall(X_train, X_test, y_train, y_test, penalty, multiclass, classweight,
-                                                 solver, seed)
-            count += 1
-
-            # output results to file
-            row = [experiment, 'multiclass', 'Logistic Regression (sklearn)', X_train.shape, sample_length, coverage, k,
-                   penalty, multiclass, classweight, solver, score, score_type]
-            append_results_to_file(grid_search_file, rows=[row])
-
-        print('Percent complete: {}'.format(count / n_combinations * 100))  # display progress
+    hyperparameters = hyperparameter_generator_lr(list_penalty, list_multiclass, list_classweight, list_solver)
+    run_grid_search(seq_file, taxid_file, output_dir, pattern, list_sample_length, list_coverage, list_k,
+                    hyperparameters, partial(run_lr_classification_recall, seed=seed), seed, grid_search_file, fields,
+                    row_prefix=[experiment, 'multiclass', 'Logistic Regression (sklearn)'], row_suffix=[score_type],
+                    n_jobs=n_jobs, cache_dir=cache_dir, max_cache_size=max_cache_size, split=split, meta_file=meta_file,
+                    n_folds=n_folds)
 
 
 def main():
@@ -149,8 +128,6 @@ def main():
     pattern = 'fragments*.npy'
     seed = None
     data_dir = '/Users/ryanqnelson/GitHub/C-A-L-C-I-F-E-R/CMU-02620-Metagenomics/'
-    date_time = datetime.datetime.now().strftime('%Y.%m.%d.%H.%M.%S')
-    grid_search_file = data_dir + 'data/gridsearch-3000/results-3000-lrpackage-l2-ovr-liblinear-fivefold.{}.csv'.format(date_time)
     fields = ['experiment',
               'category',
               'classifier',
@@ -165,6 +142,8 @@ def main():
               'score',
               'score type']
     experiment = '17.06'
+    grid_search_file = data_dir + \
+        'data/gridsearch-3000/results-3000-lrpackage-l2-ovr-liblinear-fivefold.{}.csv'.format(experiment)
     score_type = 'species_recall'
 
     # combinations to try
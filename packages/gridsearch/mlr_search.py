@@ -1,30 +1,38 @@
-import datetime
+import os
+from functools import partial
+
+import numpy as np
 from sklearn.metrics import recall_score
 
-from packages.gridsearch.helper import append_results_to_file, build_fragments, encode_fragments, \
-    calc_number_combinations, parameter_generator
+from packages.gridsearch.helper import run_grid_search, timed_stage
 from packages.linear_model.MulticlassLogisticRegression import MulticlassLogisticRegression
+from packages.linear_model.serialization import save_model
 
 
-def hyperparameter_generator(list_eta, list_epsilon, list_penalty, list_l2_lambda, list_max_iter):
+def hyperparameter_generator(list_eta, list_epsilon, list_penalty, list_l2_lambda, list_max_iter, list_l1_lambda=(0,)):
     """
+    l1_lambda only applies to the 'l1' and 'elasticnet' penalties, so other penalties are combined with l1_lambda=0
+    once, rather than with each value of list_l1_lambda.
 
     :param list_eta:
     :param list_epsilon:
     :param list_penalty:
     :param list_l2_lambda:
     :param list_max_iter:
-    :return:
+    :param list_l1_lambda: List, l1 penalty values tried with the 'l1' and 'elasticnet' penalties. Default is (0,).
+    :return: Single (eta, epsilon, penalty, l2_lambda, max_iter, l1_lambda) combination each time generator is called.
     """
     for eta in list_eta:
         for e in list_epsilon:
             for penalty in list_penalty:
                 for l2 in list_l2_lambda:
                     for m in list_max_iter:
-                        yield eta, e, penalty, l2, m
+                        for l1 in (list_l1_lambda if penalty in ('l1', 'elasticnet') else [0]):
+                            yield eta, e, penalty, l2, m, l1
 
 
-def run_mlr_classification_recall(X_train, X_test, y_train, y_test, eta, epsilon, penalty, l2_lambda, max_iter):
+def run_mlr_classification_recall(X_train, X_test, y_train, y_test, eta, epsilon, penalty, l2_lambda, max_iter,
+                                  l1_lambda=0, model=None, dtype=np.float64, timings=None):
     """
     Score is species level recall.
 
@@ -37,16 +45,43 @@ def run_mlr_classification_recall(X_train, X_test, y_train, y_test, eta, epsilon
     :param penalty:
     :param l2_lambda:
     :param max_iter:
+    :param l1_lambda: float, value of l1 penalty, used by the 'l1' and 'elasticnet' penalties. Default is 0.
+    :param model: MulticlassLogisticRegression to be trained with the given hyperparameters (i.e. with warm_start
+            enabled, so that training starts from the weights of its previous fit). Weights are only reused if the
+            previous fit differed in l2_lambda alone; otherwise training starts from zero weights. Default is None, in
+            which case a new model is trained.
+    :param dtype: floating point type used for training and predictions. Default is np.float64.
+    :param timings: dictionary where the time spent fitting and predicting is recorded (see helper.timed_stage()).
+            Default is None.
     :return:
     """
-    mlr = MulticlassLogisticRegression(eta=eta,
-                                       epsilon=epsilon,
-                                       penalty=penalty,
-                                       l2_lambda=l2_lambda,
-                                       max_iter=max_iter,
-                                       verbose=True)
-    mlr.fit(X_train, y_train)
-    y_pred = mlr.predict(X_test)
+    mlr = model
+    if mlr is None:
+        mlr = MulticlassLogisticRegression(eta=eta,
+                                           epsilon=epsilon,
+                                           penalty=penalty,
+                                           l2_lambda=l2_lambda,
+                                           max_iter=max_iter,
+                                           verbose=True,
+                                           l1_lambda=l1_lambda,
+                                           dtype=dtype)
+    else:
+        # warm start only along the regularization path, so each row describes the hyperparameters it was trained with
+        if (mlr.eta, mlr.epsilon, mlr.penalty, mlr.max_iter, mlr.l1_lambda) != (eta, epsilon, penalty, max_iter,
+                                                                                l1_lambda):
+            mlr.classifiers = None
+
+        # update hyperparameters of the reused model
+        mlr.eta = eta
+        mlr.epsilon = epsilon
+        mlr.penalty = penalty
+        mlr.l2_lambda = l2_lambda
+        mlr.max_iter = max_iter
+        mlr.l1_lambda = l1_lambda
+    with timed_stage(timings, 'fitting'):
+        mlr.fit(X_train, y_train)
+    with timed_stage(timings, 'predicting'):
+        y_pred = mlr.predict(X_test)
     score = recall_score(y_test, y_pred, average='weighted')
     return score
 
@@ -67,10 +102,19 @@ def grid_search_multiclass_mlr(seq_file,
                                grid_search_file,
                                fields,
                                experiment,
-                               score_type):
+                               score_type,
+                               warm_start=False,
+                               dtype=np.float64,
+                               model_dir=None,
+                               cache_dir=None,
+                               max_cache_size=None,
+                               n_jobs=1,
+                               split='fragment',
+                               meta_file=None,
+                               n_folds=None,
+                               list_l1_lambda=(0,)):
     """
-
-    Todo - add ability to track runtime
+    Each results row ends with the wall time and peak memory of each stage (see helper.timing_fields()).
 
     :param seq_file:
     :param taxid_file:
@@ -89,57 +133,66 @@ def grid_search_multiclass_mlr(seq_file,
     :param fields:
     :param experiment:
     :param score_type:
+    :param warm_start: boolean, if True, combinations which differ only in l2_lambda are fit in order from largest to
+            smallest l2_lambda, and each fit starts from the weights of the previous fit, so that the combinations
+            follow a regularization path (see MulticlassLogisticRegression.regularization_path()). Fits with any other
+            change in hyperparameters start from zero weights. Default is False.
+    :param dtype: floating point type used for encoding, training, and predictions. np.float32 halves memory use.
+            Default is np.float64.
+    :param model_dir: str, directory where each trained model is saved (see packages.linear_model.serialization)
+            in a subdirectory named after the experiment, (sample length, coverage, trial, k) combination, and
+            hyperparameter combination number. Default is None, in which case trained models are discarded.
+    :param cache_dir: str, directory where fragment sets and their encodings are cached and reused across runs
+            (see helper.build_fragments and helper.encode_fragments). Default is None, in which case fragments are
+            generated in output_dir and encoded each time.
+    :param max_cache_size: int, maximum size of the fragment cache in bytes. Default is None.
+    :param n_jobs: int, number of processes used to build fragments, encode, and train models in parallel
+            (see helper.run_grid_search). Ignored if warm_start is True or model_dir is set, because warm starts must
+            run in order and models are saved from this process (see the model_factory and result_hook parameters of
+            helper.run_grid_search). Default is 1.
+    :param split: str, 'fragment', 'sequence', or 'strain'. How fragments are split into training and test sets
+            (see helper.run_grid_search). Default is 'fragment'.
+    :param meta_file: str, path to metadata file, required if split is 'strain'. Default is None.
+    :param n_folds: int, number of cross-validation folds, with one results row per fold (see helper.run_grid_search).
+            Not supported if warm_start is True or model_dir is set. Default is None, in which case each combination
+            is scored on a single split.
+    :param list_l1_lambda: List, l1 penalty values tried with the 'l1' and 'elasticnet' penalties. The l1_lambda
+            column follows the max_iter column in each row, so fields must include it. Default is (0,).
     :return:
     """
-    # set up grid search results file
-    append_results_to_file(grid_search_file, fields=fields)
-
-    # calculate number of combinations
-    n_combinations = calc_number_combinations(list_sample_length,
-                                              list_coverage,
-                                              list_k,
-                                              list_eta,
-                                              list_epsilon,
-                                              list_penalty,
-                                              list_l2_lambda,
-                                              list_max_iter)
-
-    # process combinations
-    count = 0
-    sample_length_prev = -1
-    coverage_prev = -1
-
-    # parameter combinations
-    for sample_length, coverage, k in parameter_generator(list_sample_length, list_coverage, list_k):
-        print(sample_length, coverage, k)
-
-        if sample_length != sample_length_prev or coverage != coverage_prev:
-            # fragment combination
-            build_fragments(seq_file, taxid_file, output_dir, sample_length, coverage, seed)
-
-            # update previous values
-            sample_length_prev = sample_length
-            coverage_prev = coverage
-
-        # kmer from fragments
-        X_train, X_test, y_train, y_test = encode_fragments(output_dir, pattern, k, seed)
-
-        # hyperparameter combinations
-        for eta, epsilon, penalty, l2_lambda, max_iter in hyperparameter_generator(list_eta, list_epsilon, list_penalty,
-                                                                                   list_l2_lambda, list_max_iter):
-            print(eta, epsilon, penalty, l2_lambda, max_iter)
+    if warm_start:
+        list_l2_lambda = sorted(list_l2_lambda, reverse=True)
+    hyperparameters = list(hyperparameter_generator(list_eta, list_epsilon, list_penalty, list_l2_lambda,
+                                                    list_max_iter, list_l1_lambda))
+    if warm_start:
+        # place combinations which differ only in l2_lambda next to each other, keeping largest l2_lambda first
+        paths = list(dict.fromkeys(params[:3] + params[4:] for params in hyperparameters))
+        hyperparameters.sort(key=lambda params: paths.index(params[:3] + params[4:]))
 
-            # train and score model
-            score = run_mlr_classification_recall(X_train, X_test, y_train, y_test, eta, epsilon, penalty, l2_lambda,
-                                                  max_iter)
-            count += 1
+    model_factory = None
+    if warm_start or model_dir is not None:
+        # trained models are kept in this process, so fits run serially
+        def model_factory(sample_length, coverage, k):
+            return MulticlassLogisticRegression(eta=None, epsilon=None, verbose=True, warm_start=warm_start,
+                                                dtype=dtype)
 
-            # output results to file
-            row = [experiment, 'multiclass', 'Logistic Regression', X_train.shape, sample_length, coverage, k, eta,
-                   epsilon, penalty, l2_lambda, max_iter, score, score_type]
-            append_results_to_file(grid_search_file, rows=[row])
+    result_hook = None
+    if model_dir is not None:
+        def result_hook(result):
+            # retain trained model, named after its combination so reruns overwrite rather than duplicate it
+            name = '{}-{}-{}-{}-{}-{}'.format(experiment, result['sample_length'], result['coverage'], result['trial'],
+                                              result['k'], str(hyperparameters.index(result['params'])).zfill(5))
+            metadata = {'experiment': experiment, 'coverage': result['coverage'],
+                        'training_shape': list(result['training_shape']), 'score': result['score'],
+                        'score_type': score_type}
+            save_model(result['model'], os.path.join(model_dir, name), classes=result['classes'], k=result['k'],
+                       sample_length=result['sample_length'], metadata=metadata, categories=result['categories'])
 
-        print('Percent complete: {}'.format(count / n_combinations * 100))  # display progress
+    run_grid_search(seq_file, taxid_file, output_dir, pattern, list_sample_length, list_coverage, list_k,
+                    hyperparameters, partial(run_mlr_classification_recall, dtype=dtype), seed, grid_search_file,
+                    fields, row_prefix=[experiment, 'multiclass', 'Logistic Regression'], row_suffix=[score_type],
+                    n_jobs=n_jobs, dtype=dtype, cache_dir=cache_dir, max_cache_size=max_cache_size, split=split,
+                    meta_file=meta_file, n_folds=n_folds, model_factory=model_factory, result_hook=result_hook)
 
 
 def main():
@@ -153,9 +206,7 @@ def main():
     output_dir = '/Users/ryanqnelson/GitHub/C-A-L-C-I-F-E-R/CMU-02620-Metagenomics/data/sampling/sampling-toy-3000'
     pattern = 'fragments*.npy'
     seed = None
-    date_time = datetime.datetime.now().strftime('%Y.%m.%d.%H.%M.%S')
     data_dir = '/Users/ryanqnelson/GitHub/C-A-L-C-I-F-E-R/CMU-02620-Metagenomics/'
-    grid_search_file = data_dir + 'data/gridsearch-3000/results-3000-mlr.{}.csv'.format(date_time)
     fields = ['experiment',
               'category',
               'classifier',
@@ -168,10 +219,12 @@ def main():
               'penalty',
               'l2_lambda',
               'max_iter',
+              'l1_lambda',
               'score',
               'score type']
 
     experiment = '16.05'
+    grid_search_file = data_dir + 'data/gridsearch-3000/results-3000-mlr.{}.csv'.format(experiment)
     score_type = 'species_recall'
 
     # combinations to try
@@ -183,6 +236,7 @@ def main():
     list_penalty = [None]
     list_l2_lambda = [0]
     list_max_iter = [200]
+    list_l1_lambda = [0.01]
 
     grid_search_multiclass_mlr(seq_file,
                                taxid_file,
@@ -200,7 +254,8 @@ def main():
                                grid_search_file,
                                fields,
                                experiment,
-                               score_type)
+                               score_type,
+                               list_l1_lambda=list_l1_lambda)
 
 
 if __name__ == "__main__":
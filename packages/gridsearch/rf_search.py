@@ -1,10 +1,9 @@
-import datetime
+from functools import partial
 
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import recall_score
 
-from packages.gridsearch.helper import append_results_to_file, build_fragments, encode_fragments, \
-    calc_number_combinations, parameter_generator
+from packages.gridsearch.helper import run_grid_search, timed_stage
 
 
 def hyperparameter_generator(list_max_depth, list_n_estimators):
@@ -19,7 +18,7 @@ def hyperparameter_generator(list_max_depth, list_n_estimators):
             yield max_depth, n_estimators
 
 
-def run_rf_classification_recall(X_train, X_test, y_train, y_test, max_depth, n_estimators, seed):
+def run_rf_classification_recall(X_train, X_test, y_train, y_test, max_depth, n_estimators, seed, timings=None):
     """
     Score is species level recall.
     """
@@ -27,8 +26,10 @@ def run_rf_classification_recall(X_train, X_test, y_train, y_test, max_depth, n_
     rf = RandomForestClassifier(max_depth=max_depth,
                                 n_estimators=n_estimators,
                                 random_state=seed)
-    rf.fit(X_train, y_train)
-    y_pred = rf.predict(X_test)
+    with timed_stage(timings, 'fitting'):
+        rf.fit(X_train, y_train)
+    with timed_stage(timings, 'predicting'):
+        y_pred = rf.predict(X_test)
     score = recall_score(y_test, y_pred, average='weighted')
     return score
 
@@ -46,52 +47,19 @@ def grid_search_multiclass_rf(seq_file,
                               grid_search_file,
                               fields,
                               experiment,
-                              score_type):
-    # set up grid search results file
-    append_results_to_file(grid_search_file, fields=fields)
-
-    # calculate number of combinations
-    n_combinations = calc_number_combinations(list_sample_length,
-                                              list_coverage,
-                                              list_k,
-                                              list_max_depth,
-                                              list_n_estimators)
-
-    # process combinations
-    count = 0
-    sample_length_prev = -1
-    coverage_prev = -1
-
-    # parameter combinations
-    for sample_length, coverage, k in parameter_generator(list_sample_length, list_coverage, list_k):
-        print(sample_length, coverage, k)
-
-        if sample_length != sample_length_prev or coverage != coverage_prev:
-            # fragment combination
-            build_fragments(seq_file, taxid_file, output_dir, sample_length, coverage, seed)
-
-            # update previous values
-            sample_length_prev = sample_length
-            coverage_prev = coverage
-
-        # kmer from fragments
-        X_train, X_test, y_train, y_test = encode_fragments(output_dir, pattern, k, seed)
-
-        # hyperparameter combinations
-        for max_depth, n_estimators in hyperparameter_generator(list_max_depth, list_n_estimators):
-            print(max_depth, n_estimators)
-
-            # train and score model
-            score = run_rf_classification_recall(X_train, X_test, y_train, y_test, max_depth, n_estimators,
-                                                 seed)
-            count += 1
-
-            # output results to file
-            row = [experiment, 'multiclass', 'Random Forest', X_train.shape, sample_length, coverage, k,
-                   max_depth, n_estimators, score, score_type]
-            append_results_to_file(grid_search_file, rows=[row])
-
-        print('Percent complete: {}'.format(count / n_combinations * 100))  # display progress
+                              score_type,
+                              cache_dir=None,
+                              max_cache_size=None,
+                              n_jobs=1,
+                              split='fragment',
+                              meta_file=None,
+                              n_folds=None):
+    hyperparameters = hyperparameter_generator(list_max_depth, list_n_estimators)
+    run_grid_search(seq_file, taxid_file, output_dir, pattern, list_sample_length, list_coverage, list_k,
+                    hyperparameters, partial(run_rf_classification_recall, seed=seed), seed, grid_search_file, fields,
+                    row_prefix=[experiment, 'multiclass', 'Random Forest'], row_suffix=[score_type], n_jobs=n_jobs,
+                    cache_dir=cache_dir, max_cache_size=max_cache_size, split=split, meta_file=meta_file,
+                    n_folds=n_folds)
 
 
 def main():
@@ -106,9 +74,7 @@ def main():
     output_dir = '/Users/ryanqnelson/GitHub/C-A-L-C-I-F-E-R/CMU-02620-Metagenomics/data/sampling/sampling-toy-3000'
     pattern = 'fragments*.npy'
     seed = None
-    date_time = datetime.datetime.now().strftime('%Y.%m.%d.%H.%M.%S')
     data_dir = '/Users/ryanqnelson/GitHub/C-A-L-C-I-F-E-R/CMU-02620-Metagenomics/'
-    grid_search_file = data_dir + 'data/gridsearch-3000/results-3000-rf.{}.csv'.format(date_time)
     fields = ['experiment',
               'category',
               'classifier',
@@ -122,6 +88,7 @@ def main():
               'score type']
 
     experiment = '11.04'
+    grid_search_file = data_dir + 'data/gridsearch-3000/results-3000-rf.{}.csv'.format(experiment)
     score_type = 'species_recall'
 
     # combinations to try
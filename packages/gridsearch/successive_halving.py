@@ -0,0 +1,306 @@
+"""
+Successive halving and Hyperband schedulers for the grid search scripts.
+
+Instead of training every combination on all of its training data, successive halving trains every combination on a
+small random subsample of the training fragments (stratified, so every class is kept), keeps the best 1/eta of the
+combinations, and trains the survivors on eta times as much data, until the remaining combinations are trained on all
+of the training data. The search space is the same as the grid search (parameter_generator() and a hyperparameter
+generator) and results are written with the same columns, with the training shape column showing the size of the
+subsample used for each row.
+"""
+import math
+
+import numpy as np
+
+from packages.gridsearch.helper import _build_row, _rank_within_class, _score_combination, append_results_to_file, \
+    build_fragments, encode_fragments, get_record_groups, memory_tracing, parameter_generator, timed_stage, \
+    timing_fields
+
+
+# tested
+def _get_configurations(list_sample_length, list_coverage, list_k, hyperparameters):
+    """
+    Lists every (sample length, coverage, k, hyperparameters) combination of the grid. Values repeated in the lists
+    (i.e. [100, 200, 400] * 5) only produce one combination.
+
+    :param list_sample_length: List, sample lengths to be tested
+    :param list_coverage: List, coverages to be tested
+    :param list_k: List, k-mers to be tested
+    :param hyperparameters: List of tuples, hyperparameter combinations to be tested
+    :return: List of (sample length, coverage, k, hyperparameters) tuples
+    """
+    configurations = [(L, c, k, tuple(params))
+                      for L, c, k in parameter_generator(list_sample_length, list_coverage, list_k)
+                      for params in hyperparameters]
+    return list(dict.fromkeys(configurations))  # remove duplicates, keeping order
+
+
+# tested
+def _subsample_rows(y, fraction, seed):
+    """
+    Selects a random subset of rows, stratified by class: each class contributes round(fraction * n) of its n rows,
+    and at least one row, so every class is still trained on (models such as MulticlassLogisticRegression require
+    labels 0, ..., K-1 to all be present). For a given seed, the subset for a smaller fraction is contained in the
+    subset for a larger fraction, so survivors of a rung are always trained on a superset of their previous data.
+
+    :param y: L x 1 array, class of each row
+    :param fraction: float, fraction of the rows of each class to select, between 0 and 1
+    :param seed: Random seed, for reproducibility. 0 or None uses a fixed permutation.
+    :return: sorted array of selected row indices
+    """
+    classes, y_idx, class_counts = np.unique(np.asarray(y).reshape(-1), return_inverse=True, return_counts=True)
+    n_selected = np.maximum(1, np.round(class_counts * fraction).astype(np.int64))
+
+    rank = _rank_within_class(y_idx, len(classes), seed or 0)
+    return np.flatnonzero(rank < n_selected[y_idx])
+
+
+# tested
+def calc_number_rungs(min_fraction, eta):
+    """
+    Determines the number of rungs needed to go from the smallest fraction of data to all of the data.
+
+    :param min_fraction: float, fraction of the training data used in the first rung
+    :param eta: int, factor by which the fraction grows (and the number of combinations shrinks) at each rung
+    :return: int
+    """
+    return int(math.floor(math.log(1 / min_fraction, eta) + 1e-9)) + 1
+
+
+def _load_datasets(configurations, datasets, seq_file, taxid_file, output_dir, pattern, seed, dtype, cache_dir,
+                   max_cache_size, record_groups):
+    """
+    Builds the encoded data and training and test split of each (sample length, coverage, k) combination used by the
+    configurations which is not already in datasets. Fragments are built once for all k which share them.
+
+    :param datasets: dictionary of (encoded data, encoded taxids, training row indices, test row indices) tuples,
+            keyed by (sample length, coverage, k) (see helper.encode_fragments()). New datasets are added to it.
+    :return: dictionary of timings recorded while building each new dataset, keyed by (sample length, coverage, k)
+    """
+    missing = {}
+    for sample_length, coverage, k, _ in configurations:
+        if (sample_length, coverage, k) not in datasets:
+            missing.setdefault((sample_length, coverage), {})[k] = None  # keeps order without duplicates
+
+    build_timings = {}
+    for (sample_length, coverage), list_k in missing.items():
+        fragment_timings = {}
+        fragment_dir = build_fragments(seq_file, taxid_file, output_dir, sample_length, coverage, seed, cache_dir,
+                                       max_cache_size, fragment_timings)
+
+        for k in list_k:
+            encoding_timings = dict(fragment_timings)
+            datasets[(sample_length, coverage, k)] = encode_fragments(fragment_dir, pattern, k, seed, dtype, cache_dir,
+                                                                      max_cache_size, encoding_timings,
+                                                                      return_indices=True, record_groups=record_groups)
+            build_timings[(sample_length, coverage, k)] = encoding_timings
+
+    return build_timings
+
+
+def _evaluate_rung(configurations, fraction, datasets, build_timings, score_func, seed, grid_search_file, row_prefix,
+                   row_suffix):
+    """
+    Trains and scores each combination on the given fraction of its training data. Every rung uses the same datasets
+    (see _load_datasets()), so scores are comparable across rungs.
+
+    :param build_timings: dictionary of timings recorded while building datasets for this rung, which are added to the
+            rows of the combinations using them
+    :return: List, score of each combination
+    """
+    # group combinations which share a dataset
+    groups = {}
+    for i, (sample_length, coverage, k, params) in enumerate(configurations):
+        groups.setdefault((sample_length, coverage, k), []).append(i)
+
+    scores = [None] * len(configurations)
+    for (sample_length, coverage, k), indices in groups.items():
+        X_enc, y_enc, train_idx, test_idx = datasets[(sample_length, coverage, k)]
+        encoding_timings = dict(build_timings.get((sample_length, coverage, k), {}))
+
+        # reduce training data, copying only the selected rows out of the encoded data
+        with timed_stage(encoding_timings, 'splitting'):
+            rows = train_idx[_subsample_rows(y_enc[train_idx], fraction, seed)]
+            X_sub, y_sub = X_enc[rows], y_enc[rows]
+            X_test, y_test = X_enc[test_idx], y_enc[test_idx]
+
+        for i in indices:
+            params = configurations[i][3]
+            print(fraction, sample_length, coverage, k, *params)
+            scores[i], timings = _score_combination(score_func, X_sub, X_test, y_sub, y_test, params,
+                                                    encoding_timings)
+
+            row = _build_row(row_prefix, row_suffix, X_sub.shape, sample_length, coverage, k, params, scores[i],
+                             timings)
+            append_results_to_file(grid_search_file, rows=[row])
+
+    return scores
+
+
+# tested
+def successive_halving(seq_file,
+                       taxid_file,
+                       output_dir,
+                       pattern,
+                       list_sample_length,
+                       list_coverage,
+                       list_k,
+                       hyperparameters,
+                       score_func,
+                       seed,
+                       grid_search_file,
+                       fields,
+                       row_prefix,
+                       row_suffix,
+                       min_fraction=1 / 27,
+                       eta=3,
+                       dtype=np.float64,
+                       cache_dir=None,
+                       max_cache_size=None,
+                       configurations=None,
+                       split='fragment',
+                       meta_file=None,
+                       trace_memory=False):
+    """
+    Runs successive halving over the grid. Every combination is scored using min_fraction of its training data.
+    The best 1/eta of the combinations (by score, higher is better) are scored again using eta times as much data,
+    until the final rung uses all of the training data. Test data is never subsampled.
+
+    Fragments are sampled, encoded, and split once for each (sample length, coverage, k) combination, before its first
+    rung, so every rung is scored on the same test set. Encoded data is kept in memory until none of its combinations
+    remain.
+
+    :param seq_file: Path to file containing sequence data in .fasta format.
+    :param taxid_file: Path to file containing matching species for all sequences.
+    :param output_dir: Path where fragments should be written.
+    :param pattern: str, bash-like pattern defining types of files to read from the fragment directory.
+    :param list_sample_length: List, sample lengths to be tested
+    :param list_coverage: List, coverages to be tested
+    :param list_k: List, k-mers to be tested
+    :param hyperparameters: List of tuples, hyperparameter combinations to be tested (i.e. from a hyperparameter
+            generator). Use [()] for models without hyperparameters.
+    :param score_func: function which trains a model and returns its score. Called as
+            score_func(X_train, X_test, y_train, y_test, *params, timings=timings) (see helper.run_grid_search()).
+    :param seed: Random seed, for reproducibility
+    :param grid_search_file: Path to the results file
+    :param fields: List, header row for the results file. The timing columns (see helper.timing_fields()) are added
+            at the end. Not written if None.
+    :param row_prefix: List, values written before the training shape in each row (i.e. [experiment, classifier])
+    :param row_suffix: List, values written after the score in each row (i.e. [score_type])
+    :param min_fraction: float, fraction of the training data used in the first rung. Default is 1/27.
+    :param eta: int, factor by which the fraction grows (and the number of combinations shrinks) at each rung.
+            Default is 3.
+    :param dtype: type of the values stored in the encoded matrix. Default is np.float64.
+    :param cache_dir: Path to directory where fragment sets and encodings are cached. Default is None.
+    :param max_cache_size: int, maximum total size of the cache in bytes. Default is None.
+    :param configurations: List of (sample length, coverage, k, hyperparameters) tuples to evaluate instead of the
+            whole grid (i.e. a bracket of hyperband()). Default is None.
+    :param split: str, 'fragment', 'sequence', or 'strain'. How fragments are split into training and test sets
+            (see helper.run_grid_search()). Default is 'fragment'.
+    :param meta_file: Path to metadata file, required if split is 'strain'. Default is None.
+    :param trace_memory: boolean, if True, the peak memory of each stage is recorded, which slows down the search
+            (see helper.memory_tracing()). Default is False.
+    :return: List of ((sample length, coverage, k, hyperparameters), score) tuples for the combinations of the final
+            rung, best first
+    """
+    if not 0 < min_fraction <= 1:
+        raise ValueError('min_fraction must be in (0, 1]:', min_fraction)
+    if eta < 2:
+        raise ValueError('eta must be at least 2:', eta)
+
+    if configurations is None:
+        configurations = _get_configurations(list_sample_length, list_coverage, list_k, list(hyperparameters))
+    record_groups = None if split == 'fragment' else get_record_groups(seq_file, split, meta_file)
+
+    # set up grid search results file
+    if fields is not None:
+        append_results_to_file(grid_search_file, fields=list(fields) + timing_fields())
+
+    n_rungs = calc_number_rungs(min_fraction, eta)
+    datasets = {}
+    ranked = []
+    for rung in range(n_rungs):
+        fraction = 1.0 if rung == n_rungs - 1 else min_fraction * eta ** rung
+        print('Rung {}: {} combinations using {:.4f} of training data'.format(rung, len(configurations), fraction))
+
+        with memory_tracing(trace_memory):
+            build_timings = _load_datasets(configurations, datasets, seq_file, taxid_file, output_dir, pattern, seed,
+                                           dtype, cache_dir, max_cache_size, record_groups)
+            scores = _evaluate_rung(configurations, fraction, datasets, build_timings, score_func, seed,
+                                    grid_search_file, row_prefix, row_suffix)
+
+        # keep the best combinations; order is stable for ties
+        order = sorted(range(len(configurations)), key=lambda i: -scores[i])
+        ranked = [(configurations[i], scores[i]) for i in order]
+        if rung < n_rungs - 1:
+            n_keep = max(1, len(configurations) // eta)
+            configurations = [config for config, _ in ranked[:n_keep]]
+
+            # release data no longer used by any combination
+            remaining = {config[:3] for config in configurations}
+            for key in [key for key in datasets if key not in remaining]:
+                del datasets[key]
+
+    return ranked
+
+
+def hyperband(seq_file,
+              taxid_file,
+              output_dir,
+              pattern,
+              list_sample_length,
+              list_coverage,
+              list_k,
+              hyperparameters,
+              score_func,
+              seed,
+              grid_search_file,
+              fields,
+              row_prefix,
+              row_suffix,
+              min_fraction=1 / 27,
+              eta=3,
+              dtype=np.float64,
+              cache_dir=None,
+              max_cache_size=None,
+              split='fragment',
+              meta_file=None,
+              trace_memory=False):
+    """
+    Runs Hyperband (Li et al., https://arxiv.org/abs/1603.06560) over the grid. Each bracket runs successive halving
+    on a random sample of the combinations, starting from a different fraction of the training data, which hedges
+    against combinations whose ranking on little data does not hold on all of the data.
+
+    See successive_halving() for parameters. If seed is None, a seed is drawn once, so that every bracket samples the
+    same fragments and test sets and the best combinations of the brackets can be compared.
+
+    :return: ((sample length, coverage, k, hyperparameters), score) Tuple representing the best combination found
+            using all of the training data, and its score
+    """
+    configurations = _get_configurations(list_sample_length, list_coverage, list_k, list(hyperparameters))
+    s_max = calc_number_rungs(min_fraction, eta) - 1
+    random_state = np.random.RandomState(seed or 0)
+    if seed is None:
+        seed = np.random.randint(1, 2 ** 31 - 1)
+
+    # set up grid search results file
+    append_results_to_file(grid_search_file, fields=list(fields) + timing_fields())
+
+    best = None
+    for s in range(s_max, -1, -1):
+        # bracket s starts with more combinations on less data
+        n_configurations = int(math.ceil((s_max + 1) / (s + 1) * eta ** s))
+        n_configurations = min(n_configurations, len(configurations))
+        sample = random_state.choice(len(configurations), n_configurations, replace=False)
+
+        ranked = successive_halving(seq_file, taxid_file, output_dir, pattern, list_sample_length, list_coverage,
+                                    list_k, hyperparameters, score_func, seed, grid_search_file, None, row_prefix,
+                                    row_suffix, min_fraction=float(eta) ** -s, eta=eta, dtype=dtype,
+                                    cache_dir=cache_dir, max_cache_size=max_cache_size,
+                                    configurations=[configurations[i] for i in sorted(sample)], split=split,
+                                    meta_file=meta_file, trace_memory=trace_memory)
+
+        if best is None or ranked[0][1] > best[1]:
+            best = ranked[0]
+
+    return best
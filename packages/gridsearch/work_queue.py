@@ -0,0 +1,420 @@
+"""
+File-based work queue for running a grid search with several worker processes, on one or more hosts which share a
+filesystem. No services are needed besides the shared directory.
+
+The queue directory contains:
+- pending/: one json file for each (sample length, coverage, k, hyperparameter) task which has not been claimed
+- running/: tasks claimed by a worker
+- done/: tasks whose results have been written
+- results/: one results shard for each worker
+- lock: lock file held by a worker while it claims a task
+
+Typical use:
+1. create_queue() once, to list the tasks of the grid.
+2. run_worker() in as many processes and hosts as desired. Each worker claims tasks until none are left.
+3. merge_results() once all tasks are done, to write the grid search results file.
+
+While a worker runs a task, it updates the modification time of the task file in running/ every heartbeat interval.
+If a worker dies, its claimed tasks stay in running/ and stop being updated. requeue_stale_tasks() returns them to
+pending/ so another worker can finish them.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from glob import glob
+
+import numpy as np
+
+from packages.gridsearch.helper import _append_durably, _build_row, _format_row, _plan_grid_search, \
+    _score_combination, _truncate_partial_line, append_results_to_file, build_fragments, encode_fragments, \
+    get_record_groups, memory_tracing, timing_fields
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+RESULTS = 'results'
+LOCK_FILE = 'lock'
+
+
+def _get_queue_dirs(queue_dir):
+    """
+    Builds the paths of the subdirectories of a queue.
+
+    :param queue_dir: Path to the queue directory
+    :return: (str, str, str, str) Tuple representing (pending, running, done, results) directories
+    """
+    return tuple(os.path.join(queue_dir, name) for name in (PENDING, RUNNING, DONE, RESULTS))
+
+
+# tested
+def create_queue(queue_dir, list_sample_length, list_coverage, list_k, hyperparameters):
+    """
+    Creates a queue containing one task for each combination of the grid. Tasks are numbered in the same order as
+    the combinations of a serial grid search, so workers claiming tasks in order tend to reuse the fragments and
+    encoding of their previous task.
+
+    :param queue_dir: Path to the queue directory. Must not already contain a queue.
+    :param list_sample_length: List, sample lengths to be tested
+    :param list_coverage: List, coverages to be tested
+    :param list_k: List, k-mers to be tested
+    :param hyperparameters: List of tuples, hyperparameter combinations to be tested. Values must be json
+            serializable. Use [()] for models without hyperparameters.
+    :return: int, number of tasks
+    """
+    pending_dir, running_dir, done_dir, results_dir = _get_queue_dirs(queue_dir)
+    if os.path.exists(pending_dir):
+        raise ValueError('Queue already exists:', queue_dir)
+
+    for each in (running_dir, done_dir, results_dir):
+        os.makedirs(each, exist_ok=True)
+
+    # write tasks to a temporary directory first so workers never see a partial queue
+    tmp_dir = pending_dir + '.tmp'
+    os.makedirs(tmp_dir)
+
+    n_tasks = 0
+    plan = _plan_grid_search(list_sample_length, list_coverage, list_k, list(hyperparameters), {})
+    for sample_length, coverage, trial, encodings in plan:
+        for k, remaining in encodings:
+            for params in remaining:
+                task = {'sample_length': sample_length, 'coverage': coverage, 'trial': trial, 'k': k,
+                        'params': list(params)}
+                with open(os.path.join(tmp_dir, '{}.json'.format(str(n_tasks).zfill(8))), 'w') as f:
+                    json.dump(task, f)
+                n_tasks += 1
+
+    os.rename(tmp_dir, pending_dir)
+    return n_tasks
+
+
+def _remove_lock(lock_file, owner):
+    """
+    Removes the lock file if it is held by the given owner. The lock is first renamed to a name no other worker uses,
+    so a lock created by another worker in the meantime is never removed: if the renamed lock turns out to belong to
+    someone else, it is put back.
+
+    :param lock_file: path to the lock file
+    :param owner: str, contents of the lock file written by its owner
+    :return: boolean, True if the lock was removed
+    """
+    tmp_file = '{}.{}'.format(lock_file, uuid.uuid4().hex)
+    try:
+        os.rename(lock_file, tmp_file)
+    except FileNotFoundError:
+        return False
+
+    try:
+        with open(tmp_file) as f:
+            removed = f.read() == owner
+        if not removed:
+            try:
+                os.link(tmp_file, lock_file)
+            except FileExistsError:
+                pass  # lock was acquired again in the meantime
+    finally:
+        os.remove(tmp_file)
+
+    return removed
+
+
+# tested
+def _acquire_lock(queue_dir, timeout=60, stale_after=300):
+    """
+    Acquires the queue lock by creating the lock file exclusively. A lock older than stale_after seconds is assumed to
+    belong to a dead worker and is removed, as long as it still has the same owner (see _remove_lock()).
+
+    :param queue_dir: Path to the queue directory
+    :param timeout: float, seconds to wait for the lock before raising TimeoutError. Default is 60.
+    :param stale_after: float, age in seconds after which a lock is considered stale. Default is 300.
+    :return: str, owner written to the lock file, needed to release the lock
+    """
+    lock_file = os.path.join(queue_dir, LOCK_FILE)
+    owner = '{}-{}-{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex)
+    start = time.time()
+
+    while True:
+        try:
+            fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, owner.encode())
+            os.close(fd)
+            return owner
+        except FileExistsError:
+            pass
+
+        try:
+            # read the owner before the age, so a stale age always belongs to the owner which was read
+            with open(lock_file) as f:
+                stale_owner = f.read()
+            if time.time() - os.path.getmtime(lock_file) > stale_after:
+                _remove_lock(lock_file, stale_owner)
+                continue
+        except FileNotFoundError:
+            continue  # lock was released in the meantime
+
+        if time.time() - start > timeout:
+            raise TimeoutError('Could not acquire queue lock:', lock_file)
+        time.sleep(0.05 + np.random.random() * 0.1)
+
+
+# tested
+def _release_lock(queue_dir, owner):
+    """
+    Releases the queue lock, unless it was removed as stale and acquired by another worker in the meantime.
+
+    :param queue_dir: Path to the queue directory
+    :param owner: str, owner returned by _acquire_lock()
+    :return: None
+    """
+    _remove_lock(os.path.join(queue_dir, LOCK_FILE), owner)
+
+
+# tested
+def _claim_task(queue_dir):
+    """
+    Claims the first pending task by moving it into the running directory while holding the queue lock.
+
+    :param queue_dir: Path to the queue directory
+    :return: str, name of the claimed task, or None if no tasks are pending
+    """
+    pending_dir, running_dir, _, _ = _get_queue_dirs(queue_dir)
+
+    owner = _acquire_lock(queue_dir)
+    try:
+        for name in sorted(os.listdir(pending_dir)):
+            try:
+                os.rename(os.path.join(pending_dir, name), os.path.join(running_dir, name))
+            except FileNotFoundError:
+                continue  # claimed by a worker which ignored the lock
+
+            os.utime(os.path.join(running_dir, name))  # record when the task was claimed
+            return name
+    finally:
+        _release_lock(queue_dir, owner)
+
+    return None
+
+
+# tested
+@contextmanager
+def _heartbeat(path, interval):
+    """
+    Context manager which updates the modification time of a file every interval seconds while the enclosed block runs,
+    so that requeue_stale_tasks() can tell a running task from an abandoned one. Updates stop if the file is moved
+    (i.e. the task was requeued).
+
+    :param path: path to the task file
+    :param interval: float, seconds between updates
+    :return: None
+    """
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(interval):
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                return
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+# tested
+def requeue_stale_tasks(queue_dir, max_age):
+    """
+    Returns tasks whose heartbeat has not been updated for longer than max_age seconds to the pending directory
+    (i.e. tasks claimed by workers which died). max_age should be several times the heartbeat interval of the workers
+    (see run_worker()).
+
+    :param queue_dir: Path to the queue directory
+    :param max_age: float, seconds after which a running task is considered abandoned
+    :return: List, names of requeued tasks
+    """
+    pending_dir, running_dir, _, _ = _get_queue_dirs(queue_dir)
+    requeued = []
+
+    owner = _acquire_lock(queue_dir)
+    try:
+        for name in sorted(os.listdir(running_dir)):
+            path = os.path.join(running_dir, name)
+            try:
+                if time.time() - os.path.getmtime(path) > max_age:
+                    os.rename(path, os.path.join(pending_dir, name))
+                    requeued.append(name)
+            except FileNotFoundError:
+                continue  # finished in the meantime
+    finally:
+        _release_lock(queue_dir, owner)
+
+    return requeued
+
+
+# tested
+def run_worker(queue_dir,
+               seq_file,
+               taxid_file,
+               output_dir,
+               pattern,
+               score_func,
+               seed,
+               row_prefix,
+               row_suffix,
+               worker_id=None,
+               dtype=np.float64,
+               cache_dir=None,
+               max_cache_size=None,
+               split='fragment',
+               meta_file=None,
+               heartbeat_interval=60,
+               trace_memory=False):
+    """
+    Claims and runs tasks from the queue until no tasks are pending. Each result is appended to the worker's results
+    shard before its task is marked as done. Fragments and encoding are kept between tasks and only rebuilt when the
+    task needs different data.
+
+    A task which was requeued while this worker was still running it (i.e. the worker was slower than the max_age given
+    to requeue_stale_tasks()) is still recorded and marked as done. merge_results() keeps one row for each task.
+
+    Workers on different hosts should share a seed and a cache directory (see helper.build_fragments), so that every
+    worker trains on the same fragments for a given (sample length, coverage).
+
+    :param queue_dir: Path to the queue directory
+    :param seq_file: Path to file containing sequence data in .fasta format.
+    :param taxid_file: Path to file containing matching species for all sequences.
+    :param output_dir: Path where fragments should be written. Each worker uses its own subdirectory.
+    :param pattern: str, bash-like pattern defining types of files to read from the fragment directory.
+    :param score_func: function which trains a model and returns its score. Called as
+            score_func(X_train, X_test, y_train, y_test, *params, timings=timings) (see helper.run_grid_search()).
+    :param seed: Random seed, for reproducibility
+    :param row_prefix: List, values written before the training shape in each row (i.e. [experiment, classifier])
+    :param row_suffix: List, values written after the score in each row (i.e. [score_type])
+    :param worker_id: str, name of the worker, used to name its results shard. Default is None, in which case the
+            host name and process id are used.
+    :param dtype: type of the values stored in the encoded matrix. Default is np.float64.
+    :param cache_dir: Path to directory where fragment sets and encodings are cached. Default is None.
+    :param max_cache_size: int, maximum total size of the cache in bytes. Default is None.
+    :param split: str, 'fragment', 'sequence', or 'strain'. How fragments are split into training and test sets
+            (see helper.run_grid_search()). Default is 'fragment'.
+    :param meta_file: Path to metadata file, required if split is 'strain'. Default is None.
+    :param heartbeat_interval: float, seconds between updates of the modification time of the running task
+            (see requeue_stale_tasks()). Default is 60.
+    :param trace_memory: boolean, if True, the peak memory of each stage is recorded, which slows down each task
+            (see helper.memory_tracing()). Default is False.
+    :return: int, number of tasks run by this worker
+    """
+    if worker_id is None:
+        worker_id = '{}-{}'.format(socket.gethostname(), os.getpid())
+
+    pending_dir, running_dir, done_dir, results_dir = _get_queue_dirs(queue_dir)
+    shard_file = os.path.join(results_dir, '{}.jsonl'.format(worker_id))
+    worker_output_dir = os.path.join(output_dir, worker_id)
+    os.makedirs(output_dir, exist_ok=True)
+    record_groups = None if split == 'fragment' else get_record_groups(seq_file, split, meta_file)
+
+    fragment_id = None
+    encoding_id = None
+    fragment_dir = None
+    fragment_timings = None
+    encoding_timings = None
+    X_train, X_test, y_train, y_test = None, None, None, None
+
+    n_tasks = 0
+    while True:
+        name = _claim_task(queue_dir)
+        if name is None:
+            break
+
+        with open(os.path.join(running_dir, name)) as f:
+            task = json.load(f)
+        sample_length, coverage, k = task['sample_length'], task['coverage'], task['k']
+        params = tuple(task['params'])
+        print(worker_id, name, sample_length, coverage, k, *params)
+
+        with _heartbeat(os.path.join(running_dir, name), heartbeat_interval), memory_tracing(trace_memory):
+            # rebuild data only if the previous task used different data
+            if (sample_length, coverage, task['trial']) != fragment_id:
+                fragment_timings = {}
+                fragment_dir = build_fragments(seq_file, taxid_file, worker_output_dir, sample_length, coverage, seed,
+                                               cache_dir, max_cache_size, fragment_timings)
+                fragment_id = (sample_length, coverage, task['trial'])
+                encoding_id = None
+
+            if k != encoding_id:
+                encoding_timings = dict(fragment_timings)
+                X_train, X_test, y_train, y_test = encode_fragments(fragment_dir, pattern, k, seed, dtype, cache_dir,
+                                                                    max_cache_size, encoding_timings,
+                                                                    record_groups=record_groups)
+                encoding_id = k
+
+            # train and score model
+            score, timings = _score_combination(score_func, X_train, X_test, y_train, y_test, params,
+                                                encoding_timings)
+            row = _build_row(row_prefix, row_suffix, X_train.shape, sample_length, coverage, k, params, score, timings)
+
+            # record result before marking the task as done
+            _append_durably(shard_file, json.dumps({'task': name, 'row': _format_row(row)}) + '\n')
+
+        try:
+            os.rename(os.path.join(running_dir, name), os.path.join(done_dir, name))
+        except FileNotFoundError:
+            # task was requeued while it ran; take it back out of pending unless another worker claimed it
+            try:
+                os.rename(os.path.join(pending_dir, name), os.path.join(done_dir, name))
+            except FileNotFoundError:
+                pass
+        n_tasks += 1
+
+    return n_tasks
+
+
+def get_queue_status(queue_dir):
+    """
+    Counts the tasks in each state.
+
+    :param queue_dir: Path to the queue directory
+    :return: dictionary with the number of 'pending', 'running', and 'done' tasks
+    """
+    pending_dir, running_dir, done_dir, _ = _get_queue_dirs(queue_dir)
+    return {PENDING: len(os.listdir(pending_dir)),
+            RUNNING: len(os.listdir(running_dir)),
+            DONE: len(os.listdir(done_dir))}
+
+
+# tested
+def merge_results(queue_dir, grid_search_file, fields):
+    """
+    Combines the results shards of all workers into a single grid search results file, with rows in task order.
+    A task which was run more than once (i.e. requeued after its worker stopped responding) is written once.
+
+    :param queue_dir: Path to the queue directory
+    :param grid_search_file: Path to the results file. Overwritten if it exists.
+    :param fields: List, header row for the results file. The timing columns (see helper.timing_fields()) are added
+            at the end.
+    :return: int, number of rows written
+    """
+    _, _, _, results_dir = _get_queue_dirs(queue_dir)
+
+    rows = {}
+    for shard_file in sorted(glob(os.path.join(results_dir, '*.jsonl'))):
+        for line in _truncate_partial_line(shard_file).splitlines():
+            entry = json.loads(line)
+            rows.setdefault(entry['task'], entry['row'])
+
+    if os.path.exists(grid_search_file):
+        os.remove(grid_search_file)
+    append_results_to_file(grid_search_file, fields=list(fields) + timing_fields())
+
+    with open(grid_search_file, 'a', newline='') as f:
+        for name in sorted(rows):
+            f.write(rows[name])
+
+    return len(rows)
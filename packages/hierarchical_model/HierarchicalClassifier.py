@@ -0,0 +1,138 @@
+"""
+Implements hierarchical classification over two taxonomic ranks (i.e. genus, then species within the genus).
+
+A parent model is trained to predict the parent taxid (i.e. genus) of each sample. For each parent, a child model is
+trained only on the samples of that parent and only predicts its children (i.e. the species of the genus). To classify
+a sample, the parent model chooses a parent, then the child model of that parent chooses the taxid.
+
+Each child model only learns the classes of its own subtree, so for a database of K species in G genera, the K-way
+problem is replaced by one G-way problem and G problems of about K/G classes each. Models whose cost grows with the
+number of classes (i.e. one binary classifier per class in MulticlassLogisticRegression) train and predict faster.
+
+Any model with fit(X, y) and predict(X) can be used (i.e. MulticlassLogisticRegression or NaiveBayes). Labels are
+encoded as 0, ..., K-1 before each model is trained, so models which require encoded labels can be used directly.
+"""
+import numpy as np
+
+
+# tested
+def _encode_labels(y):
+    """
+    Encodes labels as 0, ..., K-1 in sorted order.
+
+    :param y: L x 1 array, labels
+    :return: (K x 1 array, L x 1 array) Tuple representing (sorted unique labels, encoded labels)
+    """
+    classes, y_enc = np.unique(y, return_inverse=True)
+    return classes, y_enc.reshape(-1)
+
+
+# tested
+def _group_rows(labels):
+    """
+    Groups row indices by label with a single sort.
+
+    :param labels: L x 1 array
+    :return: (array, List of arrays) Tuple representing (sorted unique labels, row indices for each label)
+    """
+    unique_labels, label_idx = np.unique(labels, return_inverse=True)
+    label_idx = label_idx.reshape(-1)
+    order = np.argsort(label_idx, kind='stable')
+    boundaries = np.cumsum(np.bincount(label_idx, minlength=len(unique_labels)))[:-1]
+    return unique_labels, np.split(order, boundaries)
+
+
+class HierarchicalClassifier:
+    """
+    Two-level classifier which predicts a parent taxid, then a taxid among the children of that parent.
+    """
+
+    def __init__(self, make_model):
+        """
+        Initializes an instance.
+
+        :param make_model: function which takes no arguments and returns a new unfitted model, called once for the
+                parent model and once for each parent with more than one child
+                (i.e. lambda: MulticlassLogisticRegression(eta=0.1, epsilon=0.01)).
+        """
+        self.make_model = make_model
+        self.classes = None
+        self.parent_model = None
+        self.parent_classes = None
+        self.child_models = None
+        self.child_classes = None
+
+    # tested
+    def fit(self, X, y, y_parent):
+        """
+        Trains the parent model on all samples and a child model for each parent on the samples of that parent.
+        Parents with a single child do not need a child model.
+
+        :param X: L x J matrix, where L is the number of samples and J is the number of features
+        :param y: L x 1 array, taxid of each sample (i.e. species)
+        :param y_parent: L x 1 array, parent taxid of each sample (i.e. genus), as returned by taxonomy.map_to_rank()
+        :return: self
+        """
+        y = np.asarray(y).reshape(-1)
+        y_parent = np.asarray(y_parent).reshape(-1)
+
+        self.classes = np.unique(y)
+        n_pairs = len(np.unique(np.column_stack((y.astype(str), y_parent.astype(str))), axis=0))
+        if n_pairs != len(self.classes):
+            raise ValueError('Each taxid must have a single parent taxid.')
+
+        self.parent_classes, y_parent_enc = _encode_labels(y_parent)
+        self.parent_model = None
+        if len(self.parent_classes) > 1:
+            self.parent_model = self.make_model().fit(X, y_parent_enc)
+
+        self.child_models = []
+        self.child_classes = []
+        _, parent_rows = _group_rows(y_parent_enc)
+        for rows in parent_rows:
+            classes, y_enc = _encode_labels(y[rows])
+
+            model = None
+            if len(classes) > 1:
+                model = self.make_model().fit(X[rows], y_enc)
+
+            self.child_models.append(model)
+            self.child_classes.append(classes)
+
+        return self
+
+    # tested
+    def predict_parent(self, X):
+        """
+        Predicts the parent taxid of each sample.
+
+        :param X: L x J matrix
+        :return: L x 1 array of parent taxids
+        """
+        if self.parent_model is None:
+            return np.repeat(self.parent_classes, X.shape[0])
+
+        return self.parent_classes[np.asarray(self.parent_model.predict(X)).reshape(-1)]
+
+    # tested
+    def predict(self, X):
+        """
+        Predicts the taxid of each sample. Each sample is only scored by the child model of its predicted parent.
+
+        :param X: L x J matrix
+        :return: L x 1 array of taxids
+        """
+        if self.parent_model is None:
+            parent_idx = np.zeros(X.shape[0], dtype=np.int64)
+        else:
+            parent_idx = np.asarray(self.parent_model.predict(X)).reshape(-1)
+
+        y_pred = np.empty(X.shape[0], dtype=self.classes.dtype)
+        for k, rows in zip(*_group_rows(parent_idx)):
+            model, classes = self.child_models[k], self.child_classes[k]
+            if model is None:
+                y_pred[rows] = classes[0]
+            else:
+                y_pred[rows] = classes[np.asarray(model.predict(X[rows])).reshape(-1)]
+
+        return y_pred
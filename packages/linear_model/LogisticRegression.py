@@ -9,23 +9,38 @@ import numpy as np
 import packages.linear_model.gradient_descent as gd
 from scipy.sparse import csr_matrix
 from scipy.sparse import hstack
+from scipy.sparse import issparse
 
 
 # tested
-def _set_weights(X):
+def _set_weights(X, dtype=np.float64):
     """
     Creates an array of weights with each element set to 0.
 
     :param X: L x J matrix, where L is the number of samples and J is the number of features.
             Assumes X is augmented for w0 already.
+    :param dtype: floating point type of the weights. Default is np.float64.
     :return: J x 1 array
     """
     cols = X.shape[1]
-    return np.zeros(cols)
+    return np.zeros(cols, dtype=dtype)
 
 
 # tested
-def _add_x0(X):
+def _to_dense_weights(w):
+    """
+    Converts weights stored as a sparse 1 x J matrix into a dense array. Dense weights are returned unchanged.
+
+    :param w: J x 1 array or 1 x J sparse matrix
+    :return: J x 1 array
+    """
+    if issparse(w):
+        return w.toarray()[0]
+    return w
+
+
+# tested
+def _add_x0(X, dtype=np.float64):
     """
     Adds a column to the left of matrix X with each element set to 1.
     Todo - make this function work for a single sample
@@ -33,15 +48,16 @@ def _add_x0(X):
 
     :param X: L x J matrix, where L is the number of samples and J is the number of features.
             Assumes X is not augmented for w0 yet.
+    :param dtype: floating point type of the augmented matrix. Default is np.float64.
 
     :return: L x (J+1) matrix
     """
     X_sparse = csr_matrix(X)  # convert to sparse matrix if not already sparse
     rows = X_sparse.shape[0]
-    ones = np.ones(rows)
+    ones = np.ones(rows, dtype=dtype)
 
     # source: https://stackoverflow.com/questions/41937786/add-column-to-a-sparse-matrix
-    X_aug = hstack((ones[:, None], X_sparse))
+    X_aug = hstack((ones[:, None], X_sparse), format='csr', dtype=dtype)
     return X_aug
 
 
@@ -51,16 +67,25 @@ class LogisticRegression:
     """
 
     # tested
-    def __init__(self, eta, epsilon, penalty=None, l2_lambda=0, max_iter=100):
+    def __init__(self, eta, epsilon, penalty=None, l2_lambda=0, max_iter=100, warm_start=False, patience=None,
+                 l1_lambda=0, dtype=np.float64):
         """
         Initializes instance of the class.
 
         :param eta: float, learning rate
         :param epsilon: float, convergence threshold
-        :param penalty: str, penalty type to use. Default is None. Current implementation allows 'l2'.
+        :param penalty: str, penalty type to use. Default is None. Current implementation allows 'l1', 'l2', and
+                'elasticnet' (both l1 and l2).
         :param l2_lambda: float, value of l2 penalty if that penalty is used. Default is 0.
         :param max_iter: int, number of iterations allowed during convergence. Exceeding this number stops the algorithm
                 and returns the current weights at that point. Default is 100.
+        :param warm_start: boolean, if True, fit() starts gradient descent from the weights of the previous fit instead
+                of from zero weights. Default is False.
+        :param patience: int, if validation data is supplied to fit(), training stops once validation recall has not
+                improved for this many iterations. Default is None, which disables early stopping.
+        :param l1_lambda: float, value of l1 penalty if that penalty is used. Default is 0.
+        :param dtype: floating point type used for training and predictions. np.float32 halves memory use and
+                bandwidth compared to the default np.float64.
         """
         self.eta = eta
         self.epsilon = epsilon
@@ -68,32 +93,85 @@ class LogisticRegression:
         self.penalty = penalty
         self.l2_lambda = l2_lambda
         self.max_iter = max_iter
+        self.warm_start = warm_start
+        self.patience = patience
+        self.l1_lambda = l1_lambda
+        self.dtype = dtype
+        self.history = None
 
-    def fit(self, X, y):
+    def fit(self, X, y, X_val=None, y_val=None):
         """
-        Estimates the feature weights using the data.
+        Estimates the feature weights using the data. Convergence history from gradient descent is saved in
+        self.history.
 
         :param X: L x J matrix, where L is the number of samples and J is the number of dimensions in a sample.
                     Assumes X is not augmented.
         :param y: L x 1 matrix, labels for each sample
+        :param X_val: V x J matrix, validation samples used for early stopping. Assumes X_val is not augmented.
+                    Default is None.
+        :param y_val: V x 1 matrix, labels for each validation sample. Default is None.
         :return:
         """
         # append imaginary column X_0=1 to accommodate w_0
-        X_aug = _add_x0(X)
+        X_aug = _add_x0(X, self.dtype)
 
         # convert to sparse matrix
         X_aug_sparse = csr_matrix(X_aug)
 
         # set initial weights
-        weights = _set_weights(X_aug_sparse)
+        weights = self._initial_weights(X_aug_sparse)
+
+        # augment validation data the same way
+        X_val_aug_sparse = None
+        if X_val is not None:
+            X_val_aug_sparse = csr_matrix(_add_x0(X_val, self.dtype))
 
         # perform gradient descent until convergence
-        weights = gd.gradient_descent(X_aug_sparse, y, weights, self.eta, self.epsilon,
-                                      self.penalty, self.l2_lambda, self.max_iter)
+        weights, history = gd.gradient_descent(X_aug_sparse, y, weights, self.eta, self.epsilon,
+                                               self.penalty, self.l2_lambda, self.max_iter,
+                                               X_val_aug_sparse, y_val, self.patience, return_history=True,
+                                               l1_lambda=self.l1_lambda, dtype=self.dtype)
 
         # save weights in this instance
         self.weights = weights
+        self.history = history
+
+        return self
+
+    # tested
+    def _initial_weights(self, X):
+        """
+        Chooses the weights gradient descent starts from. Reuses weights from the previous fit if warm_start is enabled
+        and those weights match the number of features in X. Otherwise all weights are set to 0.
 
+        :param X: L x J matrix, where L is the number of samples and J is the number of features.
+                Assumes X is augmented for w0 already.
+        :return: J x 1 array
+        """
+        if self.warm_start and self.weights is not None and self.weights.shape[-1] == X.shape[1]:
+            return np.copy(_to_dense_weights(self.weights))  # avoid modifying weights of previous fit
+        return _set_weights(X, self.dtype)
+
+    # tested
+    def sparsify(self):
+        """
+        Converts the weights into a 1 x J sparse matrix which stores only nonzero weights. Useful after training with
+        the 'l1' or 'elasticnet' penalty, which set many weights exactly to zero. Reduces model size and speeds up
+        predictions via sparse dot products.
+
+        :return: self
+        """
+        self.weights = csr_matrix(self.weights)
+        return self
+
+    # tested
+    def densify(self):
+        """
+        Converts sparse weights back into a dense array.
+
+        :return: self
+        """
+        self.weights = _to_dense_weights(self.weights)
         return self
 
     # tested
@@ -106,7 +184,7 @@ class LogisticRegression:
         :return: L x 1 vector
         """
         # append imaginary column X_0=1 to accommodate w_0
-        X_aug = _add_x0(X)
+        X_aug = _add_x0(X, self.dtype)
 
         # convert to sparse matrix
         X_aug_sparse = csr_matrix(X_aug)
@@ -129,7 +207,7 @@ class LogisticRegression:
         :return: L x C vector, where C is the number of classes
         """
         # append imaginary column X_0=1 to accommodate w_0
-        X_aug = _add_x0(X)
+        X_aug = _add_x0(X, self.dtype)
 
         # convert to sparse matrix
         X_aug_sparse = csr_matrix(X_aug)
@@ -139,7 +217,7 @@ class LogisticRegression:
 
         # predictions for Y=0
         rows = y1_pred_proba.shape[0]
-        y0_pred_proba = np.ones(rows) - y1_pred_proba
+        y0_pred_proba = np.ones(rows, dtype=y1_pred_proba.dtype) - y1_pred_proba
 
         # combine predictions for each class into a single matrix
         y_pred_proba = np.column_stack((y0_pred_proba, y1_pred_proba))
@@ -4,13 +4,16 @@ Implements Multiclass logistic regression using one-vs-all strategy.
 One-vs-all involves training N distinct binary classifiers, each designed to recognize a specific class, then
  collectively use those N classifiers to predict the correct class.
 
- Implementation augments the data for predictions to accommodate w0 term in the calculations. Data is augmented by
- adding a column of ones as the first column.  Note that data is not augmented for fitting the model because
- LogisticRegression already augments the data for this.
+ Implementation stacks the weights of the N classifiers into a single matrix for predictions, with the w0 terms in the
+ first row. The w0 terms are added separately, so data is not augmented for predictions. Note that data is not augmented
+ for fitting the model because LogisticRegression already augments the data for this.
 """
-from packages.linear_model.LogisticRegression import LogisticRegression
+from packages.linear_model.LogisticRegression import LogisticRegression, _to_dense_weights
 import numpy as np
 import copy
+from scipy.sparse import csr_matrix
+from scipy.sparse import issparse
+from scipy.special import expit
 
 
 # tested
@@ -53,71 +56,100 @@ def _standardize_probabilities(y_pred_proba):
     return standardized
 
 
-def _update_predictions(y_pred, y_pred_proba_highest, y_pred_proba_k, k):
+# tested
+def _stack_weights(classifiers):
     """
-    Efficiently updates label predictions by comparing current highest probabilities for each sample
-    with the predicted probabilities for the kth class. Sets the predicted class to be k for samples where the kth
-    class has a higher probability than the current highest probability.
-
-    Updates highest probabilities for any samples if kth class prediction probabilities are higher.
-
-    :param y_pred: L x 1 array, where L is the number of samples. Represents current class predictions for samples.
-    :param y_pred_proba_highest: L x 1 array. Contains the highest probability found so far for each sample from
-                                among the classes.
-    :param y_pred_proba_k: L x 1 array. Contains prediction probabilities for the kth class.
-    :param k: int, the kth class.
-    :return: None
+    Stacks the weights of the binary classifiers into a single matrix, with the weights of the kth classifier as the
+    kth column. The first row contains the intercepts.
+
+    :param classifiers: List of K fitted LogisticRegression classifiers, ordered by class.
+    :return: J x K array, where J is the number of features in an augmented sample and K is the number of classes.
     """
-    # determine if any probabilities for kth class are higher than the current highest probabilities
-    diff = y_pred_proba_k - y_pred_proba_highest
+    return np.column_stack([_to_dense_weights(classifier.weights) for classifier in classifiers])
 
-    # get indexes of all samples where kth class probability was higher
-    idx = np.argwhere(diff > 0)
 
-    # update those indexes in y_pred to be equal to k
-    y_pred[idx] = k
+# tested, sparse-enabled
+def _calc_scores(X, weights):
+    """
+    Calculates w_0 + SUM_j w_j X_j^L for every sample and every class with a single matrix multiplication.
+    Intercepts are added separately, so X does not need to be augmented.
+
+    :param X: L x (J-1) matrix, where L is the number of samples and J is the number of features in an augmented sample.
+                Assumes X is not augmented.
+    :param weights: J x K array or sparse matrix, where K is the number of classes. First row contains the intercepts.
+    :return: L x K array
+    """
+    X_sparse = csr_matrix(X, dtype=weights.dtype)  # convert to sparse matrix with the precision of the weights
+    scores = X_sparse @ weights[1:]
+    intercepts = weights[0]
+
+    # convert results to dense arrays if weights are sparse
+    if issparse(scores):
+        scores = scores.toarray()
+    if issparse(intercepts):
+        intercepts = intercepts.toarray()[0]
 
-    # update y_pred_proba_highest with higher probabilities from kth class
-    y_pred_proba_highest[idx] = y_pred_proba_k[idx]
+    return scores + intercepts
 
 
 class MulticlassLogisticRegression:
     """
     Implements multiclass logistic regression.
 
-    This version stores the binary Logistic Regression classifiers fit to each class,
-    and it uses the classifiers directly for predictions.
+    This version stores the binary Logistic Regression classifiers fit to each class. For predictions, the weights of
+    all classifiers are stacked into a single J x K matrix so that all classes are scored in a single pass.
     """
 
     # tested
-    def __init__(self, eta, epsilon, penalty=None, l2_lambda=0, max_iter=100, verbose=False):
+    def __init__(self, eta, epsilon, penalty=None, l2_lambda=0, max_iter=100, verbose=False, warm_start=False,
+                 patience=None, l1_lambda=0, dtype=np.float64):
         """
         Initializes an instance.
 
         :param eta: float, learning rate
         :param epsilon: float, convergence threshold
-        :param penalty: str, penalty type to use. Default is None. Current implementation allows 'l2'.
+        :param penalty: str, penalty type to use. Default is None. Current implementation allows 'l1', 'l2', and
+                'elasticnet' (both l1 and l2).
         :param l2_lambda: float, value of l2 penalty if that penalty is used. Default is 0.
         :param max_iter: int, number of iterations allowed during convergence. Exceeding this number stops the algorithm
                 and returns the current weights at that point. Default is 100.
         :param verbose: boolean, print progress updates to the console if True. Default is False.
+        :param warm_start: boolean, if True, fit() starts each binary classifier from the weights of the previous fit
+                instead of from zero weights. Useful when fitting the same data with a sequence of hyperparameters.
+                Default is False.
+        :param patience: int, if validation data is supplied to fit(), training of each binary classifier stops once
+                its validation recall has not improved for this many iterations. Default is None, which disables
+                early stopping.
+        :param l1_lambda: float, value of l1 penalty if that penalty is used. Default is 0.
+        :param dtype: floating point type used for training and predictions. np.float32 halves memory use and
+                bandwidth compared to the default np.float64.
         """
         self.eta = eta
         self.epsilon = epsilon
         self.classifiers = None
+        self.weights = None
         self.penalty = penalty
         self.l2_lambda = l2_lambda
         self.max_iter = max_iter
         self.verbose = verbose
+        self.warm_start = warm_start
+        self.patience = patience
+        self.l1_lambda = l1_lambda
+        self.dtype = dtype
+        self.history = None
 
     # tested, sparse-enabled
-    def fit(self, X, y):
+    def fit(self, X, y, X_val=None, y_val=None):
         """
-        Estimates the feature weights using the data.
+        Estimates the feature weights using the data. Convergence history of each binary classifier is saved in
+        self.history, ordered by class.
 
         :param X: L x J matrix, where L is the number of samples and J is the number of dimensions in a sample.
                     Assumes X is not augmented.
         :param y: L x 1 array, class labels for each sample
+        :param X_val: V x J matrix, validation samples used for early stopping. Assumes X_val is not augmented.
+                    Default is None.
+        :param y_val: V x 1 array, class labels for each validation sample. Default is None.
         :return:
         """
         # determine how many binary classifiers must be trained
@@ -125,6 +157,9 @@ class MulticlassLogisticRegression:
         if self.verbose:
             print('n_classifiers', n_classifiers)
 
+        # previous classifiers can only be reused if they were trained on the same classes
+        reuse_weights = self.warm_start and self.classifiers is not None and len(self.classifiers) == n_classifiers
+
         # train binary classifier for each class
         classifiers = []
         for k in range(n_classifiers):
@@ -136,20 +171,57 @@ class MulticlassLogisticRegression:
                                     epsilon=self.epsilon,
                                     penalty=self.penalty,
                                     l2_lambda=self.l2_lambda,
-                                    max_iter=self.max_iter)
+                                    max_iter=self.max_iter,
+                                    warm_start=self.warm_start,
+                                    patience=self.patience,
+                                    l1_lambda=self.l1_lambda,
+                                    dtype=self.dtype)
+
+            if reuse_weights:
+                lr.weights = self.classifiers[k].weights  # start from weights of previous fit
 
             # convert to binary classes
             y_binary = _convert_to_binary_classes(y, k)
+            y_val_binary = None
+            if y_val is not None:
+                y_val_binary = _convert_to_binary_classes(y_val, k)
 
             # fit binary classifier
-            lr.fit(X, y_binary)
+            lr.fit(X, y_binary, X_val, y_val_binary)
 
             # retain classifier for predictions
             classifiers.append(lr)
 
         # save to instance
         self.classifiers = classifiers
+        self.weights = _stack_weights(classifiers)
+        self.history = [lr.history for lr in classifiers]
+
+        return self
+
+    # tested
+    def sparsify(self):
+        """
+        Converts the stacked weights and the weights of each binary classifier into sparse matrices which store only
+        nonzero weights.
 
+        :return: self
+        """
+        for classifier in self.classifiers:
+            classifier.sparsify()
+        self.weights = csr_matrix(self.weights)
+        return self
+
+    # tested
+    def densify(self):
+        """
+        Converts sparse weights back into dense arrays.
+
+        :return: self
+        """
+        for classifier in self.classifiers:
+            classifier.densify()
+        self.weights = _stack_weights(self.classifiers)
         return self
 
     # tested, sparse-enabled
@@ -161,15 +233,8 @@ class MulticlassLogisticRegression:
                     Assumes X is not augmented.
         :return: L x K matrix, where K is the number of classes.
         """
-        K = len(self.classifiers)
-        N = X.shape[0]
-        y_pred_proba_T = np.zeros((K, N))  # transposed to make row replacement easier
-
-        for k, classifier in enumerate(self.classifiers):
-            predict_proba_k = classifier.predict_proba(X)[:, 1]  # probability of 1 for this class
-            y_pred_proba_T[k] = predict_proba_k
-
-        y_pred_proba = y_pred_proba_T.T
+        scores = _calc_scores(X, self.weights)
+        y_pred_proba = expit(scores)  # numerically stable exp(A) / (1 + exp(A))
         y_pred_proba_standardized = _standardize_probabilities(y_pred_proba)
         return y_pred_proba_standardized
 
@@ -177,18 +242,42 @@ class MulticlassLogisticRegression:
     def predict(self, X):
         """
         Predicts the class which has the highest probability for each sample.
-        Note: Maximum number of allowed classes is 127.
+        Probabilities increase with the score of each class, so the class with the highest score is chosen directly.
 
         :param X: L x J matrix, where L is the number of samples and J is the number of dimensions in a sample.
                     Assumes X is not augmented.
         :return: L x 1 array
         """
-        N = X.shape[0]
-        y_pred_proba_highest = np.zeros((N,))  # contains highest probabilities for each sample so far
-        y_pred = np.zeros((N,), dtype=np.int8)  # doesn't allow more than 127 classes
+        scores = _calc_scores(X, self.weights)
+        return np.argmax(scores, axis=1)
 
-        for k, classifier in enumerate(self.classifiers):
-            predict_proba_k = classifier.predict_proba(X)[:, 1]  # probability of 1 for this class
-            _update_predictions(y_pred, y_pred_proba_highest, predict_proba_k, k)
 
-        return y_pred
+# tested
+def regularization_path(X, y, list_l2_lambda, eta, epsilon, max_iter=100, verbose=False):
+    """
+    Fits a multiclass model with l2 penalty for each lambda, sweeping from the largest lambda to the smallest.
+    Each fit is warm-started from the weights of the previous (more regularized) fit, so later fits typically
+    converge in far fewer iterations than fits started from zero weights.
+
+    :param X: L x J matrix, where L is the number of samples and J is the number of dimensions in a sample.
+                Assumes X is not augmented.
+    :param y: L x 1 array, class labels for each sample
+    :param list_l2_lambda: List, l2 penalty values to fit. Order does not matter.
+    :param eta: float, learning rate
+    :param epsilon: float, convergence threshold
+    :param max_iter: int, number of iterations allowed during convergence for each lambda. Default is 100.
+    :param verbose: boolean, print progress updates to the console if True. Default is False.
+    :return: Single (l2_lambda, fitted MulticlassLogisticRegression) pair each time generator is called, in order of
+            decreasing lambda.
+    """
+    model = MulticlassLogisticRegression(eta=eta,
+                                         epsilon=epsilon,
+                                         penalty='l2',
+                                         max_iter=max_iter,
+                                         verbose=verbose,
+                                         warm_start=True)
+
+    for l2_lambda in sorted(list_l2_lambda, reverse=True):
+        model.l2_lambda = l2_lambda
+        model.fit(X, y)
+        yield l2_lambda, copy.deepcopy(model)  # copy so later fits do not modify models already returned
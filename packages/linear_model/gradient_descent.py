@@ -5,8 +5,11 @@ Assumes "imaginary" X_0 = 1 for all samples has been added to the matrix to acco
  calculations. In other workds, assumes a column of ones has been added as the first column of X.
 """
 
+import time
+
 import numpy as np
 from scipy.sparse import csr_matrix
+from scipy.special import expit
 
 """
 Note 1 - Explanation of _calc_inner()
@@ -225,6 +228,58 @@ def _update_weights_l2(w, eta, gradient, l2_lambda):
     return w_updated
 
 
+# tested, no need to be sparse
+def _soft_threshold(w, threshold):
+    """
+    Applies the soft-thresholding operator, which is the proximal operator of the l1 penalty, to every weight except
+    the intercept w_0:
+
+    w_i <- sign(w_i) * max(|w_i| - threshold, 0)
+
+    Weights with a magnitude below the threshold become exactly zero. The intercept is not penalized.
+
+    :param w: J x 1 array, where J is the number of features in an augmented sample
+    :param threshold: float, amount by which the magnitude of each weight is reduced
+    :return: J x 1 array, thresholded weights
+    """
+    w_thresholded = np.sign(w) * np.maximum(np.abs(w) - threshold, 0)
+    w_thresholded[0] = w[0]  # intercept is not penalized
+    return w_thresholded
+
+
+# tested, no need to be sparse
+def _update_weights_l1(w, eta, gradient, l1_lambda):
+    """
+    Updates regression coefficients using a proximal gradient step for the l1 penalty:
+    W <- S(W + (eta * gradient), eta * l1_lambda), where S is the soft-thresholding operator.
+
+    :param w: J x 1 array, where J is the number of features in an augmented sample
+    :param eta: float, learning rate
+    :param gradient: J x 1 array
+    :param l1_lambda: float, lambda value to use for l1 penalty
+    :return: J x 1 array, updated weights
+    """
+    w_updated = _update_weights(w, eta, gradient)
+    return _soft_threshold(w_updated, eta * l1_lambda)
+
+
+# tested, no need to be sparse
+def _update_weights_elasticnet(w, eta, gradient, l1_lambda, l2_lambda):
+    """
+    Updates regression coefficients using a proximal gradient step for the combined l1 and l2 (elastic-net) penalty:
+    W <- S(W - (eta * l2_lambda * W) + (eta * gradient), eta * l1_lambda), where S is the soft-thresholding operator.
+
+    :param w: J x 1 array, where J is the number of features in an augmented sample
+    :param eta: float, learning rate
+    :param gradient: J x 1 array
+    :param l1_lambda: float, lambda value to use for l1 penalty
+    :param l2_lambda: float, lambda value to use for l2 penalty
+    :return: J x 1 array, updated weights
+    """
+    w_updated = _update_weights_l2(w, eta, gradient, l2_lambda)
+    return _soft_threshold(w_updated, eta * l1_lambda)
+
+
 # tested, sparse-enabled
 def _calc_inner(X, w):
     """
@@ -252,26 +307,16 @@ def get_y_predictions(X, w):
     - L is the number of samples
     - A = w_0 + SUM_j (w_j X_j^L)
 
-    Todo - Figure out whether RuntimeWarning that occurs periodically is a bug or a data issue.
-    gradient_descent.py:316: RuntimeWarning: overflow encountered in exp
-    inner = ones + np.exp(Xw_dense)
-    gradient_descent.py:264: RuntimeWarning: overflow encountered in exp
-    top = np.exp(Xw_dense)
-    gradient_descent.py:267: RuntimeWarning: invalid value encountered in true_divide
-    return top / bottom
+    The logistic sigmoid is evaluated without computing exp(A) directly, which overflows once A exceeds about 88 in
+    single precision (about 709 in double precision).
 
     :param X: L x J matrix, where L is the number of samples and J is the number of features in an augmented sample
     :param w: J x 1 array, where J is the number of features in an augmented sample
     :return:  L x 1 array
     """
-    num_rows = X.shape[0]
-
     Xw = _calc_inner(X, w)
     Xw_dense = Xw.toarray()[0]  # can be converted to dense matrix because Xw is a array not a matrix
-    top = np.exp(Xw_dense)
-    ones = np.ones(num_rows)
-    bottom = ones + top
-    return top / bottom
+    return expit(Xw_dense)  # numerically stable exp(A) / (1 + exp(A)), matching precision of the weights
 
 
 # tested, sparse-enabled
@@ -312,21 +357,15 @@ def _calc_right_half_log_likelihood(X, w):
     Calculates the ln(1 + exp(A)) sum used in log likelihood, where A = w_0 + SUM_j^n w_j X_j^L.
     See Note 3 for details.
 
-    Todo - Most of this is a copy of get_y_predictions(). Move redundant code to separate function.
+    ln(1 + exp(A)) is calculated as ln(exp(0) + exp(A)), which does not overflow for large A.
 
     :param X: L x J matrix, where L is the number of samples and J is the number of features in an augmented sample
     :param w: J x 1 array, where J is the number of features in an augmented sample
     :return: scalar
     """
-    num_rows = X.shape[0]
-
     Xw = _calc_inner(X, w)
     Xw_dense = Xw.toarray()[0]  # can be converted to dense matrix because Xw is a vector
-    top = np.exp(Xw_dense)
-
-    ones = np.ones(num_rows)  # for each sample
-    bottom = ones + top
-    ln_Xw = np.log(bottom)
+    ln_Xw = np.logaddexp(0, Xw_dense)  # for each sample, matching precision of the weights
     return np.sum(ln_Xw)  # sum over L samples
 
 
@@ -349,27 +388,105 @@ def _calc_log_likelihood(X, y_true, w):
     return sum_1 - sum_2
 
 
-def gradient_descent(X, y_true, w, eta, epsilon, penalty=None, l2_lambda=0, max_iter=100):
+# tested, sparse-enabled
+def _calc_recall(X, y_true, w):
     """
-    Performs gradient descent to derive optimal regression coefficients.
+    Calculates recall of the positive class, TP / (TP + FN), where predicted labels are the rounded prediction
+    probabilities. Recall is defined as 0 if there are no positive samples.
+
+    :param X: L x J matrix, where L is the number of samples and J is the number of features in an augmented sample
+    :param y_true: L x 1 array of binary values
+    :param w: J x 1 array, where J is the number of features in an augmented sample
+    :return: float
+    """
+    n_positive = np.sum(y_true)
+    if n_positive == 0:
+        return 0.0
+
+    y_pred = np.round(get_y_predictions(X, w))
+    n_true_positive = np.sum(y_pred * y_true)
+    return n_true_positive / n_positive
+
+
+def gradient_descent(X, y_true, w, eta, epsilon, penalty=None, l2_lambda=0, max_iter=100, X_val=None, y_val=None,
+                     patience=None, return_history=False, l1_lambda=0, dtype=np.float64):
+    """
+    Performs gradient descent to derive optimal regression coefficients. The 'l1' and 'elasticnet' penalties use
+    proximal gradient steps, which set weights exactly to zero and produce sparse weight vectors. Raises ValueError if
+    either of them is used without a positive l1_lambda, since the fit would not be regularized.
+
+    All arrays are converted to the given floating point type before descending. Using np.float32 halves the memory
+    traffic of the sparse matrix multiplications which dominate training time.
+
+    If validation data and patience are supplied, training also stops once recall on the validation data has not
+    improved for patience consecutive iterations. The weights with the best validation recall are returned.
+
+    History is a dictionary with the following keys:
+    - 'log_likelihood': List, log likelihood of the training data after each iteration
+    - 'gradient_norm': List, Euclidean norm of the gradient calculated in each iteration
+    - 'step_size': List, Euclidean norm of the change in weights made in each iteration
+    - 'wall_time': List, seconds elapsed since the start of gradient descent at the end of each iteration
+    - 'val_recall': List, recall on the validation data after each iteration. Empty if X_val is None.
+    - 'n_iter': int, number of iterations performed
+    - 'stop_reason': str, one of 'converged', 'max_iter', 'early_stopping', or 'diverged'
+
+    Descent stops with stop_reason 'diverged' if the log likelihood stops being finite. The last weights with a finite
+    log likelihood are returned.
 
     :param X: L x J matrix, where L is the number of samples and J is the number of features in an augmented sample
     :param y_true: L x 1 array
     :param w: J x 1 array, where J is the number of features in an augmented sample
     :param eta: float, learning rate
     :param epsilon: float, convergence threshold
-    :param penalty: str, penalty type to use. Default is None. Current implementation allows 'l2'.
+    :param penalty: str, penalty type to use. Default is None. Current implementation allows 'l1', 'l2', and
+            'elasticnet' (both l1 and l2).
     :param l2_lambda: float, value of l2 penalty if that penalty is used. Default is 0.
     :param max_iter: int, number of iterations allowed during convergence. Exceeding this number stops the algorithm
             and returns the current weights at that point. Default is 100.
-    :return: J x 1 array, weight of each feature at convergence, including the intercept
+    :param X_val: V x J matrix, validation samples used to monitor recall. Assumes X_val is augmented.
+            Default is None.
+    :param y_val: V x 1 array, labels of validation samples. Default is None.
+    :param patience: int, number of iterations without improvement in validation recall allowed before stopping.
+            Ignored if X_val is None. Default is None, which disables early stopping.
+    :param return_history: boolean, if True, returns a dictionary of convergence history along with the weights.
+            Default is False.
+    :param l1_lambda: float, value of l1 penalty if that penalty is used. Default is 0.
+    :param dtype: floating point type used for data, labels, and weights. Default is np.float64.
+    :return: J x 1 array, weight of each feature at convergence, including the intercept.
+            If return_history is True, returns (weights, history) Tuple.
     """
+    if penalty in ('l1', 'elasticnet') and l1_lambda <= 0:
+        raise ValueError('l1_lambda must be positive for penalty:', penalty, l1_lambda)
+
+    # convert to requested precision once, rather than in each iteration
+    X = csr_matrix(X, dtype=dtype)
+    y_true = np.asarray(y_true, dtype=dtype)
+    if X_val is not None:
+        X_val = csr_matrix(X_val, dtype=dtype)
+        y_val = np.asarray(y_val, dtype=dtype)
+
     # set initial weights
-    weights = w
+    weights = np.asarray(w, dtype=dtype)
 
     # calculate original log likelihood
     prev_log_likelihood = _calc_log_likelihood(X, y_true, weights)
 
+    # prepare convergence history
+    history = {'log_likelihood': [],
+               'gradient_norm': [],
+               'step_size': [],
+               'wall_time': [],
+               'val_recall': [],
+               'n_iter': 0,
+               'stop_reason': 'converged'}
+    start_time = time.perf_counter()
+
+    # prepare early stopping
+    early_stopping = X_val is not None and patience is not None
+    best_recall = -np.Inf
+    best_weights = weights
+    n_without_improvement = 0
+
     # perform gradient descent
     count = 0
     diff = np.Inf  # dummy value to start loop
@@ -378,6 +495,7 @@ def gradient_descent(X, y_true, w, eta, epsilon, penalty=None, l2_lambda=0, max_
         count += 1
         if count > max_iter:
             print('STOP: TOTAL NO. of ITERATIONS REACHED LIMIT.')
+            history['stop_reason'] = 'max_iter'
             break  # stop descending
 
         # calculate gradient
@@ -385,16 +503,57 @@ def gradient_descent(X, y_true, w, eta, epsilon, penalty=None, l2_lambda=0, max_
         gradient = _calc_gradient(X, y_true, y_pred)
 
         # update weights
+        prev_weights = weights
         if penalty == 'l2':
             weights = _update_weights_l2(weights, eta, gradient, l2_lambda)
+        elif penalty == 'l1':
+            weights = _update_weights_l1(weights, eta, gradient, l1_lambda)
+        elif penalty == 'elasticnet':
+            weights = _update_weights_elasticnet(weights, eta, gradient, l1_lambda, l2_lambda)
         else:
             weights = _update_weights(weights, eta, gradient)
 
         # calculate improvement
         log_likelihood = _calc_log_likelihood(X, y_true, weights)
         diff = np.abs(prev_log_likelihood - log_likelihood)
+        if not np.all(np.isfinite(diff)):
+            print('STOP: LOG LIKELIHOOD IS NOT FINITE.')
+            history['stop_reason'] = 'diverged'
+            weights = prev_weights
+            break  # stop descending, NaN would otherwise end the loop as if it had converged
 
         # save log likelihood for next round
         prev_log_likelihood = log_likelihood
 
+        # record progress
+        history['log_likelihood'].append(float(np.squeeze(log_likelihood)))  # scalar stored as 1 x 1 array
+        history['gradient_norm'].append(float(np.linalg.norm(gradient)))
+        history['step_size'].append(float(np.linalg.norm(weights - prev_weights)))
+        history['wall_time'].append(time.perf_counter() - start_time)
+        history['n_iter'] = count
+
+        # check held-out performance
+        if X_val is not None:
+            recall = _calc_recall(X_val, y_val, weights)
+            history['val_recall'].append(float(recall))
+
+            if early_stopping:
+                if recall > best_recall:
+                    best_recall = recall
+                    best_weights = weights
+                    n_without_improvement = 0
+                else:
+                    n_without_improvement += 1
+
+                if n_without_improvement >= patience:
+                    print('STOP: VALIDATION RECALL DID NOT IMPROVE FOR {} ITERATIONS.'.format(patience))
+                    history['stop_reason'] = 'early_stopping'
+                    break  # stop descending
+
+    # keep weights which performed best on held-out data
+    if early_stopping and history['n_iter'] > 0:
+        weights = best_weights
+
+    if return_history:
+        return weights, history
     return weights
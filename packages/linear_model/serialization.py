@@ -0,0 +1,192 @@
+"""
+Saves and loads trained LogisticRegression and MulticlassLogisticRegression models.
+
+A saved model is a directory containing:
+- weights.npy: dense weights (J x 1 for LogisticRegression, J x K for MulticlassLogisticRegression), or
+- weights.npz: weights saved as a sparse matrix, for models which were sparsified before saving
+- categories.npz: kmers of the encoded columns, if given, so new fragments can be encoded with the same columns
+- model.json: model type, hyperparameters, encoding parameters (k, sample length), class labels, and any other
+    training metadata
+
+Dense weights are saved as a plain .npy file so that loading memory-maps the file instead of reading it, which makes
+loading take milliseconds regardless of the number of features.
+"""
+import json
+import os
+
+import numpy as np
+from scipy.sparse import issparse, load_npz, save_npz
+
+from packages.linear_model.LogisticRegression import LogisticRegression
+from packages.linear_model.MulticlassLogisticRegression import MulticlassLogisticRegression
+
+FORMAT_VERSION = 1
+WEIGHTS_DENSE = 'weights.npy'
+WEIGHTS_SPARSE = 'weights.npz'
+MODEL_FILE = 'model.json'
+CATEGORIES_FILE = 'categories.npz'
+
+
+# tested
+def _get_params(model):
+    """
+    Collects the hyperparameters needed to recreate the model.
+
+    :param model: LogisticRegression or MulticlassLogisticRegression
+    :return: dictionary of hyperparameters
+    """
+    params = {'eta': model.eta,
+              'epsilon': model.epsilon,
+              'penalty': model.penalty,
+              'l2_lambda': model.l2_lambda,
+              'l1_lambda': model.l1_lambda,
+              'max_iter': model.max_iter,
+              'warm_start': model.warm_start,
+              'patience': model.patience,
+              'dtype': np.dtype(model.dtype).name}
+
+    if isinstance(model, MulticlassLogisticRegression):
+        params['verbose'] = model.verbose
+
+    return params
+
+
+# tested
+def _build_model(model_type, params):
+    """
+    Creates an unfitted model of the given type from saved hyperparameters.
+
+    :param model_type: str, name of the model class
+    :param params: dictionary of hyperparameters
+    :return: LogisticRegression or MulticlassLogisticRegression
+    """
+    params = dict(params)
+    params['dtype'] = np.dtype(params['dtype']).type
+
+    if model_type == 'LogisticRegression':
+        return LogisticRegression(**params)
+    elif model_type == 'MulticlassLogisticRegression':
+        return MulticlassLogisticRegression(**params)
+    else:
+        raise ValueError('Unknown model type:', model_type)
+
+
+# tested
+def _set_classifiers(model):
+    """
+    Rebuilds the binary classifiers of a multiclass model from its stacked weights, so that the loaded model behaves
+    the same as the model which was saved (i.e. for warm starts). The kth classifier receives the kth column of weights.
+
+    :param model: MulticlassLogisticRegression with weights set
+    :return: None
+    """
+    params = _get_params(model)
+    del params['verbose']  # binary classifiers do not print progress
+
+    classifiers = []
+    for k in range(model.weights.shape[1]):
+        lr = _build_model('LogisticRegression', params)
+        if issparse(model.weights):
+            lr.weights = model.weights[:, k].T.tocsr()  # 1 x J sparse matrix, as produced by sparsify()
+        else:
+            lr.weights = model.weights[:, k]
+        classifiers.append(lr)
+
+    model.classifiers = classifiers
+
+
+def save_model(model, path, classes=None, k=None, sample_length=None, metadata=None, categories=None):
+    """
+    Saves a trained model to the given directory. The directory is created if it does not exist.
+
+    :param model: fitted LogisticRegression or MulticlassLogisticRegression
+    :param path: str, directory where the model should be written
+    :param classes: L x 1 array, original class label for each encoded class (i.e. LabelEncoder.classes_), so the
+            kth entry is the taxid predicted as class k. Default is None.
+    :param k: int, size of k-mers used to encode the training data. Default is None.
+    :param sample_length: int, length of fragments used to train the model. Default is None.
+    :param metadata: dictionary of other JSON-serializable training information (i.e. coverage, score).
+            Default is None.
+    :param categories: List of arrays, kmers of the encoded columns of each kmer position
+            (i.e. OneHotEncoder.categories_, see encoding2.encode_fragment_dataset()). Default is None.
+    :return: None
+    """
+    if model.weights is None:
+        raise ValueError('Model must be fit before it can be saved.')
+
+    os.makedirs(path, exist_ok=True)
+
+    # write weights
+    if issparse(model.weights):
+        save_npz(os.path.join(path, WEIGHTS_SPARSE), model.weights.tocsr(), compressed=False)
+        weights_file = WEIGHTS_SPARSE
+    else:
+        np.save(os.path.join(path, WEIGHTS_DENSE), np.asarray(model.weights))
+        weights_file = WEIGHTS_DENSE
+
+    # write kmers of the encoded columns
+    categories_file = None
+    if categories is not None:
+        np.savez(os.path.join(path, CATEGORIES_FILE), *[np.asarray(each).astype(str) for each in categories])
+        categories_file = CATEGORIES_FILE
+
+    # write description of the model
+    description = {'format_version': FORMAT_VERSION,
+                   'model': type(model).__name__,
+                   'params': _get_params(model),
+                   'weights': weights_file,
+                   'encoding': {'k': k, 'sample_length': sample_length, 'categories': categories_file},
+                   'classes': None if classes is None else np.asarray(classes).tolist(),
+                   'metadata': metadata or {}}
+
+    with open(os.path.join(path, MODEL_FILE), 'w') as f:
+        json.dump(description, f, indent=2)
+
+
+def load_model(path, mmap=True):
+    """
+    Loads a model saved by save_model().
+
+    Information saved with the model is returned as a dictionary with the following keys:
+    - 'classes': array of original class labels, or None
+    - 'k': int, size of k-mers used to encode the training data, or None
+    - 'sample_length': int, length of fragments used to train the model, or None
+    - 'categories': List of arrays, kmers of the encoded columns of each kmer position, or None
+    - 'metadata': dictionary of other training information
+
+    :param path: str, directory where the model was written
+    :param mmap: boolean, if True, dense weights are memory-mapped as a read-only array rather than read into memory.
+            Default is True.
+    :return: (model, dictionary) Tuple representing (fitted model, information saved with the model)
+    """
+    with open(os.path.join(path, MODEL_FILE)) as f:
+        description = json.load(f)
+
+    if description['format_version'] != FORMAT_VERSION:
+        raise ValueError('Unsupported model format version:', description['format_version'])
+
+    model = _build_model(description['model'], description['params'])
+
+    # read weights
+    weights_file = os.path.join(path, description['weights'])
+    if description['weights'] == WEIGHTS_SPARSE:
+        model.weights = load_npz(weights_file).tocsr()
+    else:
+        model.weights = np.load(weights_file, mmap_mode='r' if mmap else None)
+
+    if isinstance(model, MulticlassLogisticRegression):
+        _set_classifiers(model)
+
+    categories = None
+    if description['encoding'].get('categories') is not None:
+        with np.load(os.path.join(path, description['encoding']['categories'])) as f:
+            categories = [f['arr_{}'.format(i)] for i in range(len(f.files))]
+
+    classes = description['classes']
+    info = {'classes': None if classes is None else np.array(classes),
+            'k': description['encoding']['k'],
+            'sample_length': description['encoding']['sample_length'],
+            'categories': categories,
+            'metadata': description['metadata']}
+
+    return model, info
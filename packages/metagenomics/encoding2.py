@@ -4,8 +4,14 @@ Grouping of data into kmers is performed using vector operations.
 """
 import numpy as np
 import math
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.sparse import csr_matrix
 from sklearn.preprocessing import OneHotEncoder
 
+# maps each byte to the 2-bit code of its nucleotide (a=0, c=1, g=2, t=3); all other bytes map to 4
+NUCLEOTIDE_CODES = np.full(256, 4, dtype=np.uint8)
+NUCLEOTIDE_CODES[np.frombuffer(b'acgtACGT', dtype=np.uint8)] = [0, 1, 2, 3, 0, 1, 2, 3]
+
 
 # tested
 def _get_kmer_start(k, i):
@@ -98,20 +104,200 @@ def _group_kmers(fragments, k):
 
 
 # tested
-def encode_fragment_dataset(fragments, k):
+def encode_fragment_dataset(fragments, k, dtype=np.float64, return_categories=False):
     """
     Converts fragments into k-mers and encodes the kmers using one-hot encoding.
     Todo - Consider moving astype into internal methods
 
     :param fragments: fragment to be split
     :param k: size of elements fragment should be split into
-    :return: (sparse matrix, n x 1 array) Tuple representing (encoded kmers, taxids)
+    :param dtype: type of the values stored in the sparse matrix. Values are all ones, so compact types such as
+            np.float32 or np.uint8 reduce memory use. Default is np.float64.
+    :param return_categories: boolean, if True, also returns the kmers of the encoded columns, which are needed to
+            encode other fragments with the same columns. Default is False.
+    :return: (sparse matrix, n x 1 array) Tuple representing (encoded kmers, taxids), or
+            (sparse matrix, n x 1 array, List of arrays) Tuple representing (encoded kmers, taxids, sorted kmers
+            encoded for each kmer position, i.e. OneHotEncoder.categories_) if return_categories is True
     """
 
     # generate k_mers
     X, y = _group_kmers(fragments, k)
 
     # encode data using one-hot encoding
-    X_enc = OneHotEncoder().fit_transform(X.astype('str'))
+    encoder = OneHotEncoder(dtype=dtype)
+    X_enc = encoder.fit_transform(X.astype('str'))
 
+    if return_categories:
+        return X_enc, y.astype('str'), [each.astype('str') for each in encoder.categories_]
     return X_enc, y.astype('str')
+
+
+# tested
+def _get_nucleotide_codes(fragments):
+    """
+    Converts the sequence columns of the fragments into 2-bit nucleotide codes (a=0, c=1, g=2, t=3).
+    Raises ValueError if fragments contain letters other than a, c, g, or t.
+
+    :param fragments: n x (L+1) array, where n is the number of fragments and L is the sample length
+    :return: n x L array of codes
+    """
+    letters = np.ascontiguousarray(fragments[:, :-1]).astype('S1').view(np.uint8)
+    codes = NUCLEOTIDE_CODES[letters]
+
+    if np.any(codes == 4):
+        raise ValueError('Fragments contain letters other than a, c, g, or t.')
+
+    return codes
+
+
+# tested
+def _get_kmer_codes(fragments, k):
+    """
+    Converts each whole kmer in the fragments into an integer by reading its nucleotide codes as a base-4 number
+    (i.e. 'ac' -> 0 * 4 + 1 = 1). Follows the same grouping into kmers as _group_kmers(). Removes partial kmers.
+
+    :param fragments: n x (L+1) array, where n is the number of fragments and L is the sample length
+    :param k: int, length of kmer
+    :return: n x n_kmer array of integers in [0, 4^k)
+    """
+    n_fragments = len(fragments)
+    n_kmers = _calculate_number_kmers(fragments, k)
+
+    codes = _get_nucleotide_codes(fragments)[:, :n_kmers * k].astype(np.int64)
+    powers = 4 ** np.arange(k - 1, -1, -1, dtype=np.int64)  # place value of each letter in the kmer
+    return codes.reshape(n_fragments, n_kmers, k) @ powers
+
+
+# tested
+def encode_fragment_dataset_fixed_width(fragments, k, dtype=np.float64):
+    """
+    Converts fragments into k-mers and encodes the kmers using one-hot encoding over every possible kmer, rather than
+    only the kmers seen in the data. The ith kmer of a fragment sets column i * 4^k + (integer code of the kmer).
+
+    Unlike encode_fragment_dataset(), the columns depend only on the sample length and k. Fragments encoded separately
+    (i.e. one fragment file at a time) therefore share the same columns and can be used with models trained
+    incrementally.
+
+    :param fragments: n x (L+1) array, where n is the number of fragments and L is the sample length
+    :param k: size of elements fragment should be split into
+    :param dtype: type of the values stored in the sparse matrix. Default is np.float64.
+    :return: (sparse matrix, n x 1 array) Tuple representing (encoded kmers, taxids)
+    """
+    n_fragments = len(fragments)
+    n_kmers = _calculate_number_kmers(fragments, k)
+    n_categories = 4 ** k
+
+    # one nonzero column per kmer
+    kmer_codes = _get_kmer_codes(fragments, k)
+    columns = (np.arange(n_kmers, dtype=np.int64) * n_categories + kmer_codes).reshape(-1)
+    indptr = np.arange(0, n_fragments * n_kmers + 1, n_kmers, dtype=np.int64)
+    data = np.ones(n_fragments * n_kmers, dtype=dtype)
+
+    X_enc = csr_matrix((data, columns, indptr), shape=(n_fragments, n_kmers * n_categories))
+    return X_enc, fragments[:, -1].astype('str')
+
+
+# tested
+def get_sliding_kmer_codes(codes, k):
+    """
+    Converts every overlapping kmer of a sequence (or of each row of equal-length sequences) into an integer, reading
+    its nucleotide codes as a base-4 number (i.e. 'ac' -> 0 * 4 + 1 = 1). Codes are built with one vectorized pass per
+    letter of the kmer, so no n x k intermediate array is created.
+
+    Kmers containing letters other than a, c, g, or t are marked as invalid rather than raising an error, so whole
+    genomes can be processed.
+
+    :param codes: n x L array of nucleotide codes (see NUCLEOTIDE_CODES), or L x 1 array for a single sequence
+    :param k: int, length of kmer, at most 32 so that codes fit in 64 bits
+    :return: (n x (L-k+1) array, n x (L-k+1) array) Tuple representing (uint64 kmer codes, boolean mask of valid
+            kmers). Arrays are 1D if codes is 1D.
+    """
+    if not 0 < k <= 32:
+        raise ValueError('k must be between 1 and 32:', k)
+
+    codes = np.asarray(codes)
+    n_kmers = max(codes.shape[-1] - k + 1, 0)
+
+    kmer_codes = np.zeros(codes.shape[:-1] + (n_kmers,), dtype=np.uint64)
+    n_invalid = np.zeros(codes.shape[:-1] + (n_kmers,), dtype=np.int64)
+    for j in range(k):
+        letters = codes[..., j:j + n_kmers]
+        kmer_codes <<= np.uint64(2)
+        kmer_codes |= (letters & 3).astype(np.uint64)
+        n_invalid += letters == 4
+
+    return kmer_codes, n_invalid == 0
+
+
+# tested
+def _hash_kmer_codes(kmer_codes):
+    """
+    Scrambles kmer codes with an invertible 64-bit mixing function, so that minimizers are not biased towards kmers
+    with many a's (which have the smallest codes).
+
+    :param kmer_codes: array of uint64 kmer codes
+    :return: array of uint64 hashes
+    """
+    h = np.array(kmer_codes, dtype=np.uint64)
+    h ^= h >> np.uint64(33)
+    h *= np.uint64(0xff51afd7ed558ccd)
+    h ^= h >> np.uint64(33)
+    return h
+
+
+# tested
+def get_minimizers(kmer_codes, valid, w):
+    """
+    Selects the minimizers of a sequence (or of each row of equal-length sequences): the kmer with the smallest hash in
+    every window of w consecutive kmers (see Roberts et al., https://doi.org/10.1093/bioinformatics/bth408).
+    Neighboring windows usually share their minimizer, so about 2 / (w + 1) of the kmers are selected, and any two
+    sequences sharing w + k - 1 consecutive letters share a minimizer.
+
+    Window minima are found with a single argmin over a sliding window view of the hashes, without copying windows.
+
+    :param kmer_codes: n x m array of uint64 kmer codes, or m x 1 array for a single sequence
+            (see get_sliding_kmer_codes())
+    :param valid: boolean array of the same shape, False for kmers which must not be selected
+    :param w: int, number of consecutive kmers in each window. w=1 selects every valid kmer.
+    :return: boolean array of the same shape, True for selected kmers
+    """
+    if w < 1:
+        raise ValueError('Window size must be at least 1:', w)
+
+    hashes = _hash_kmer_codes(kmer_codes)
+    hashes[~valid] = np.iinfo(np.uint64).max  # invalid kmers are only chosen if a whole window is invalid
+
+    selected = np.zeros(hashes.shape, dtype=bool)
+    n_windows = hashes.shape[-1] - w + 1
+    if n_windows <= 0:
+        return selected
+
+    positions = sliding_window_view(hashes, w, axis=-1).argmin(axis=-1) + np.arange(n_windows)
+    np.put_along_axis(selected, positions, True, axis=-1)
+    return selected & valid
+
+
+# tested
+def encode_fragment_dataset_minimizers(fragments, k, w=1, dtype=np.float64):
+    """
+    Encodes fragments as counts of their minimizers (see get_minimizers()), with one column for every possible kmer.
+    Rows have about 2 / (w + 1) as many nonzero values as counts of all overlapping kmers, which reduces memory use and
+    training time. Columns depend only on k, so fragments of any length encoded separately share the same columns.
+
+    :param fragments: n x (L+1) array, where n is the number of fragments and L is the sample length
+    :param k: int, length of kmer
+    :param w: int, number of consecutive kmers in each minimizer window. Default is 1, which counts every kmer.
+    :param dtype: type of the values stored in the sparse matrix. Default is np.float64.
+    :return: (sparse matrix, n x 1 array) Tuple representing (encoded kmers, taxids)
+    """
+    n_fragments = len(fragments)
+    letters = np.ascontiguousarray(fragments[:, :-1]).astype('S1').view(np.uint8)
+    kmer_codes, valid = get_sliding_kmer_codes(NUCLEOTIDE_CODES[letters], k)
+
+    rows, positions = np.nonzero(get_minimizers(kmer_codes, valid, w))
+    columns = kmer_codes[rows, positions].astype(np.int64)
+
+    # duplicate (row, column) entries are summed into counts
+    X_enc = csr_matrix((np.ones(len(rows), dtype=dtype), (rows, columns)), shape=(n_fragments, 4 ** k))
+    X_enc.sum_duplicates()
+    return X_enc, fragments[:, -1].astype('str')
@@ -0,0 +1,131 @@
+"""
+Defines evaluation functionality for metagenomics classifiers at several taxonomic ranks.
+
+Predictions are compared once at the rank the model was trained on (i.e. species). Confusion matrices at higher ranks
+(i.e. genus) are computed from that confusion matrix by adding up the rows and columns of labels which share an
+ancestor, using an array which maps each label to its ancestor (see taxonomy.py). Recall, precision, and F1 are
+weighted by the number of true samples of each label, matching recall_score(average='weighted') in sklearn.
+"""
+import numpy as np
+
+from packages.metagenomics import taxonomy
+
+UNKNOWN = 'unknown'  # ancestor of predicted taxids which are not in the taxonomy
+
+
+# tested
+def calc_confusion_matrix(y_true, y_pred, labels=None):
+    """
+    Counts samples for each (true label, predicted label) pair with a single bincount.
+
+    :param y_true: L x 1 array, true labels
+    :param y_pred: L x 1 array, predicted labels
+    :param labels: K x 1 sorted array, labels of the rows and columns of the matrix. Default is None, in which case
+            the sorted union of true and predicted labels is used.
+    :return: (K x 1 array, K x K array) Tuple representing (labels, confusion matrix) where entry (i, j) is the number
+            of samples of label i predicted as label j
+    """
+    y_true = np.asarray(y_true).reshape(-1)
+    y_pred = np.asarray(y_pred).reshape(-1)
+    if labels is None:
+        labels = np.union1d(y_true, y_pred)
+
+    n_labels = len(labels)
+    true_idx = np.searchsorted(labels, y_true)
+    pred_idx = np.searchsorted(labels, y_pred)
+
+    counts = np.bincount(true_idx * n_labels + pred_idx, minlength=n_labels * n_labels)
+    return labels, counts.reshape(n_labels, n_labels)
+
+
+# tested
+def aggregate_confusion_matrix(confusion, ancestor_idx, n_ancestors):
+    """
+    Builds the confusion matrix of a higher rank by adding the counts of all (true label, predicted label) pairs which
+    map to the same pair of ancestors. A prediction is correct at the higher rank if it has the same ancestor as the
+    true label.
+
+    :param confusion: K x K array, confusion matrix of the labels
+    :param ancestor_idx: K x 1 array, index of the ancestor of each label
+    :param n_ancestors: int, number of ancestors G
+    :return: G x G array
+    """
+    pair_idx = ancestor_idx.reshape(-1, 1) * n_ancestors + ancestor_idx.reshape(1, -1)
+    counts = np.bincount(pair_idx.reshape(-1), weights=confusion.reshape(-1), minlength=n_ancestors * n_ancestors)
+    return counts.reshape(n_ancestors, n_ancestors).astype(confusion.dtype)
+
+
+# tested
+def calc_metrics(confusion):
+    """
+    Calculates recall, precision, and F1 for each label, and their averages weighted by the number of true samples of
+    each label. Metrics with a zero denominator are set to zero.
+
+    :param confusion: K x K array, confusion matrix
+    :return: dictionary with keys 'recall', 'precision', and 'f1' (weighted averages), and 'support', 'label_recall',
+            'label_precision', and 'label_f1' (K x 1 arrays)
+    """
+    true_positives = np.diag(confusion).astype(np.float64)
+    support = confusion.sum(axis=1)
+    predicted = confusion.sum(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        recall = np.where(support > 0, true_positives / support, 0.0)
+        precision = np.where(predicted > 0, true_positives / predicted, 0.0)
+        f1 = np.where(recall + precision > 0, 2 * recall * precision / (recall + precision), 0.0)
+
+    total = support.sum()
+    weights = support / total if total > 0 else np.zeros(len(support))
+    return {'recall': float(recall @ weights),
+            'precision': float(precision @ weights),
+            'f1': float(f1 @ weights),
+            'support': support,
+            'label_recall': recall,
+            'label_precision': precision,
+            'label_f1': f1}
+
+
+# tested
+def evaluate_ranks(y_true, y_pred, tax, rank='species', ranks=None):
+    """
+    Evaluates predictions at the rank they were made and at higher ranks. The confusion matrix is counted once at the
+    given rank, then aggregated for each higher rank (see aggregate_confusion_matrix()).
+
+    True taxids must be in the taxonomy. Predicted taxids which are not (i.e. kmer_index.UNCLASSIFIED) have UNKNOWN as
+    their ancestor at every higher rank, so they are always counted as wrong.
+
+    :param y_true: L x 1 array, true taxids of the given rank
+    :param y_pred: L x 1 array, predicted taxids of the given rank
+    :param tax: DataFrame, as returned by taxonomy.read_taxonomy()
+    :param rank: str, rank of the taxids. Default is 'species'.
+    :param ranks: List, ranks to evaluate. Must not be lower than the given rank. Default is None, in which case the
+            given rank and all higher ranks are evaluated.
+    :return: dictionary where keys are ranks and values are dictionaries of metrics (see calc_metrics()), which also
+            contain 'labels' and 'confusion_matrix'
+    """
+    if ranks is None:
+        ranks = taxonomy.RANKS[taxonomy.RANKS.index(rank):]
+
+    y_true = np.asarray(y_true).astype(str).reshape(-1)
+    y_pred = np.asarray(y_pred).astype(str).reshape(-1)
+    labels, confusion = calc_confusion_matrix(y_true, y_pred)
+
+    results = {}
+    for each in ranks:
+        if each == rank:
+            rank_labels, rank_confusion = labels, confusion
+        else:
+            # map each label to its ancestor once; samples are not revisited
+            ancestors = taxonomy.map_to_rank(labels, tax, rank, each, missing=UNKNOWN)
+            unknown_true = (ancestors == UNKNOWN) & np.isin(labels, y_true)
+            if np.any(unknown_true):
+                raise ValueError('Taxids not found in taxonomy:', labels[unknown_true])
+            rank_labels, ancestor_idx = np.unique(ancestors, return_inverse=True)
+            rank_confusion = aggregate_confusion_matrix(confusion, ancestor_idx.reshape(-1), len(rank_labels))
+
+        metrics = calc_metrics(rank_confusion)
+        metrics['labels'] = rank_labels
+        metrics['confusion_matrix'] = rank_confusion
+        results[each] = metrics
+
+    return results
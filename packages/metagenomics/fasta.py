@@ -0,0 +1,119 @@
+"""
+Defines a fast reader for .fasta files which does not create Bio.SeqIO record objects.
+
+The file is memory-mapped and record boundaries are found with a single vectorized search for '>' at the start of a
+line. The resulting offset table allows random access to any record. Each sequence is returned as a lowercase uint8
+array of ASCII letters (i.e. b'a' = 97), with line breaks removed, without building intermediate Python strings.
+Record ids are the first word of each header line, matching the record ids given by Bio.SeqIO.
+"""
+import mmap
+
+import numpy as np
+
+# maps each byte to its lowercase byte
+LOWERCASE = np.arange(256, dtype=np.uint8)
+LOWERCASE[ord('A'):ord('Z') + 1] += ord('a') - ord('A')
+
+NEWLINE = ord('\n')
+CARRIAGE_RETURN = ord('\r')
+
+
+# tested
+def _find_record_starts(data):
+    """
+    Finds the position of every '>' which starts a line.
+
+    :param data: n x 1 uint8 array, contents of the file
+    :return: array of positions
+    """
+    starts = np.flatnonzero(data == ord('>'))
+    at_line_start = np.ones(len(starts), dtype=bool)
+    at_line_start[starts > 0] = data[starts[starts > 0] - 1] == NEWLINE
+    return starts[at_line_start]
+
+
+class FastaFile:
+    """
+    Memory-mapped .fasta file with an offset table of its records.
+    """
+
+    def __init__(self, path):
+        """
+        Opens the file and builds the offset table.
+
+        :param path: str, path to .fasta file
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._mmap = None  # empty files cannot be memory-mapped
+        self._data = np.frombuffer(self._mmap, dtype=np.uint8) if self._mmap is not None else np.empty(0, np.uint8)
+
+        # header of each record runs from its '>' to the end of the line; sequence runs to the next record
+        header_starts = _find_record_starts(self._data)
+        header_ends = np.array([self._find_line_end(start) for start in header_starts], dtype=np.int64)
+        seq_ends = np.append(header_starts, len(self._data))[1:]
+        self.offsets = np.column_stack((header_starts, header_ends + 1, seq_ends))
+        self.ids = [(self._data[start + 1:end].tobytes().decode().split() or [''])[0]
+                    for start, end in zip(header_starts, header_ends)]
+
+    def _find_line_end(self, start):
+        """
+        Finds the end of the line beginning at the given position.
+
+        :param start: int, position in the file
+        :return: int, position of the newline, or the end of the file
+        """
+        end = self._mmap.find(b'\n', start)
+        return len(self._data) if end == -1 else end
+
+    def __len__(self):
+        return len(self.offsets)
+
+    # tested
+    def __getitem__(self, i):
+        """
+        Reads the ith sequence.
+
+        :param i: int, index of the record in the file
+        :return: L x 1 uint8 array of lowercase letters
+        """
+        _, seq_start, seq_end = self.offsets[i]
+        region = self._data[seq_start:seq_end]
+        return LOWERCASE[region[(region != NEWLINE) & (region != CARRIAGE_RETURN)]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        """
+        Closes the memory map and the file. Arrays returned by the reader remain valid.
+
+        :return: None
+        """
+        self._data = None
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# tested
+def iter_sequences(path):
+    """
+    Reads the sequences of a .fasta file in file order.
+
+    :param path: str, path to .fasta file
+    :return: (str, L x 1 uint8 array) Tuple representing (record id, lowercase sequence) each time generator is called
+    """
+    with FastaFile(path) as fasta:
+        for record_id, seq in zip(fasta.ids, fasta):
+            yield record_id, seq
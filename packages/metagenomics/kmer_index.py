@@ -0,0 +1,213 @@
+"""
+Defines an exact k-mer lookup index of reference sequences, for classifying fragments without training a model
+(similar to Kraken, see https://doi.org/10.1186/gb-2014-15-3-r46).
+
+The index stores every distinct k-mer of the reference sequences as a sorted array of 64-bit integer codes
+(see encoding2.get_sliding_kmer_codes()), with a matching array giving the taxid containing each k-mer. K-mers found in
+the sequences of more than one taxid are kept but marked as ambiguous, so they do not vote. A fragment is classified by
+looking up all of its k-mers with a binary search and choosing the taxid with the most hits.
+
+With a minimizer window w, only the minimizers of each sequence are indexed and looked up
+(see encoding2.get_minimizers()). About 2 / (w + 1) of the k-mers are minimizers, which shrinks the index and the
+number of lookups by the same factor. A fragment shares a minimizer with its reference sequence wherever they share
+w + k - 1 consecutive letters, so fragments much longer than w + k - 1 are still classified.
+
+A saved index is a directory containing:
+- kmers.npy: sorted uint64 k-mer codes
+- taxids.npy: int32 index into the taxid labels for each k-mer, or -1 for ambiguous k-mers
+- index.json: k, minimizer window, and the taxid labels
+
+Both arrays are memory-mapped when the index is loaded, so lookups only read the pages of the index they touch.
+"""
+import json
+import os
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from packages.metagenomics import encoding2, fasta, sampling2
+
+FORMAT_VERSION = 1
+INDEX_KMERS = 'kmers.npy'
+INDEX_TAXIDS = 'taxids.npy'
+INDEX_FILE = 'index.json'
+AMBIGUOUS = -1
+UNCLASSIFIED = '0'  # taxid predicted for fragments without any matching kmers
+
+
+# tested
+def _merge_kmers(kmers, taxid_idx):
+    """
+    Combines (kmer, taxid) pairs into one entry per distinct kmer. Kmers paired with more than one taxid are marked as
+    ambiguous.
+
+    :param kmers: n x 1 array, kmer codes
+    :param taxid_idx: n x 1 array, taxid index of each kmer
+    :return: (m x 1 array, m x 1 array) Tuple representing (sorted distinct kmer codes, taxid index of each kmer)
+    """
+    order = np.lexsort((taxid_idx, kmers))
+    kmers, taxid_idx = kmers[order], taxid_idx[order]
+
+    # position of the first pair of each distinct kmer
+    is_first = np.ones(len(kmers), dtype=bool)
+    is_first[1:] = kmers[1:] != kmers[:-1]
+    starts = np.flatnonzero(is_first)
+    ends = np.append(starts[1:], len(kmers)) - 1
+
+    # pairs are sorted by taxid within each kmer, so a kmer has one taxid if its first and last taxids are equal
+    merged = taxid_idx[starts].astype(np.int32)
+    merged[taxid_idx[starts] != taxid_idx[ends]] = AMBIGUOUS
+    return kmers[starts], merged
+
+
+class KmerIndex:
+    """
+    Exact kmer lookup index mapping each kmer of the reference sequences to the taxid containing it.
+    """
+
+    def __init__(self, k, kmers, taxids, labels, w=1):
+        """
+        Initializes an instance.
+
+        :param k: int, length of kmers
+        :param kmers: m x 1 array, sorted distinct uint64 kmer codes
+        :param taxids: m x 1 array, index into labels of the taxid containing each kmer, or -1 if ambiguous
+        :param labels: T x 1 array, taxids
+        :param w: int, minimizer window used to select the indexed kmers. Default is 1, in which case all kmers are
+                indexed.
+        """
+        self.k = k
+        self.w = w
+        self.kmers = kmers
+        self.taxids = taxids
+        self.labels = np.asarray(labels)
+
+    # tested
+    def lookup(self, kmer_codes):
+        """
+        Finds the taxid containing each kmer with a binary search over the sorted kmers.
+
+        :param kmer_codes: array of uint64 kmer codes
+        :return: array of the same shape, index into self.labels of the taxid containing each kmer, or -1 if the kmer
+                is not in the index or is ambiguous
+        """
+        kmer_codes = np.asarray(kmer_codes, dtype=np.uint64)
+        if len(self.kmers) == 0:
+            return np.full(kmer_codes.shape, AMBIGUOUS, dtype=np.int32)
+
+        idx = np.searchsorted(self.kmers, kmer_codes)
+        idx[idx == len(self.kmers)] = 0  # prevent out of bounds indexing for codes larger than all kmers
+        found = self.kmers[idx] == kmer_codes
+        return np.where(found, self.taxids[idx], AMBIGUOUS).astype(np.int32)
+
+    # tested
+    def count_votes(self, fragments):
+        """
+        Counts the kmers of each fragment which belong to each taxid. Kmers which are not in the index, are ambiguous,
+        or contain letters other than a, c, g, or t do not vote. If the index uses minimizers, only the minimizers of
+        each fragment are looked up.
+
+        :param fragments: n x (L+1) array of fragments and taxids, as written by sampling2.generate_fragment_data()
+        :return: n x T sparse matrix of vote counts, where T is the number of taxids
+        """
+        n_fragments = len(fragments)
+        letters = np.ascontiguousarray(fragments[:, :-1]).astype('S1').view(np.uint8)
+        kmer_codes, valid = encoding2.get_sliding_kmer_codes(encoding2.NUCLEOTIDE_CODES[letters], self.k)
+        if self.w > 1:
+            valid = encoding2.get_minimizers(kmer_codes, valid, self.w)
+
+        rows, cols = np.nonzero(valid)
+        hits = self.lookup(kmer_codes[rows, cols])
+        is_hit = hits != AMBIGUOUS
+
+        # duplicate (fragment, taxid) entries are summed into counts
+        votes = csr_matrix((np.ones(np.count_nonzero(is_hit), dtype=np.int32), (rows[is_hit], hits[is_hit])),
+                           shape=(n_fragments, len(self.labels)))
+        votes.sum_duplicates()
+        return votes
+
+    # tested
+    def predict(self, fragments):
+        """
+        Predicts the taxid with the most matching kmers for each fragment. Ties are broken in favor of the first
+        taxid in self.labels. Fragments without any matching kmers are predicted as UNCLASSIFIED.
+
+        :param fragments: n x (L+1) array of fragments and taxids, as written by sampling2.generate_fragment_data()
+        :return: n x 1 array of taxids
+        """
+        votes = self.count_votes(fragments)
+        best = np.asarray(votes.argmax(axis=1)).reshape(-1)
+
+        y_pred = self.labels[best].astype(str)
+        y_pred[np.diff(votes.indptr) == 0] = UNCLASSIFIED
+        return y_pred
+
+
+def build_index(seq_file, taxid_file, k, w=1):
+    """
+    Builds a kmer index from the same inputs as sampling2.generate_fragment_data(). Every overlapping kmer of every
+    sequence is indexed (or only minimizers, if w > 1), except kmers containing letters other than a, c, g, or t.
+
+    :param seq_file: path to sequences file
+    :param taxid_file: path to taxid file
+    :param k: int, length of kmers, at most 32
+    :param w: int, minimizer window (see encoding2.get_minimizers()). Default is 1, in which case all kmers are
+            indexed.
+    :return: KmerIndex
+    """
+    taxids = sampling2._read_taxid_data(taxid_file)
+    labels, taxid_idx = np.unique(taxids, return_inverse=True)
+
+    all_kmers = []
+    all_taxid_idx = []
+    for i, (_, seq) in enumerate(fasta.iter_sequences(seq_file)):
+        kmer_codes, valid = encoding2.get_sliding_kmer_codes(encoding2.NUCLEOTIDE_CODES[seq], k)
+        if w > 1:
+            valid = encoding2.get_minimizers(kmer_codes, valid, w)
+        kmers = np.unique(kmer_codes[valid])  # reduces memory before sequences are combined
+        all_kmers.append(kmers)
+        all_taxid_idx.append(np.full(len(kmers), taxid_idx[i], dtype=np.int32))
+
+    kmers, merged = _merge_kmers(np.concatenate(all_kmers), np.concatenate(all_taxid_idx))
+    return KmerIndex(k, kmers, merged, labels, w)
+
+
+def save_index(index, path):
+    """
+    Saves an index to the given directory. The directory is created if it does not exist.
+
+    :param index: KmerIndex
+    :param path: str, directory where the index should be written
+    :return: None
+    """
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, INDEX_KMERS), np.asarray(index.kmers, dtype=np.uint64))
+    np.save(os.path.join(path, INDEX_TAXIDS), np.asarray(index.taxids, dtype=np.int32))
+
+    description = {'format_version': FORMAT_VERSION,
+                   'k': index.k,
+                   'w': index.w,
+                   'labels': index.labels.astype(str).tolist()}
+    with open(os.path.join(path, INDEX_FILE), 'w') as f:
+        json.dump(description, f, indent=2)
+
+
+def load_index(path, mmap=True):
+    """
+    Loads an index saved by save_index().
+
+    :param path: str, directory where the index was written
+    :param mmap: boolean, if True, the kmer and taxid arrays are memory-mapped as read-only arrays rather than read
+            into memory. Default is True.
+    :return: KmerIndex
+    """
+    with open(os.path.join(path, INDEX_FILE)) as f:
+        description = json.load(f)
+
+    if description['format_version'] != FORMAT_VERSION:
+        raise ValueError('Unsupported index format version:', description['format_version'])
+
+    mmap_mode = 'r' if mmap else None
+    kmers = np.load(os.path.join(path, INDEX_KMERS), mmap_mode=mmap_mode)
+    taxids = np.load(os.path.join(path, INDEX_TAXIDS), mmap_mode=mmap_mode)
+    return KmerIndex(description['k'], kmers, taxids, np.array(description['labels']), description.get('w', 1))
@@ -4,11 +4,12 @@ Fragments are stored as binary character arrays with the fragment sequence using
 Designed to work with encoding.py.
 """
 import numpy as np
-from Bio import SeqIO
 from glob import glob
 import os
 import math
 
+from packages.metagenomics import fasta
+
 
 # tested
 def _calc_number_fragments(seq_length, coverage, sample_length):
@@ -61,7 +62,7 @@ def _draw_fragment(seq, sample_length):
     """
     Draws one fragment sample at random from the given sequence.
 
-    :param seq: Bio.Seq.Seq, sequence to be sampled
+    :param seq: Bio.Seq.Seq, or L x 1 uint8 array of lowercase letters (see fasta.py), sequence to be sampled
     :param sample_length: int, length of samples
     :return: str, lowercase string representing subsequence
     """
@@ -71,6 +72,9 @@ def _draw_fragment(seq, sample_length):
 
     # get fragment
     one_after_end = start_pos + sample_length
+    if isinstance(seq, np.ndarray):
+        return seq[start_pos:one_after_end].tobytes().decode()  # already lowercase
+
     frag_seq = seq[start_pos:one_after_end].lower()
     return str(frag_seq)
 
@@ -268,8 +272,8 @@ def generate_fragment_data(seq_file, taxid_file, output_dir, sample_length, cove
     taxids = _read_taxid_data(taxid_file)
 
     # process each sequence
-    for i, seq_record in enumerate(SeqIO.parse(seq_file, 'fasta')):
-        results = _build_fragment_taxid_array(taxids[i], seq_record.seq, sample_length, coverage, seed)
+    for i, (_, seq) in enumerate(fasta.iter_sequences(seq_file)):
+        results = _build_fragment_taxid_array(taxids[i], seq, sample_length, coverage, seed)
         _write_fragments(results, output_dir, i)
 
 
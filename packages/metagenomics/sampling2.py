@@ -4,10 +4,16 @@ Fragments are stored as binary character arrays with each letter in the fragment
 Designed to work with encoding2.py.
 """
 import numpy as np
-from Bio import SeqIO
 from glob import glob
 import os
 import math
+import re
+
+from packages.metagenomics import fasta
+
+# True for the bytes of valid letters
+VALID_LETTERS = np.zeros(256, dtype=bool)
+VALID_LETTERS[np.frombuffer(b'acgt', dtype=np.uint8)] = True
 
 
 # tested
@@ -53,9 +59,12 @@ def _fragment_is_valid(frag):
     Determines if fragment meets criteria required to be valid. Currently, the criteria is that all letters in the
     fragment are lowercase and encode DNA nucleotides i.e. {a,c,t,g}.
 
-    :param frag: str, fragment selected from sequence
+    :param frag: L x 1 character array, fragment selected from sequence
     :return: True if fragment is valid, false otherwise.
     """
+    if isinstance(frag, np.ndarray) and frag.dtype == np.dtype('S1'):
+        return bool(np.all(VALID_LETTERS[frag.view(np.uint8)]))
+
     allowed = [b'a', b'c', b't', b'g']
     return all(c in allowed for c in frag)
 
@@ -65,7 +74,7 @@ def _draw_fragment(seq, sample_length):
     """
     Draws one fragment sample at random from the given sequence.
 
-    :param seq: Bio.Seq.Seq, sequence to be sampled
+    :param seq: Bio.Seq.Seq, or L x 1 uint8 array of lowercase letters (see fasta.py), sequence to be sampled
     :param sample_length: int, length of samples
     :return: L x 1 character array, where L is sample length
     """
@@ -75,6 +84,9 @@ def _draw_fragment(seq, sample_length):
 
     # get fragment
     one_after_end = start_pos + sample_length
+    if isinstance(seq, np.ndarray):
+        return seq[start_pos:one_after_end].view('|S1')  # already lowercase, so no copy is needed
+
     frag_seq = seq[start_pos:one_after_end].lower()
     return np.array(frag_seq, dtype='|S1')
 
@@ -86,7 +98,7 @@ def _draw_fragments(seq, sample_length, n_frag):
     Raises ValueError if too many invalid sequences are sampled in order to prevent an infinite loop in the case that
     the sequence does not contain valid subsequences of sample_length.
 
-    :param seq: Bio.Seq.Seq, sequence to be sampled
+    :param seq: Bio.Seq.Seq or uint8 array, sequence to be sampled (see _draw_fragment())
     :param sample_length: int, length of samples
     :param n_frag: int, number of fragments to sample
     :return: n_frag x L character array, valid fragments drawn from sample
@@ -122,7 +134,7 @@ def _build_fragment_array(seq, sample_length, coverage, seed=None):
     Draws number of samples from sequence in order to achieve desired coverage and constructs an array of the results.
     Follows general sampling procedure laid out by Vervier et al. See https://arxiv.org/abs/1505.06915.
 
-    :param seq: Bio.Seq.Seq, sequence to be sampled
+    :param seq: Bio.Seq.Seq or uint8 array, sequence to be sampled (see _draw_fragment())
     :param sample_length: int, length of samples
     :param coverage: float, desired coverage
             (0.1 for 10% of bp coverage; 1 for 100% bp coverage; 10 for 10x bp coverage).
@@ -184,7 +196,7 @@ def _build_fragment_taxid_array(taxid, seq, sample_length, coverage, seed=None):
     Builds dataset of fragments and the corresponding (identical) taxid for each fragment.
 
     :param taxid: str, species for the sequence
-    :param seq: Bio.Seq.Seq, sequence to be sampled
+    :param seq: Bio.Seq.Seq or uint8 array, sequence to be sampled (see _draw_fragment())
     :param sample_length: int, length of samples
     :param coverage: float, desired coverage
             (0.1 for 10% of bp coverage; 1 for 100% bp coverage; 10 for 10x bp coverage).
@@ -279,8 +291,8 @@ def generate_fragment_data(seq_file, taxid_file, output_dir, sample_length, cove
     taxids = _read_taxid_data(taxid_file)
 
     # process each sequence
-    for i, seq_record in enumerate(SeqIO.parse(seq_file, 'fasta')):
-        results = _build_fragment_taxid_array(taxids[i], seq_record.seq, sample_length, coverage, seed)
+    for i, (_, seq) in enumerate(fasta.iter_sequences(seq_file)):
+        results = _build_fragment_taxid_array(taxids[i], seq, sample_length, coverage, seed)
         _write_fragments(results, output_dir, i)
 
 
@@ -295,8 +307,8 @@ def read_fragments(input_dir, pattern):
     :param pattern: str, unix-like pattern to match (i.e. '*.npy' for all files that end with .npy extension)
     :return: numpy matrix
     """
-    # get list of fragment files
-    fnames = glob(input_dir + '/' + pattern)
+    # get list of fragment files, in a fixed order so rows can be matched to their sequences
+    fnames = sorted(glob(input_dir + '/' + pattern))
 
     # process list
     datasets = []
@@ -312,3 +324,60 @@ def read_fragments(input_dir, pattern):
     # combine arrays
     total = np.concatenate(datasets, axis=0)
     return total
+
+
+# tested
+def read_fragment_records(input_dir, pattern):
+    """
+    Determines the sequence each fragment was drawn from, using the sequence number in the name of each fragment file
+    (i.e. 3 for fragments-00003.npy). Fragments are listed in the same order as read_fragments() returns them.
+
+    :param input_dir: str, path to directory where fragments are stored
+    :param pattern: str, unix-like pattern to match (i.e. '*.npy' for all files that end with .npy extension)
+    :return: n x 1 array, where n is the number of fragments and the ith entry is the index of the sequence in the
+            .fasta file the ith fragment was drawn from
+    """
+    records = []
+    for each in sorted(glob(input_dir + '/' + pattern)):
+        n_frag = len(np.load(each, mmap_mode='r'))  # reads the header only
+
+        if n_frag > 0:
+            i = int(re.search(r'(\d+)\.npy$', each).group(1))
+            records.append(np.full(n_frag, i, dtype=np.int64))
+
+    return np.concatenate(records)
+
+
+# tested
+def read_sequence_ids(seq_file):
+    """
+    Reads the id of each sequence in a .fasta file (i.e. NC_015723), in file order, without reading the sequences.
+    Ids match the record ids given by Bio.SeqIO.
+
+    :param seq_file: path to sequences file
+    :return: m x 1 array, where m is the number of sequences
+    """
+    ids = []
+    with open(seq_file) as f:
+        for line in f:
+            if line.startswith('>'):
+                ids.append(line[1:].split()[0])
+
+    return np.array(ids)
+
+
+# tested
+def iter_fragments(input_dir, pattern):
+    """
+    Reads files in the input directory which follow given pattern one at a time, so that fragment data larger than
+    memory can be processed file by file. Files are read in sorted order and empty files are skipped.
+
+    :param input_dir: str, path to directory where fragments are stored
+    :param pattern: str, unix-like pattern to match (i.e. '*.npy' for all files that end with .npy extension)
+    :return: numpy matrix of fragments from a single file each time generator is called
+    """
+    for each in sorted(glob(input_dir + '/' + pattern)):
+        curr_frag = np.load(each)
+
+        if len(curr_frag) > 0:
+            yield curr_frag
@@ -0,0 +1,74 @@
+"""
+Defines taxonomy functionality for metagenomics data, using the metadata file of the reference database
+(i.e. train_small-db.meta), which lists the strain, species, and genus taxid of each genome.
+Taxids are handled as strings, matching the taxids returned by encoding2.py.
+"""
+import numpy as np
+import pandas as pd
+
+RANKS = ['strain', 'species', 'genus']  # from lowest to highest
+
+
+# tested
+def read_taxonomy(meta_file):
+    """
+    Reads the taxid of each rank for every strain in the metadata file. Genomes of the same strain share a row.
+
+    :param meta_file: str, path to tab-separated metadata file with columns taxid.strain, taxid.species, and
+            taxid.genus
+    :return: DataFrame with columns 'strain', 'species', and 'genus'
+    """
+    meta = pd.read_csv(meta_file, sep='\t', dtype=str)
+    taxonomy = meta[['taxid.' + rank for rank in RANKS]].drop_duplicates()
+    taxonomy.columns = RANKS
+    return taxonomy.reset_index(drop=True)
+
+
+# tested
+def get_rank_lookup(taxonomy, from_rank, to_rank):
+    """
+    Builds lookup arrays which map the taxids of one rank to the taxids of a higher rank (i.e. species to genus).
+    Raises ValueError if to_rank is lower than from_rank or a taxid maps to more than one taxid.
+
+    :param taxonomy: DataFrame, as returned by read_taxonomy()
+    :param from_rank: str, rank of the taxids to be mapped
+    :param to_rank: str, rank of the mapped taxids
+    :return: (K x 1 array, K x 1 array) Tuple representing (sorted taxids of from_rank, matching taxids of to_rank)
+    """
+    if RANKS.index(to_rank) < RANKS.index(from_rank):
+        raise ValueError('Taxids can only be mapped to a higher rank:', from_rank, to_rank)
+
+    pairs = taxonomy[[from_rank, to_rank]].drop_duplicates()
+    if pairs[from_rank].duplicated().any():
+        raise ValueError('Taxids map to more than one taxid:', list(pairs[from_rank][pairs[from_rank].duplicated()]))
+
+    pairs = pairs.sort_values(from_rank)
+    return pairs[from_rank].to_numpy(dtype=str), pairs[to_rank].to_numpy(dtype=str)
+
+
+# tested
+def map_to_rank(taxids, taxonomy, from_rank, to_rank, missing=None):
+    """
+    Maps taxids to the taxids of a higher rank (i.e. the genus of each species) with a single binary search over the
+    lookup arrays. Raises ValueError if a taxid is not in the taxonomy, unless a value for missing taxids is given.
+
+    :param taxids: L x 1 array, taxids of from_rank
+    :param taxonomy: DataFrame, as returned by read_taxonomy()
+    :param from_rank: str, rank of the taxids
+    :param to_rank: str, rank to map the taxids to
+    :param missing: str, taxid returned for taxids which are not in the taxonomy. Default is None, in which case
+            ValueError is raised.
+    :return: L x 1 array of taxids
+    """
+    keys, values = get_rank_lookup(taxonomy, from_rank, to_rank)
+    taxids = np.asarray(taxids).astype(str).reshape(-1)
+
+    idx = np.searchsorted(keys, taxids)
+    idx[idx == len(keys)] = 0  # prevent out of bounds indexing for taxids larger than all keys
+    is_missing = keys[idx] != taxids
+    if missing is None:
+        if np.any(is_missing):
+            raise ValueError('Taxids not found in taxonomy:', np.unique(taxids[is_missing]))
+        return values[idx]
+
+    return np.where(is_missing, missing, values[idx])
@@ -0,0 +1,17 @@
+import pytest
+import numpy as np
+
+
+@pytest.fixture
+def input_files(tmp_path):
+    rng = np.random.RandomState(0)
+    seq_file = tmp_path / 'sequences.fasta'
+    taxid_file = tmp_path / 'sequences.taxid'
+
+    records = []
+    for i in range(4):
+        seq = ''.join(rng.choice(list('ACGT'), 300))
+        records.append('>NC_{}\n{}\n'.format(i, seq))
+    seq_file.write_text(''.join(records))
+    taxid_file.write_text('100\n100\n200\n200\n')
+    return str(seq_file), str(taxid_file)
@@ -0,0 +1,81 @@
+from packages.hierarchical_model import HierarchicalClassifier as hc
+from packages.generative_model.naive_bayes import NaiveBayes
+import pytest
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+def test__encode_labels():
+    y = np.array(['b', 'a', 'c', 'a'])
+
+    classes, y_enc = hc._encode_labels(y)
+    np.testing.assert_array_equal(classes, np.array(['a', 'b', 'c']))
+    np.testing.assert_array_equal(y_enc, np.array([1, 0, 2, 0]))
+
+
+def test__group_rows():
+    labels = np.array([2, 0, 2, 1, 0])
+
+    unique_labels, rows = hc._group_rows(labels)
+    np.testing.assert_array_equal(unique_labels, np.array([0, 1, 2]))
+    np.testing.assert_array_equal(rows[0], np.array([1, 4]))
+    np.testing.assert_array_equal(rows[1], np.array([3]))
+    np.testing.assert_array_equal(rows[2], np.array([0, 2]))
+
+
+def _build_data():
+    # each species has its own feature; the genus is determined by the first two features
+    X = csr_matrix(np.array([[5, 0, 1, 0, 0],
+                             [4, 0, 1, 0, 0],
+                             [5, 0, 0, 1, 0],
+                             [4, 0, 0, 1, 0],
+                             [0, 5, 0, 0, 1],
+                             [0, 4, 0, 0, 1]]))
+    y = np.array(['s1', 's1', 's2', 's2', 's3', 's3'])
+    y_parent = np.array(['g1', 'g1', 'g1', 'g1', 'g2', 'g2'])
+    return X, y, y_parent
+
+
+def test_fit():
+    X, y, y_parent = _build_data()
+
+    model = hc.HierarchicalClassifier(NaiveBayes).fit(X, y, y_parent)
+    np.testing.assert_array_equal(model.parent_classes, np.array(['g1', 'g2']))
+    assert len(model.child_models) == 2
+    assert model.child_models[1] is None  # genus with a single species does not need a model
+    np.testing.assert_array_equal(model.child_classes[0], np.array(['s1', 's2']))
+    np.testing.assert_array_equal(model.child_models[0].classes, np.array([0, 1]))  # only sees its subtree
+
+
+def test_fit__taxid_with_several_parents():
+    X, y, y_parent = _build_data()
+    y_parent[0] = 'g2'
+
+    with pytest.raises(ValueError):
+        hc.HierarchicalClassifier(NaiveBayes).fit(X, y, y_parent)
+
+
+def test_predict_parent():
+    X, y, y_parent = _build_data()
+
+    model = hc.HierarchicalClassifier(NaiveBayes).fit(X, y, y_parent)
+    np.testing.assert_array_equal(model.predict_parent(X), y_parent)
+
+
+def test_predict():
+    X, y, y_parent = _build_data()
+
+    model = hc.HierarchicalClassifier(NaiveBayes).fit(X, y, y_parent)
+    X_test = csr_matrix(np.array([[0, 3, 0, 0, 1],
+                                  [3, 0, 0, 1, 0],
+                                  [3, 0, 1, 0, 0]]))
+    np.testing.assert_array_equal(model.predict(X_test), np.array(['s3', 's2', 's1']))
+
+
+def test_predict__single_parent():
+    X, y, y_parent = _build_data()
+    X, y = X[:4], y[:4]
+
+    model = hc.HierarchicalClassifier(NaiveBayes).fit(X, y, y_parent[:4])
+    assert model.parent_model is None
+    np.testing.assert_array_equal(model.predict(X), y)
@@ -125,3 +125,119 @@ def test_predict_proba__sparse():
     a.weights = np.array([.1, .2, .3])
     X = csr_matrix(np.array([[4, 5], [3, 5]]))
     a.predict_proba(X)
+
+
+def test__initial_weights__cold_start():
+    a = lr.LogisticRegression(eta=0.01, epsilon=0.5)
+    a.weights = np.array([.1, .2, .3])
+    X = np.array([[1, 4, 5], [1, 3, 5]])
+
+    expected = np.array([0, 0, 0])
+    actual = a._initial_weights(X)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test__initial_weights__warm_start():
+    a = lr.LogisticRegression(eta=0.01, epsilon=0.5, warm_start=True)
+    a.weights = np.array([.1, .2, .3])
+    X = np.array([[1, 4, 5], [1, 3, 5]])
+
+    expected = np.array([.1, .2, .3])
+    actual = a._initial_weights(X)
+    np.testing.assert_array_equal(actual, expected)
+    assert actual is not a.weights  # previous weights are not modified during descent
+
+
+def test__initial_weights__warm_start_different_features():
+    a = lr.LogisticRegression(eta=0.01, epsilon=0.5, warm_start=True)
+    a.weights = np.array([.1, .2, .3])
+    X = np.array([[1, 4], [1, 3]])
+
+    expected = np.array([0, 0])
+    actual = a._initial_weights(X)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_fit__warm_start():
+    X = np.array([[4, 5], [3, 5]])
+    y = np.array([1, 0])
+
+    # continuing from previous weights is equivalent to training once for more iterations
+    a = lr.LogisticRegression(eta=0.01, epsilon=0, max_iter=5, warm_start=True)
+    a.fit(X, y)
+    a.fit(X, y)
+
+    b = lr.LogisticRegression(eta=0.01, epsilon=0, max_iter=10)
+    b.fit(X, y)
+    np.testing.assert_allclose(a.weights, b.weights)
+
+
+def test_fit__early_stopping():
+    a = lr.LogisticRegression(eta=0.01, epsilon=0, max_iter=1000, patience=3)
+    X = np.array([[4, 5], [3, 5]])
+    y = np.array([1, 0])
+    a.fit(X, y, X, y)
+    assert a.history['stop_reason'] == 'early_stopping'
+    assert a.history['n_iter'] < 1000
+
+
+def test__to_dense_weights():
+    w = csr_matrix(np.array([0, .2, 0]))
+    expected = np.array([0, .2, 0])
+    actual = lr._to_dense_weights(w)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test__to_dense_weights__dense():
+    w = np.array([0, .2, 0])
+    actual = lr._to_dense_weights(w)
+    np.testing.assert_array_equal(actual, w)
+
+
+def test_sparsify():
+    a = lr.LogisticRegression(eta=0.01, epsilon=0.5)
+    a.weights = np.array([.1, 0, .3])
+    X = np.array([[4, 5], [3, -5]])
+    expected = a.predict_proba(X)
+
+    a.sparsify()
+    assert a.weights.nnz == 2
+    np.testing.assert_allclose(a.predict_proba(X), expected)
+
+    a.densify()
+    np.testing.assert_array_equal(a.weights, np.array([.1, 0, .3]))
+
+
+def test_fit__l1_penalty_warm_start_from_sparse():
+    a = lr.LogisticRegression(eta=0.01, epsilon=0.5, penalty='l1', l1_lambda=0.1, warm_start=True)
+    X = np.array([[4, 5], [3, 5]])
+    y = np.array([1, 0])
+    a.fit(X, y)
+    a.sparsify()
+    a.fit(X, y)
+    assert len(a.weights) == 3
+
+
+def test__set_weights__float32():
+    X = np.array([[1, 2, 3],
+                  [1, 2, 3]])
+    actual = lr._set_weights(X, np.float32)
+    assert actual.dtype == np.float32
+
+
+def test__add_x0__float32():
+    X_test = csr_matrix(np.array([[1, 9],
+                                  [2, 7]], dtype=np.uint8))
+    actual = lr._add_x0(X_test, np.float32)
+    assert actual.dtype == np.float32
+    np.testing.assert_array_equal(actual.toarray(), np.array([[1, 1, 9],
+                                                              [1, 2, 7]]))
+
+
+def test_fit__float32():
+    a = lr.LogisticRegression(eta=0.01, epsilon=0.5, dtype=np.float32)
+    X = csr_matrix(np.array([[4, 5], [3, 5]], dtype=np.uint8))
+    y = np.array([1, 0])
+    a.fit(X, y)
+    assert a.weights.dtype == np.float32
+    assert a.predict_proba(X).dtype == np.float32
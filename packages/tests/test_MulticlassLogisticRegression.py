@@ -1,4 +1,5 @@
 from packages.linear_model import MulticlassLogisticRegression as mlr
+from packages.linear_model.LogisticRegression import LogisticRegression
 import numpy as np
 from scipy.sparse import csr_matrix
 
@@ -58,18 +59,47 @@ def test__standardize_probabilities():
     np.testing.assert_allclose(np.sum(actual, axis=1), np.array([1., 1., 1., 1.]), atol=1e-16)
 
 
-def test__update_predictions():
-    y_pred = np.array([1, 1, 1])
-    y_pred_proba_k = np.array([0.6, 0.4, 0.8])
-    y_pred_proba_highest = np.array([0.5, 0.6, 0.7])
-    k = 3
+def test__stack_weights():
+    a = LogisticRegression(eta=0.01, epsilon=0.5)
+    a.weights = np.array([.1, .2, .3])
+    b = LogisticRegression(eta=0.01, epsilon=0.5)
+    b.weights = csr_matrix(np.array([.4, 0, .6]))
 
-    mlr._update_predictions(y_pred, y_pred_proba_highest, y_pred_proba_k, k)
-    y_pred_expected = np.array([3, 1, 3])
-    y_pred_proba_highest_expected = np.array([0.6, 0.6, 0.8])
+    expected = np.array([[.1, .4],
+                         [.2, 0],
+                         [.3, .6]])
+    actual = mlr._stack_weights([a, b])
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test__calc_scores():
+    X = np.array([[1, 2],
+                  [3, 4],
+                  [0, 1]])
+    weights = np.array([[1, -1],
+                        [2, 0],
+                        [0, 3]])
+
+    expected = np.array([[3, 5],
+                         [7, 11],
+                         [1, 2]])
+    actual = mlr._calc_scores(X, weights)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test__calc_scores__sparse():
+    X = csr_matrix(np.array([[1, 2],
+                             [3, 4],
+                             [0, 1]]))
+    weights = csr_matrix(np.array([[1, -1],
+                                   [2, 0],
+                                   [0, 3]]))
 
-    np.testing.assert_array_equal(y_pred, y_pred_expected)
-    np.testing.assert_array_equal(y_pred_proba_highest, y_pred_proba_highest_expected)
+    expected = np.array([[3, 5],
+                         [7, 11],
+                         [1, 2]])
+    actual = mlr._calc_scores(X, weights)
+    np.testing.assert_array_equal(actual, expected)
 
 
 def test__init__v2():
@@ -293,3 +323,148 @@ def test_predict_v2__l2_penalty__sparse():
     expected = np.array([0, 1, 2, 2])
     actual = model.predict(X_test)
     np.testing.assert_array_equal(actual, expected)
+
+
+def test_fit__warm_start():
+    X = np.array([[1, 1],
+                  [0, 0],
+                  [1, 0],
+                  [0, 4],
+                  [5, 1],
+                  [5, 2],
+                  [5, -1],
+                  [5, 10],
+                  [3, 10],
+                  [3, 10.5],
+                  [3, 11]])
+    y = np.array([0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2])
+
+    # continuing from previous weights is equivalent to training once for more iterations
+    model = mlr.MulticlassLogisticRegression(eta=0.01, epsilon=0, max_iter=5, warm_start=True)
+    model.fit(X, y)
+    model.fit(X, y)
+
+    expected = mlr.MulticlassLogisticRegression(eta=0.01, epsilon=0, max_iter=10)
+    expected.fit(X, y)
+
+    for actual_lr, expected_lr in zip(model.classifiers, expected.classifiers):
+        np.testing.assert_allclose(actual_lr.weights, expected_lr.weights)
+
+
+def test_regularization_path():
+    X = csr_matrix(np.array([[1, 1],
+                             [0, 0],
+                             [1, 0],
+                             [0, 4],
+                             [5, 1],
+                             [5, 2],
+                             [5, -1],
+                             [5, 10],
+                             [3, 10],
+                             [3, 10.5],
+                             [3, 11]]))
+    y = np.array([0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2])
+    list_l2_lambda = [0.01, 1, 0.1]
+
+    path = list(mlr.regularization_path(X, y, list_l2_lambda, eta=0.01, epsilon=0.01))
+
+    # lambdas are swept from largest to smallest
+    assert [l2_lambda for l2_lambda, _ in path] == [1, 0.1, 0.01]
+
+    # each model keeps the weights of its own fit
+    for l2_lambda, model in path:
+        assert model.l2_lambda == l2_lambda
+        assert len(model.classifiers) == 3
+    assert path[0][1].classifiers[0] is not path[1][1].classifiers[0]
+
+
+def test_fit__early_stopping__sparse():
+    X = csr_matrix(np.array([[1, 1],
+                             [0, 0],
+                             [1, 0],
+                             [0, 4],
+                             [5, 1],
+                             [5, 2],
+                             [5, -1],
+                             [5, 10],
+                             [3, 10],
+                             [3, 10.5],
+                             [3, 11]]))
+    y = np.array([0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2])
+    model = mlr.MulticlassLogisticRegression(eta=0.01, epsilon=0, max_iter=1000, patience=5)
+    model.fit(X, y, X, y)
+
+    assert len(model.history) == 3
+    for history in model.history:
+        assert len(history['val_recall']) == history['n_iter']
+        assert history['n_iter'] <= 1000
+
+
+def test_sparsify__elasticnet_penalty():
+    X = csr_matrix(np.array([[1, 1],
+                             [0, 0],
+                             [1, 0],
+                             [0, 4],
+                             [5, 1],
+                             [5, 2],
+                             [5, -1],
+                             [5, 10],
+                             [3, 10],
+                             [3, 10.5],
+                             [3, 11]]))
+    y = np.array([0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2])
+    model = mlr.MulticlassLogisticRegression(eta=0.01,
+                                             epsilon=0.01,
+                                             penalty='elasticnet',
+                                             l1_lambda=0.01,
+                                             l2_lambda=0.01)
+    model.fit(X, y)
+
+    X_test = csr_matrix(np.array([[0, 1],
+                                  [5, 0],
+                                  [3, 10.25],
+                                  [0, 5]]))
+    expected = model.predict_proba(X_test)
+
+    model.sparsify()
+    np.testing.assert_allclose(model.predict_proba(X_test), expected)
+
+    model.densify()
+    np.testing.assert_allclose(model.predict_proba(X_test), expected)
+
+
+def test_predict__more_than_127_classes():
+    n_classes = 200
+    X = np.eye(n_classes)
+    y = np.arange(n_classes)
+    model = mlr.MulticlassLogisticRegression(eta=0.5, epsilon=0.01, max_iter=20)
+    model.fit(X, y)
+
+    assert model.weights.shape == (n_classes + 1, n_classes)
+    np.testing.assert_array_equal(model.predict(X), y)
+
+
+def test_predict_proba__float32():
+    X = csr_matrix(np.array([[1, 1],
+                             [0, 0],
+                             [1, 0],
+                             [0, 4],
+                             [5, 1],
+                             [5, 2],
+                             [5, -1],
+                             [5, 10],
+                             [3, 10],
+                             [3, 10.5],
+                             [3, 11]]))
+    y = np.array([0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2])
+    model = mlr.MulticlassLogisticRegression(eta=0.01, epsilon=0.01, dtype=np.float32)
+    model.fit(X, y)
+
+    X_test = csr_matrix(np.array([[0, 1],
+                                  [5, 0],
+                                  [3, 10.25],
+                                  [0, 5]]))
+
+    assert model.weights.dtype == np.float32
+    assert model.predict_proba(X_test).dtype == np.float32
+    np.testing.assert_array_equal(model.predict(X_test), np.array([0, 1, 2, 2]))
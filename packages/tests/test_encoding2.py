@@ -1,4 +1,5 @@
 import numpy as np
+import pytest
 from packages.metagenomics import encoding2
 
 
@@ -165,3 +166,170 @@ def test_encode_fragment_dataset():
     X_actual, y_actual = encoding2.encode_fragment_dataset(fragments, k)
     np.testing.assert_array_equal(X_actual.toarray(), X_expected)
     np.testing.assert_array_equal(y_actual, y_expected)
+
+
+def test_encode_fragment_dataset__compact_dtype():
+    fragments = np.array([[b'g', b'a', b't', b'g', b't', b'a', b'1'],
+                          [b'g', b'c', b't', b'g', b'a', b'a', b'1']])
+    k = 3
+
+    X_actual, _ = encoding2.encode_fragment_dataset(fragments, k, np.uint8)
+    assert X_actual.dtype == np.uint8
+    np.testing.assert_array_equal(X_actual.data, np.ones(4))
+
+
+def test_encode_fragment_dataset__return_categories():
+    fragments = np.array([[b'g', b'a', b't', b'g', b't', b'a', b'1'],
+                          [b'g', b'c', b't', b'g', b'a', b'a', b'1'],
+                          [b't', b'a', b'c', b't', b'g', b'a', b'1'],
+                          [b'c', b't', b'g', b't', b'a', b'a', b'1']])
+    k = 3
+
+    X_actual, _, categories = encoding2.encode_fragment_dataset(fragments, k, return_categories=True)
+    assert len(categories) == 2
+    np.testing.assert_array_equal(categories[0], np.array(['ctg', 'gat', 'gct', 'tac']))
+    np.testing.assert_array_equal(categories[1], np.array(['gaa', 'gta', 'taa', 'tga']))
+    assert X_actual.shape[1] == sum(len(each) for each in categories)
+
+
+def test__get_nucleotide_codes():
+    fragments = np.array([[b'g', b'a', b'T', b'c', b'1'],
+                          [b'c', b't', b'g', b'A', b'1']])
+
+    expected = np.array([[2, 0, 3, 1],
+                         [1, 3, 2, 0]])
+    actual = encoding2._get_nucleotide_codes(fragments)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test__get_nucleotide_codes__invalid_letter():
+    fragments = np.array([[b'g', b'n', b't', b'c', b'1']])
+
+    with pytest.raises(ValueError):
+        encoding2._get_nucleotide_codes(fragments)
+
+
+def test__get_kmer_codes():
+    fragments = np.array([[b'g', b'a', b't', b'g', b't', b'a', b'1'],
+                          [b'a', b'a', b'a', b't', b't', b't', b'1']])
+    k = 3
+
+    # gat = 2*16 + 0*4 + 3, gta = 2*16 + 3*4 + 0
+    expected = np.array([[35, 44],
+                         [0, 63]])
+    actual = encoding2._get_kmer_codes(fragments, k)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_encode_fragment_dataset_fixed_width():
+    fragments = np.array([[b'g', b'a', b't', b'g', b't', b'a', b'1'],
+                          [b'a', b'a', b'a', b't', b't', b't', b'2']])
+    k = 3
+
+    X_expected = np.zeros((2, 128))
+    X_expected[0, [35, 64 + 44]] = 1
+    X_expected[1, [0, 64 + 63]] = 1
+    y_expected = np.array(['1', '2'])
+
+    X_actual, y_actual = encoding2.encode_fragment_dataset_fixed_width(fragments, k)
+    np.testing.assert_array_equal(X_actual.toarray(), X_expected)
+    np.testing.assert_array_equal(y_actual, y_expected)
+
+
+def test_encode_fragment_dataset_fixed_width__separate_batches_share_columns():
+    fragments = np.array([[b'g', b'a', b't', b'g', b't', b'a', b'1'],
+                          [b'a', b'a', b'a', b't', b't', b't', b'2']])
+    k = 3
+
+    X_all, _ = encoding2.encode_fragment_dataset_fixed_width(fragments, k)
+    X_first, _ = encoding2.encode_fragment_dataset_fixed_width(fragments[:1], k)
+    X_second, _ = encoding2.encode_fragment_dataset_fixed_width(fragments[1:], k)
+
+    np.testing.assert_array_equal(X_first.toarray(), X_all[:1].toarray())
+    np.testing.assert_array_equal(X_second.toarray(), X_all[1:].toarray())
+
+
+def test_get_sliding_kmer_codes():
+    codes = np.array([2, 0, 3, 4, 1, 1])  # g a t n c c
+    k = 2
+
+    kmer_codes, valid = encoding2.get_sliding_kmer_codes(codes, k)
+    np.testing.assert_array_equal(kmer_codes[valid], np.array([8, 3, 5], dtype=np.uint64))  # ga, at, cc
+    np.testing.assert_array_equal(valid, np.array([True, True, False, False, True]))
+
+
+def test_get_sliding_kmer_codes__rows():
+    codes = np.array([[0, 1, 2],
+                      [3, 3, 3]])
+
+    kmer_codes, valid = encoding2.get_sliding_kmer_codes(codes, 3)
+    np.testing.assert_array_equal(kmer_codes, np.array([[6], [63]], dtype=np.uint64))
+    assert valid.all()
+
+
+def test_get_sliding_kmer_codes__sequence_shorter_than_k():
+    kmer_codes, valid = encoding2.get_sliding_kmer_codes(np.array([0, 1]), 3)
+    assert kmer_codes.shape == (0,)
+    assert valid.shape == (0,)
+
+
+def test_get_sliding_kmer_codes__k_too_large():
+    with pytest.raises(ValueError):
+        encoding2.get_sliding_kmer_codes(np.zeros(40, dtype=np.uint8), 33)
+
+
+def test__hash_kmer_codes():
+    codes = np.arange(1000, dtype=np.uint64)
+
+    actual = encoding2._hash_kmer_codes(codes)
+    assert len(np.unique(actual)) == 1000  # invertible, so no collisions
+    assert not np.all(np.diff(actual.astype(np.float64)) > 0)  # order is scrambled
+
+
+def test_get_minimizers():
+    rng = np.random.RandomState(0)
+    kmer_codes = rng.randint(0, 4 ** 8, 1000).astype(np.uint64)
+    valid = np.ones(1000, dtype=bool)
+    w = 5
+
+    selected = encoding2.get_minimizers(kmer_codes, valid, w)
+    hashes = encoding2._hash_kmer_codes(kmer_codes)
+    for start in range(1000 - w + 1):
+        window = slice(start, start + w)
+        assert selected[window].any()  # every window has a minimizer
+        assert hashes[window].min() in hashes[window][selected[window]]
+    assert selected.sum() < 1000 * 3 / (w + 1)
+
+
+def test_get_minimizers__invalid_kmers():
+    kmer_codes = np.array([[5, 1, 7, 3]], dtype=np.uint64)
+    valid = np.array([[True, False, False, True]])
+
+    actual = encoding2.get_minimizers(kmer_codes, valid, 1)
+    np.testing.assert_array_equal(actual, valid)
+
+    actual = encoding2.get_minimizers(kmer_codes, valid, 2)
+    assert not np.any(actual & ~valid)
+
+
+def test_encode_fragment_dataset_minimizers__all_kmers():
+    fragments = np.array([[b'a', b'c', b'a', b'c', b'1'],
+                          [b'g', b'g', b'n', b'g', b'2']])
+
+    X_actual, y_actual = encoding2.encode_fragment_dataset_minimizers(fragments, 2)
+    X_expected = np.zeros((2, 16))
+    X_expected[0, [1, 4]] = [2, 1]  # ac twice, ca once
+    X_expected[1, 10] = 1  # gg once; kmers containing n are skipped
+    np.testing.assert_array_equal(X_actual.toarray(), X_expected)
+    np.testing.assert_array_equal(y_actual, np.array(['1', '2']))
+
+
+def test_encode_fragment_dataset_minimizers__window():
+    rng = np.random.RandomState(1)
+    letters = np.array([b'a', b'c', b'g', b't'])[rng.randint(0, 4, (3, 200))]
+    fragments = np.column_stack((letters, np.array([b'1', b'2', b'3'])))
+
+    X_all, _ = encoding2.encode_fragment_dataset_minimizers(fragments, 6)
+    X_min, _ = encoding2.encode_fragment_dataset_minimizers(fragments, 6, w=8)
+    assert X_min.sum() < X_all.sum() / 2
+    assert np.all((X_min > X_all).toarray() == 0)  # minimizers are a subset of the kmers
@@ -0,0 +1,87 @@
+from packages.metagenomics import evaluation, taxonomy
+import pytest
+import numpy as np
+from sklearn.metrics import f1_score, precision_score, recall_score
+
+
+@pytest.fixture
+def tax(tmp_path):
+    meta_file = tmp_path / 'train.meta'
+    meta_file.write_text('sequence.id\tgenome.id\ttaxid.strain\ttaxid.species\ttaxid.genus\n'
+                         'a\tNC_1\t11\t1\t100\n'
+                         'b\tNC_2\t22\t2\t100\n'
+                         'c\tNC_3\t33\t3\t300\n')
+    return taxonomy.read_taxonomy(str(meta_file))
+
+
+def test_calc_confusion_matrix():
+    y_true = np.array(['1', '1', '2', '3'])
+    y_pred = np.array(['1', '2', '2', '1'])
+
+    labels, actual = evaluation.calc_confusion_matrix(y_true, y_pred)
+    np.testing.assert_array_equal(labels, np.array(['1', '2', '3']))
+    np.testing.assert_array_equal(actual, np.array([[1, 1, 0],
+                                                    [0, 1, 0],
+                                                    [1, 0, 0]]))
+
+
+def test_aggregate_confusion_matrix():
+    confusion = np.array([[1, 1, 0],
+                          [0, 1, 0],
+                          [1, 0, 0]])
+    ancestor_idx = np.array([0, 0, 1])
+
+    expected = np.array([[3, 0],
+                         [1, 0]])
+    actual = evaluation.aggregate_confusion_matrix(confusion, ancestor_idx, 2)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_calc_metrics__matches_sklearn():
+    rng = np.random.RandomState(0)
+    y_true = rng.randint(0, 5, 200)
+    y_pred = np.where(rng.rand(200) < 0.6, y_true, rng.randint(0, 6, 200))
+
+    _, confusion = evaluation.calc_confusion_matrix(y_true, y_pred)
+    actual = evaluation.calc_metrics(confusion)
+    assert actual['recall'] == pytest.approx(recall_score(y_true, y_pred, average='weighted', zero_division=0))
+    assert actual['precision'] == pytest.approx(precision_score(y_true, y_pred, average='weighted', zero_division=0))
+    assert actual['f1'] == pytest.approx(f1_score(y_true, y_pred, average='weighted', zero_division=0))
+
+
+def test_evaluate_ranks(tax):
+    y_true = np.array(['1', '1', '2', '3'])
+    y_pred = np.array(['1', '2', '2', '1'])
+
+    actual = evaluation.evaluate_ranks(y_true, y_pred, tax)
+    assert list(actual.keys()) == ['species', 'genus']
+    assert actual['species']['recall'] == pytest.approx(0.5)
+
+    # species 1 and 2 share genus 100, so only the last prediction is wrong at genus level
+    np.testing.assert_array_equal(actual['genus']['labels'], np.array(['100', '300']))
+    assert actual['genus']['recall'] == pytest.approx(0.75)
+    genus_pred = taxonomy.map_to_rank(y_pred, tax, 'species', 'genus')
+    genus_true = taxonomy.map_to_rank(y_true, tax, 'species', 'genus')
+    assert actual['genus']['f1'] == pytest.approx(f1_score(genus_true, genus_pred, average='weighted',
+                                                           zero_division=0))
+
+
+def test_evaluate_ranks__strain(tax):
+    actual = evaluation.evaluate_ranks(np.array([11, 22]), np.array([22, 22]), tax, rank='strain')
+    assert list(actual.keys()) == ['strain', 'species', 'genus']
+    assert actual['strain']['recall'] == pytest.approx(0.5)
+    assert actual['genus']['recall'] == pytest.approx(1.0)
+
+
+def test_evaluate_ranks__unknown_prediction(tax):
+    actual = evaluation.evaluate_ranks(np.array(['1', '2']), np.array(['1', '0']), tax)
+    assert actual['species']['recall'] == pytest.approx(0.5)
+
+    # unclassified prediction is wrong at genus level even though both true species share a genus
+    np.testing.assert_array_equal(actual['genus']['labels'], np.array(['100', evaluation.UNKNOWN]))
+    assert actual['genus']['recall'] == pytest.approx(0.5)
+
+
+def test_evaluate_ranks__unknown_true_taxid(tax):
+    with pytest.raises(ValueError):
+        evaluation.evaluate_ranks(np.array(['1', '9']), np.array(['1', '1']), tax)
@@ -0,0 +1,49 @@
+from Bio import SeqIO
+from packages.metagenomics import fasta
+import numpy as np
+
+
+def test__find_record_starts():
+    data = np.frombuffer(b'>a\nAC>G\n>b\nTT\n', dtype=np.uint8)
+
+    actual = fasta._find_record_starts(data)
+    np.testing.assert_array_equal(actual, np.array([0, 8]))  # '>' inside a line does not start a record
+
+
+def test_FastaFile(tmp_path):
+    seq_file = tmp_path / 'sequences.fasta'
+    seq_file.write_bytes(b'>NC_013451 first genome\nACGTn\nacg\r\n>NC_015723\n\n>NC_1\nTTTT')
+
+    with fasta.FastaFile(str(seq_file)) as f:
+        assert len(f) == 3
+        assert f.ids == ['NC_013451', 'NC_015723', 'NC_1']
+        assert f[0].tobytes() == b'acgtnacg'
+        assert f[1].tobytes() == b''
+        assert f[2].tobytes() == b'tttt'  # last line without a newline
+        assert f[0].dtype == np.uint8
+
+
+def test_FastaFile__random_access(tmp_path):
+    seq_file = tmp_path / 'sequences.fasta'
+    seq_file.write_text('>a\nAAAA\n>b\nCCCC\n>c\nGGGG\n')
+
+    with fasta.FastaFile(str(seq_file)) as f:
+        assert f[2].tobytes() == b'gggg'
+        assert f[0].tobytes() == b'aaaa'
+
+
+def test_FastaFile__empty_file(tmp_path):
+    seq_file = tmp_path / 'sequences.fasta'
+    seq_file.write_text('')
+
+    with fasta.FastaFile(str(seq_file)) as f:
+        assert len(f) == 0
+
+
+def test_iter_sequences__matches_seqio(tmp_path):
+    seq_file = tmp_path / 'sequences.fasta'
+    seq_file.write_text('>NC_013451 Staphylococcus aureus\nACGTACGTAC\nGTNNacgt\n>NC_015723\nTTGCA\nT\n>NC_1\nG\n')
+
+    expected = [(record.id, str(record.seq).lower()) for record in SeqIO.parse(str(seq_file), 'fasta')]
+    actual = [(record_id, seq.tobytes().decode()) for record_id, seq in fasta.iter_sequences(str(seq_file))]
+    assert actual == expected
@@ -1,4 +1,5 @@
 import numpy as np
+import pytest
 import packages.linear_model.gradient_descent as gd
 from scipy.sparse import csr_matrix
 
@@ -54,7 +55,7 @@ def test__get_y_predictions():
 
     expected = np.exp(np.matmul(X, w)) / (np.ones(3) + np.exp(np.matmul(X, w)))
     actual = gd.get_y_predictions(X, w)
-    np.testing.assert_array_equal(actual, expected)
+    np.testing.assert_allclose(actual, expected)
 
 
 def test__get_y_predictions__sparse():
@@ -67,7 +68,7 @@ def test__get_y_predictions__sparse():
 
     expected = np.exp(np.matmul(X_dense, w)) / (np.ones(3) + np.exp(np.matmul(X_dense, w)))
     actual = gd.get_y_predictions(X, w)
-    np.testing.assert_array_equal(actual, expected)
+    np.testing.assert_allclose(actual, expected)
 
 
 def test__calc_gradient():
@@ -156,3 +157,175 @@ def test__calc_log_likelihood__sparse():
     expected = 17 - 84.00000004139937
     actual = gd._calc_log_likelihood(X, y_true, w)
     assert actual == expected
+
+
+def test__calc_recall():
+    X = np.array([[1, 1],
+                  [1, -1],
+                  [1, 2],
+                  [1, 3]])
+    w = np.array([0, 1])
+    y_true = np.array([1, 1, 0, 1])
+
+    # predicted labels are [1, 0, 1, 1]
+    expected = 2 / 3
+    actual = gd._calc_recall(X, y_true, w)
+    assert actual == expected
+
+
+def test__calc_recall__no_positive_samples():
+    X = np.array([[1, 1],
+                  [1, -1]])
+    w = np.array([0, 1])
+    y_true = np.array([0, 0])
+    assert gd._calc_recall(X, y_true, w) == 0
+
+
+def test_gradient_descent__history():
+    X = csr_matrix(np.array([[1, 4, 5],
+                             [1, 3, 5]]))
+    y_true = np.array([1, 0])
+    w = np.zeros(3)
+
+    weights, history = gd.gradient_descent(X, y_true, w, eta=0.01, epsilon=0, max_iter=5, return_history=True)
+
+    assert len(weights) == 3
+    assert history['n_iter'] == 5
+    assert history['stop_reason'] == 'max_iter'
+    for key in ['log_likelihood', 'gradient_norm', 'step_size', 'wall_time']:
+        assert len(history[key]) == 5
+    assert history['val_recall'] == []
+
+    # log likelihood increases and time moves forward
+    assert np.all(np.diff(history['log_likelihood']) > 0)
+    assert np.all(np.diff(history['wall_time']) >= 0)
+
+
+def test_gradient_descent__early_stopping():
+    X = csr_matrix(np.array([[1, 4, 5],
+                             [1, 3, 5]]))
+    y_true = np.array([1, 0])
+    w = np.zeros(3)
+
+    # validation recall reaches 1 quickly, then cannot improve
+    weights, history = gd.gradient_descent(X, y_true, w, eta=0.01, epsilon=0, max_iter=1000, X_val=X, y_val=y_true,
+                                           patience=3, return_history=True)
+
+    assert history['stop_reason'] == 'early_stopping'
+    assert history['n_iter'] < 1000
+    assert len(history['val_recall']) == history['n_iter']
+    assert gd._calc_recall(X, y_true, weights) == max(history['val_recall'])
+
+
+def test__soft_threshold():
+    w = np.array([0.5, 0.05, -0.3, 0.2, -0.1])
+    threshold = 0.1
+
+    expected = np.array([0.5, 0, -0.2, 0.1, 0])  # intercept is unchanged
+    actual = gd._soft_threshold(w, threshold)
+    np.testing.assert_allclose(actual, expected, atol=1e-16)
+
+
+def test__update_weights_l1():
+    eta = 0.01
+    gradient = np.array([1, -2, 3])
+    w = np.array([4, 0.01, 6])
+    l1_lambda = 2
+
+    expected = np.array([4.01, 0, 6.01])
+    actual = gd._update_weights_l1(w, eta, gradient, l1_lambda)
+    np.testing.assert_allclose(actual, expected, atol=1e-15)
+
+
+def test__update_weights_elasticnet():
+    eta = 0.01
+    gradient = np.array([1, -2, 3])
+    w = np.array([4, 5, 6])
+    l1_lambda = 2
+    l2_lambda = 0.5
+
+    expected = np.array([3.99, 4.935, 5.98])
+    actual = gd._update_weights_elasticnet(w, eta, gradient, l1_lambda, l2_lambda)
+    np.testing.assert_allclose(actual, expected, atol=1e-15)
+
+
+def test_gradient_descent__l1_penalty_sparse_weights():
+    X = csr_matrix(np.array([[1, 1, 0, 1],
+                             [1, 0, 1, 1],
+                             [1, 1, 0, 0],
+                             [1, 0, 1, 0]]))
+    y_true = np.array([1, 0, 1, 0])
+    w = np.zeros(4)
+
+    # last feature carries no information and should be removed by the penalty
+    weights = gd.gradient_descent(X, y_true, w, eta=0.1, epsilon=1e-6, penalty='l1', max_iter=200, l1_lambda=0.5)
+    assert weights[3] == 0
+    assert weights[1] > 0
+    assert weights[2] < 0
+
+
+def test_gradient_descent__float32():
+    X = csr_matrix(np.array([[1, 4, 5],
+                             [1, 3, 5]]))
+    y_true = np.array([1, 0])
+    w = np.zeros(3)
+
+    weights = gd.gradient_descent(X, y_true, w, eta=0.01, epsilon=0, max_iter=5, penalty='l2', l2_lambda=0.1,
+                                  dtype=np.float32)
+    assert weights.dtype == np.float32
+
+    expected = gd.gradient_descent(X, y_true, w, eta=0.01, epsilon=0, max_iter=5, penalty='l2', l2_lambda=0.1)
+    np.testing.assert_allclose(weights, expected, rtol=1e-5)
+
+
+def test__get_y_predictions__float32():
+    X = csr_matrix(np.array([[.1, .5, .2, .1],
+                             [.1, .1, .2, .1]], dtype=np.float32))
+    w = np.array([2, 4, 5, 6], dtype=np.float32)
+
+    actual = gd.get_y_predictions(X, w)
+    assert actual.dtype == np.float32
+
+
+def test_gradient_descent__float32_large_inner_product():
+    rng = np.random.RandomState(0)
+    y_true = np.repeat([1, 0], 50)
+    X = rng.randint(0, 20, size=(100, 30)) * (rng.rand(100, 30) < 0.2)
+    X[:, 1:6] += 10 * y_true[:, None]  # informative features push A far beyond the float32 range of exp(A)
+    X[:, 0] = 1
+    X = csr_matrix(X)
+    w = np.zeros(30)
+
+    expected, expected_history = gd.gradient_descent(X, y_true, w, eta=0.1, epsilon=0.01, max_iter=50,
+                                                     return_history=True)
+    actual, history = gd.gradient_descent(X, y_true, w, eta=0.1, epsilon=0.01, max_iter=50, return_history=True,
+                                          dtype=np.float32)
+
+    assert np.all(np.isfinite(actual))
+    assert history['stop_reason'] == expected_history['stop_reason']
+    assert history['n_iter'] == expected_history['n_iter']
+    np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-3)
+    assert gd._calc_recall(X, y_true, actual) == gd._calc_recall(X, y_true, expected) == 1
+
+
+def test_gradient_descent__diverged():
+    X = csr_matrix(np.array([[1, 4, 5],
+                             [1, 3, 5]]))
+    y_true = np.array([1, 0])
+    w = np.zeros(3)
+
+    # step is large enough to overflow the weights
+    weights, history = gd.gradient_descent(X, y_true, w, eta=1e308, epsilon=0.01, max_iter=10, return_history=True)
+    assert history['stop_reason'] == 'diverged'
+    assert np.all(np.isfinite(weights))
+
+
+def test_gradient_descent__l1_penalty_without_lambda():
+    X = csr_matrix(np.array([[1, 4, 5],
+                             [1, 3, 5]]))
+    y_true = np.array([1, 0])
+    w = np.zeros(3)
+
+    for penalty in ['l1', 'elasticnet']:
+        with pytest.raises(ValueError):
+            gd.gradient_descent(X, y_true, w, eta=0.01, epsilon=0.01, penalty=penalty)
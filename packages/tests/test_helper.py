@@ -0,0 +1,624 @@
+from packages.gridsearch import helper
+import pytest
+import numpy as np
+import os
+import tracemalloc
+
+
+def _make_entry(cache_dir, name, size, mtime):
+    entry_dir = os.path.join(cache_dir, name)
+    os.makedirs(entry_dir)
+    with open(os.path.join(entry_dir, 'data'), 'wb') as f:
+        f.write(b'0' * size)
+    os.utime(entry_dir, (mtime, mtime))
+
+
+def test_fragment_cache_key__same_inputs(input_files):
+    seq_file, taxid_file = input_files
+
+    expected = helper.fragment_cache_key(seq_file, taxid_file, 100, 1, 42)
+    actual = helper.fragment_cache_key(seq_file, taxid_file, 100, 1.0, 42)
+    assert actual == expected
+
+
+def test_fragment_cache_key__changes_with_parameters(input_files):
+    seq_file, taxid_file = input_files
+
+    key = helper.fragment_cache_key(seq_file, taxid_file, 100, 1, 42)
+    assert helper.fragment_cache_key(seq_file, taxid_file, 100, 1, 43) != key
+    assert helper.fragment_cache_key(seq_file, taxid_file, 200, 1, 42) != key
+    assert helper.fragment_cache_key(seq_file, taxid_file, 100, 2, 42) != key
+
+
+def test_fragment_cache_key__changes_with_file_contents(input_files):
+    seq_file, taxid_file = input_files
+    key = helper.fragment_cache_key(seq_file, taxid_file, 100, 1, 42)
+
+    with open(taxid_file, 'w') as f:
+        f.write('100\n100\n200\n300\n')
+    assert helper.fragment_cache_key(seq_file, taxid_file, 100, 1, 42) != key
+
+
+def test_build_fragments__cache_miss_then_hit(input_files, tmp_path):
+    seq_file, taxid_file = input_files
+    cache_dir = str(tmp_path / 'cache')
+
+    timings = {}
+    fragment_dir = helper.build_fragments(seq_file, taxid_file, str(tmp_path / 'output'), 100, 1, 42, cache_dir,
+                                          timings=timings)
+    assert 'sampling_time' in timings
+    assert fragment_dir == os.path.join(cache_dir, helper.fragment_cache_key(seq_file, taxid_file, 100, 1, 42))
+    assert len(os.listdir(fragment_dir)) == 4
+    assert os.listdir(cache_dir) == [os.path.basename(fragment_dir)]  # no temporary directories left behind
+
+    timings = {}
+    actual = helper.build_fragments(seq_file, taxid_file, str(tmp_path / 'output'), 100, 1, 42, cache_dir,
+                                    timings=timings)
+    assert actual == fragment_dir
+    assert 'sampling_time' not in timings  # served from cache without sampling
+
+
+def test_build_fragments__unseeded_not_cached(input_files, tmp_path):
+    seq_file, taxid_file = input_files
+    cache_dir = str(tmp_path / 'cache')
+    output_dir = str(tmp_path / 'output')
+
+    actual = helper.build_fragments(seq_file, taxid_file, output_dir, 100, 1, None, cache_dir)
+    assert actual == output_dir
+    assert not os.path.exists(cache_dir)
+
+
+def test_evict_cache__deletes_least_recently_used(tmp_path):
+    cache_dir = str(tmp_path)
+    _make_entry(cache_dir, 'a', 100, 1000)
+    _make_entry(cache_dir, 'b', 100, 3000)
+    _make_entry(cache_dir, 'c', 100, 2000)
+
+    deleted = helper.evict_cache(cache_dir, 200)
+    assert deleted == ['a']
+    assert sorted(os.listdir(cache_dir)) == ['b', 'c']
+
+
+def test_evict_cache__under_limit(tmp_path):
+    cache_dir = str(tmp_path)
+    _make_entry(cache_dir, 'a', 100, 1000)
+    _make_entry(cache_dir, 'b', 100, 2000)
+
+    assert helper.evict_cache(cache_dir, 200) == []
+    assert sorted(os.listdir(cache_dir)) == ['a', 'b']
+
+
+def test_evict_cache__keep(tmp_path):
+    cache_dir = str(tmp_path)
+    _make_entry(cache_dir, 'a', 100, 1000)
+    _make_entry(cache_dir, 'b', 100, 2000)
+    _make_entry(cache_dir, 'c', 100, 3000)
+
+    deleted = helper.evict_cache(cache_dir, 100, keep='a')
+    assert deleted == ['b', 'c']
+    assert os.listdir(cache_dir) == ['a']
+
+
+def test_evict_cache__ignores_temporary_directories(tmp_path):
+    cache_dir = str(tmp_path)
+    _make_entry(cache_dir, '.tmp-1', 100, 1000)
+    _make_entry(cache_dir, 'a', 100, 2000)
+
+    assert helper.evict_cache(cache_dir, 0, keep='a') == []
+    assert sorted(os.listdir(cache_dir)) == ['.tmp-1', 'a']
+
+
+@pytest.fixture
+def fragment_dir(input_files, tmp_path):
+    seq_file, taxid_file = input_files
+    return helper.build_fragments(seq_file, taxid_file, str(tmp_path / 'fragments'), 50, 1, 42)
+
+
+def test_encoding_cache_key__changes_with_parameters(fragment_dir):
+    key = helper.encoding_cache_key(fragment_dir, '*.npy', 3, np.float64)
+
+    assert helper.encoding_cache_key(fragment_dir, '*.npy', 3, np.float64) == key
+    assert helper.encoding_cache_key(fragment_dir, '*.npy', 4, np.float64) != key
+    assert helper.encoding_cache_key(fragment_dir, '*.npy', 3, np.float32) != key
+
+
+def test_encoding_cache_key__changes_with_fragment_contents(fragment_dir):
+    key = helper.encoding_cache_key(fragment_dir, '*.npy', 3)
+
+    filename = os.path.join(fragment_dir, sorted(os.listdir(fragment_dir))[0])
+    fragments = np.load(filename)
+    np.save(filename, fragments[:-1])
+    assert helper.encoding_cache_key(fragment_dir, '*.npy', 3) != key
+
+
+def test_load_encoded_fragments__cached_matches_fresh(fragment_dir, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    X_expected, y_expected = helper.load_encoded_fragments(fragment_dir, '*.npy', 3, np.float32)
+
+    timings = {}
+    X_miss, y_miss = helper.load_encoded_fragments(fragment_dir, '*.npy', 3, np.float32, cache_dir, timings=timings)
+    assert 'encoding_time' in timings
+
+    timings = {}
+    X_hit, y_hit = helper.load_encoded_fragments(fragment_dir, '*.npy', 3, np.float32, cache_dir, timings=timings)
+    assert 'encoding_time' not in timings  # read from cache without encoding
+
+    for X_actual, y_actual in [(X_miss, y_miss), (X_hit, y_hit)]:
+        assert X_actual.dtype == np.float32
+        assert X_actual.shape == X_expected.shape
+        assert (X_actual != X_expected).nnz == 0
+        np.testing.assert_array_equal(y_actual, y_expected)
+
+
+def test_load_encoded_fragments__cached_categories(fragment_dir, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    X_expected, _, expected = helper.load_encoded_fragments(fragment_dir, '*.npy', 3, return_categories=True)
+
+    helper.load_encoded_fragments(fragment_dir, '*.npy', 3, cache_dir=cache_dir)
+    X_actual, _, actual = helper.load_encoded_fragments(fragment_dir, '*.npy', 3, cache_dir=cache_dir,
+                                                        return_categories=True)
+
+    assert len(actual) == len(expected)
+    for actual_kmers, expected_kmers in zip(actual, expected):
+        np.testing.assert_array_equal(actual_kmers, expected_kmers)
+    assert X_actual.shape[1] == sum(len(each) for each in actual)
+
+
+def test_stratified_split_indices__all_classes_in_both_sets():
+    y = np.array([0] * 10 + [1] * 2 + [2] * 3 + [3] * 100)
+
+    train_idx, test_idx = helper.stratified_split_indices(y, 0.33, 42)
+    np.testing.assert_array_equal(np.unique(y[train_idx]), np.arange(4))
+    np.testing.assert_array_equal(np.unique(y[test_idx]), np.arange(4))
+
+
+def test_stratified_split_indices__class_counts():
+    y = np.array(['b'] * 10 + ['a'] * 2 + ['c'] * 3 + ['d'] * 100)
+
+    train_idx, test_idx = helper.stratified_split_indices(y, 0.33, 42)
+    classes, test_counts = np.unique(y[test_idx], return_counts=True)
+    np.testing.assert_array_equal(classes, np.array(['a', 'b', 'c', 'd']))
+    np.testing.assert_array_equal(test_counts, np.array([1, 3, 1, 33]))  # round(0.33 * n), between 1 and n - 1
+
+    # every row is in exactly one set
+    np.testing.assert_array_equal(np.sort(np.concatenate((train_idx, test_idx))), np.arange(len(y)))
+
+
+def test_stratified_split_indices__same_seed():
+    y = np.repeat(np.arange(5), 20)
+
+    train_1, test_1 = helper.stratified_split_indices(y, 0.33, 7)
+    train_2, test_2 = helper.stratified_split_indices(y, 0.33, 7)
+    train_3, test_3 = helper.stratified_split_indices(y, 0.33, 8)
+    np.testing.assert_array_equal(train_1, train_2)
+    np.testing.assert_array_equal(test_1, test_2)
+    assert not np.array_equal(test_1, test_3)
+
+
+def test_stratified_split_indices__singleton_class():
+    y = np.array([0, 0, 0, 1, 2, 2])
+
+    with pytest.raises(ValueError):
+        helper.stratified_split_indices(y, 0.33, 42)
+
+
+def test_encode_fragments__return_indices(fragment_dir):
+    X_train, X_test, y_train, y_test = helper.encode_fragments(fragment_dir, '*.npy', 3, 42)
+    X_enc, y_enc, train_idx, test_idx = helper.encode_fragments(fragment_dir, '*.npy', 3, 42, return_indices=True)
+
+    assert (X_enc[train_idx] != X_train).nnz == 0
+    assert (X_enc[test_idx] != X_test).nnz == 0
+    np.testing.assert_array_equal(y_enc[train_idx], y_train)
+    np.testing.assert_array_equal(y_enc[test_idx], y_test)
+
+
+class _CountingModel:
+    def __init__(self, sample_length, coverage, k):
+        self.key = (sample_length, coverage, k)
+        self.n_fits = 0
+
+
+def _score_with_model(X_train, X_test, y_train, y_test, value, model=None, timings=None):
+    model.n_fits += 1
+    return value
+
+
+def test_run_grid_search__model_factory_and_result_hook(input_files, tmp_path):
+    seq_file, taxid_file = input_files
+    grid_search_file = str(tmp_path / 'results.csv')
+    models = []
+    results = []
+
+    def model_factory(sample_length, coverage, k):
+        models.append(_CountingModel(sample_length, coverage, k))
+        return models[-1]
+
+    helper.run_grid_search(seq_file, taxid_file, str(tmp_path / 'output'), '*.npy', [50], [1], [2, 3], [(0.5,), (0.7,)],
+                           _score_with_model, 42, grid_search_file, ['shape', 'L', 'c', 'k', 'value', 'score'], [], [],
+                           n_jobs=4, model_factory=model_factory, result_hook=results.append)
+
+    # one model per encoding, shared by its hyperparameter combinations
+    assert [model.key for model in models] == [(50, 1, 2), (50, 1, 3)]
+    assert [model.n_fits for model in models] == [2, 2]
+    assert [(result['k'], result['params'], result['score']) for result in results] == [(2, (0.5,), 0.5),
+                                                                                       (2, (0.7,), 0.7),
+                                                                                       (3, (0.5,), 0.5),
+                                                                                       (3, (0.7,), 0.7)]
+    assert results[0]['model'] is models[0]
+    np.testing.assert_array_equal(results[0]['classes'], np.array(['100', '200']))
+    assert len(results[0]['categories']) == 50 // 2
+    assert len(helper.read_ledger(grid_search_file)) == 4
+
+
+def test_run_grid_search__result_hook_with_folds(input_files, tmp_path):
+    seq_file, taxid_file = input_files
+
+    with pytest.raises(ValueError):
+        helper.run_grid_search(seq_file, taxid_file, str(tmp_path / 'output'), '*.npy', [50], [1], [2], [(0.5,)],
+                               _score_with_model, 42, str(tmp_path / 'results.csv'), [], [], [], n_folds=2,
+                               result_hook=print)
+
+
+def test_read_ledger__no_ledger(tmp_path):
+    assert helper.read_ledger(str(tmp_path / 'results.csv')) == {}
+
+
+def test_read_ledger__truncated_last_line(tmp_path):
+    grid_search_file = str(tmp_path / 'results.csv')
+    helper.append_results_to_file(grid_search_file, fields=['k', 'score'])
+    helper._record_result(grid_search_file, 'a', [1, 0.5])
+    helper._record_result(grid_search_file, 'b', [2, 0.6])
+
+    # killed while writing a third combination
+    with open(grid_search_file + helper.LEDGER_SUFFIX, 'a') as f:
+        f.write('{"key": "c", "ro')
+    with open(grid_search_file, 'a') as f:
+        f.write('3,0.')
+
+    completed = helper.read_ledger(grid_search_file)
+    assert completed == {'a': '1,0.5\r\n', 'b': '2,0.6\r\n'}
+    with open(grid_search_file, newline='') as f:
+        assert f.read() == 'k,score\r\n1,0.5\r\n2,0.6\r\n'
+    with open(grid_search_file + helper.LEDGER_SUFFIX) as f:
+        assert len(f.read().splitlines()) == 2
+
+
+def test_read_ledger__restores_missing_row(tmp_path):
+    grid_search_file = str(tmp_path / 'results.csv')
+    helper.append_results_to_file(grid_search_file, fields=['k', 'score'])
+    helper._record_result(grid_search_file, 'a', [1, 0.5])
+
+    # killed after the ledger entry was written, before the row was appended
+    helper._append_durably(grid_search_file + helper.LEDGER_SUFFIX, '{"key": "b", "row": "2,0.6\\r\\n"}\n')
+
+    completed = helper.read_ledger(grid_search_file)
+    assert sorted(completed) == ['a', 'b']
+    with open(grid_search_file, newline='') as f:
+        assert f.read() == 'k,score\r\n1,0.5\r\n2,0.6\r\n'
+
+
+def test_run_grid_search__results_file_deleted(input_files, tmp_path):
+    seq_file, taxid_file = input_files
+    grid_search_file = str(tmp_path / 'results.csv')
+    fields = ['shape', 'L', 'c', 'k', 'value', 'score']
+    args = (seq_file, taxid_file, str(tmp_path / 'output'), '*.npy', [50], [1], [2], [(1,), (2,)], _score_value, 42,
+            grid_search_file, fields, [], [])
+
+    helper.run_grid_search(*args)
+    with open(grid_search_file, newline='') as f:
+        expected = f.read()
+
+    # rows of every completed combination are restored below the header
+    os.remove(grid_search_file)
+    helper.run_grid_search(*args)
+    with open(grid_search_file, newline='') as f:
+        assert f.read() == expected
+
+
+_SCORED = []
+
+
+def _score_and_remember(X_train, X_test, y_train, y_test, value, timings=None):
+    _SCORED.append(value)
+    return value
+
+
+def test_run_grid_search__skips_completed_combinations(input_files, tmp_path):
+    seq_file, taxid_file = input_files
+    grid_search_file = str(tmp_path / 'results.csv')
+    fields = ['shape', 'L', 'c', 'k', 'value', 'score']
+    _SCORED.clear()
+
+    helper.run_grid_search(seq_file, taxid_file, str(tmp_path / 'output'), '*.npy', [50], [1], [2], [(1,), (2,)],
+                           _score_and_remember, 42, grid_search_file, fields, [], [])
+    assert _SCORED == [1, 2]
+
+    # run again with a larger grid; only the new combinations are scored
+    _SCORED.clear()
+    helper.run_grid_search(seq_file, taxid_file, str(tmp_path / 'output'), '*.npy', [50], [1], [2, 3],
+                           [(1,), (2,), (3,)], _score_and_remember, 42, grid_search_file, fields, [], [])
+    assert _SCORED == [3, 1, 2, 3]
+
+    results = helper._read_results(grid_search_file)
+    assert len(results) == 6
+    assert list(results['k']) == [2, 2, 2, 3, 3, 3]
+
+
+def _allocate(timings, stage, size_mb):
+    with helper.timed_stage(timings, stage):
+        data = np.ones(size_mb * 1024 ** 2 // 8)
+        del data
+
+
+def test_timed_stage__measures_each_stage_separately():
+    timings = {}
+    kept = np.ones(10 * 1024 ** 2 // 8)  # allocated before the stages, so not counted
+
+    with helper.memory_tracing():
+        _allocate(timings, 'encoding', 40)
+        _allocate(timings, 'fitting', 8)
+    del kept
+
+    assert timings['encoding_time'] > 0
+    assert 38 < timings['encoding_peak_memory'] < 45
+    assert 7 < timings['fitting_peak_memory'] < 12  # not the peak of the earlier stage
+
+
+def test_timed_stage__keeps_largest_peak():
+    timings = {}
+
+    with helper.memory_tracing():
+        _allocate(timings, 'fitting', 20)
+        _allocate(timings, 'fitting', 5)
+    assert 18 < timings['fitting_peak_memory'] < 25
+
+
+def test_timed_stage__memory_not_traced():
+    timings = {}
+
+    _allocate(timings, 'fitting', 8)
+    assert timings['fitting_time'] > 0
+    assert 'fitting_peak_memory' not in timings
+
+
+def test_timed_stage__no_timings():
+    with helper.timed_stage(None, 'fitting'):
+        pass
+
+
+def test_memory_tracing():
+    with helper.memory_tracing(enabled=False):
+        assert not tracemalloc.is_tracing()
+
+    with helper.memory_tracing():
+        assert tracemalloc.is_tracing()
+        with helper.memory_tracing():
+            pass
+        assert tracemalloc.is_tracing()  # only stopped by the block which started it
+    assert not tracemalloc.is_tracing()
+
+
+def _score_value(X_train, X_test, y_train, y_test, value, timings=None):
+    return value
+
+
+def test_run_grid_search__trace_memory(input_files, tmp_path):
+    seq_file, taxid_file = input_files
+    fields = ['shape', 'L', 'c', 'k', 'value', 'score']
+
+    for trace_memory in [False, True]:
+        grid_search_file = str(tmp_path / '{}.csv'.format(trace_memory))
+        helper.run_grid_search(seq_file, taxid_file, str(tmp_path / 'output'), '*.npy', [50], [1], [2], [(0.5,)],
+                               _score_value, 42, grid_search_file, fields, [], [], trace_memory=trace_memory)
+
+        results = helper._read_results(grid_search_file)
+        assert results['encoding_time'][0] > 0
+        assert results['encoding_peak_memory'].notna()[0] == trace_memory  # left empty unless traced
+    assert not tracemalloc.is_tracing()
+
+
+def test_run_grid_search__process_pool(input_files, tmp_path):
+    seq_file, taxid_file = input_files
+    grid_search_file = str(tmp_path / 'results.csv')
+    output_dir = str(tmp_path / 'output')
+
+    helper.run_grid_search(seq_file, taxid_file, output_dir, '*.npy', [50, 60], [1], [2, 3], [(0.5,), (0.7,)],
+                           _score_value, 42, grid_search_file, ['shape', 'L', 'c', 'k', 'value', 'score'], [], [],
+                           n_jobs=2)
+
+    # rows are written in the order fits finish
+    results = helper._read_results(grid_search_file).sort_values(['L', 'k', 'value'])
+    assert len(results) == 8
+    assert list(results['L']) == [50] * 4 + [60] * 4
+    assert list(results['k']) == [2, 2, 3, 3] * 2
+    assert list(results['score']) == [0.5, 0.7] * 4
+    assert results.groupby(['L', 'k'])['shape'].nunique().tolist() == [1] * 4  # one encoding per (L, k)
+
+    expected = {helper._combination_key(L, 1, 0, k, (value,)) for L in [50, 60] for k in [2, 3] for value in [0.5, 0.7]}
+    assert set(helper.read_ledger(grid_search_file)) == expected
+    assert os.listdir(output_dir) == []  # fragments and saved encodings are deleted once used
+
+
+def test_group_split_indices():
+    y = np.array([0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2])
+    groups = np.array(['a', 'a', 'b', 'b', 'c', 'c', 'd', 'd', 'e', 'e', 'f', 'f'])
+
+    train_idx, test_idx = helper.group_split_indices(y, groups, 0.33, 42)
+    np.testing.assert_array_equal(np.sort(np.concatenate((train_idx, test_idx))), np.arange(len(y)))
+
+    # no group in both sets; one group of each class with several groups is held out
+    assert not set(groups[train_idx]) & set(groups[test_idx])
+    assert len(set(groups[test_idx])) == 2
+    np.testing.assert_array_equal(np.unique(y[test_idx]), np.array([0, 1]))
+    assert 2 in y[train_idx]  # class with a single group is only used for training
+
+
+def test_group_split_indices__same_seed():
+    y = np.repeat(np.arange(3), 20)
+    groups = np.arange(60) // 4
+
+    train_1, test_1 = helper.group_split_indices(y, groups, 0.33, 7)
+    train_2, test_2 = helper.group_split_indices(y, groups, 0.33, 7)
+    np.testing.assert_array_equal(train_1, train_2)
+    np.testing.assert_array_equal(test_1, test_2)
+
+
+def test_group_split_indices__every_class_single_group():
+    y = np.array([0, 0, 1, 1, 2])
+    groups = np.array([0, 0, 1, 1, 2])
+
+    with pytest.raises(ValueError):
+        helper.group_split_indices(y, groups, 0.33, 42)
+
+
+def test_group_split_indices__mixed_group():
+    y = np.array([0, 1, 1, 1])
+    groups = np.array([0, 0, 1, 2])
+
+    with pytest.raises(ValueError):
+        helper.group_split_indices(y, groups, 0.33, 42)
+
+
+def test_get_record_groups__sequence(input_files):
+    seq_file, _ = input_files
+
+    np.testing.assert_array_equal(helper.get_record_groups(seq_file, 'sequence'), np.arange(4))
+
+
+def test_get_record_groups__strain(input_files, tmp_path):
+    seq_file, _ = input_files
+    meta_file = tmp_path / 'train.meta'
+    meta_file.write_text('sequence.id\tgenome.id\ttaxid.strain\ttaxid.species\ttaxid.genus\n'
+                         '1\tNC_0\t101\t100\t10\n'
+                         '2\tNC_1\t101\t100\t10\n'
+                         '3\tNC_2\t201\t200\t20\n'
+                         '4\tNC_3\t202\t200\t20\n'
+                         '5\tNC_9\t301\t300\t30\n')
+
+    actual = helper.get_record_groups(seq_file, 'strain', str(meta_file))
+    np.testing.assert_array_equal(actual, np.array(['101', '101', '201', '202']))
+
+
+def test_get_record_groups__strain_missing_sequence(input_files, tmp_path):
+    seq_file, _ = input_files
+    meta_file = tmp_path / 'train.meta'
+    meta_file.write_text('sequence.id\tgenome.id\ttaxid.strain\ttaxid.species\ttaxid.genus\n'
+                         '1\tNC_0\t101\t100\t10\n')
+
+    with pytest.raises(ValueError):
+        helper.get_record_groups(seq_file, 'strain', str(meta_file))
+    with pytest.raises(ValueError):
+        helper.get_record_groups(seq_file, 'strain')
+
+
+def test_get_record_groups__unknown_split(input_files):
+    seq_file, _ = input_files
+
+    with pytest.raises(ValueError):
+        helper.get_record_groups(seq_file, 'genus')
+
+
+def test_stratified_kfold_indices():
+    y = np.array([0] * 10 + [1] * 7 + [2] * 3)
+
+    folds = helper.stratified_kfold_indices(y, 3, 42)
+    assert len(folds) == 3
+
+    test_sets = [test_idx for _, test_idx in folds]
+    np.testing.assert_array_equal(np.sort(np.concatenate(test_sets)), np.arange(len(y)))  # disjoint and covering
+
+    for train_idx, test_idx in folds:
+        np.testing.assert_array_equal(np.sort(np.concatenate((train_idx, test_idx))), np.arange(len(y)))
+
+    # rows of each class are spread evenly across folds
+    counts = np.array([np.bincount(y[test_idx], minlength=3) for test_idx in test_sets])
+    assert np.all(counts.max(axis=0) - counts.min(axis=0) <= 1)
+    np.testing.assert_array_equal(counts.sum(axis=0), np.array([10, 7, 3]))
+
+
+def test_stratified_kfold_indices__same_seed():
+    y = np.repeat(np.arange(4), 10)
+
+    folds_1 = helper.stratified_kfold_indices(y, 5, 7)
+    folds_2 = helper.stratified_kfold_indices(y, 5, 7)
+    for (train_1, test_1), (train_2, test_2) in zip(folds_1, folds_2):
+        np.testing.assert_array_equal(train_1, train_2)
+        np.testing.assert_array_equal(test_1, test_2)
+
+
+def test_stratified_kfold_indices__groups():
+    y = np.repeat([0, 0, 0, 1, 1, 1, 2], 3)
+    groups = np.repeat(np.arange(7), 3)
+
+    folds = helper.stratified_kfold_indices(y, 3, 42, groups)
+    for train_idx, test_idx in folds:
+        assert not set(groups[train_idx]) & set(groups[test_idx])  # each group is in a single fold
+        assert 6 not in groups[test_idx]  # class with a single group is only used for training
+
+    test_groups = np.concatenate([np.unique(groups[test_idx]) for _, test_idx in folds])
+    np.testing.assert_array_equal(np.sort(test_groups), np.arange(6))
+
+
+def test_stratified_kfold_indices__invalid():
+    with pytest.raises(ValueError):
+        helper.stratified_kfold_indices(np.array([0, 0, 1, 1]), 1)
+    with pytest.raises(ValueError):
+        helper.stratified_kfold_indices(np.array([0, 0, 1]), 2)  # class with a single row
+    with pytest.raises(ValueError):
+        helper.stratified_kfold_indices(np.array([0, 0, 1, 1]), 2, groups=np.array([0, 0, 1, 1]))
+
+
+def test_stratified_kfold_indices__fewer_groups_than_folds():
+    y = np.repeat([0, 0, 1, 1], 3)
+    groups = np.repeat(np.arange(4), 3)
+
+    assert all(len(test_idx) > 0 for _, test_idx in helper.stratified_kfold_indices(y, 4, 42, groups))
+    with pytest.raises(ValueError):
+        helper.stratified_kfold_indices(y, 5, 42, groups)  # a fold would have an empty test set
+
+
+def test_stratified_kfold_indices__fewer_rows_than_folds():
+    with pytest.raises(ValueError):
+        helper.stratified_kfold_indices(np.array([0, 0, 1, 1]), 5)
+
+
+_FOLDS_FIT = []
+
+
+def _score_and_remember_fold(X_train, X_test, y_train, y_test, value, timings=None):
+    _FOLDS_FIT.append((value, X_train.shape[0]))
+    return value
+
+
+def test_cross_validate__skips_completed_folds(fragment_dir):
+    _FOLDS_FIT.clear()
+
+    results = list(helper.cross_validate(fragment_dir, '*.npy', 3, _score_and_remember_fold, [(1,), (2,)], 3, 42,
+                                         completed=[((1,), 0), ((1,), 2), ((2,), 1)]))
+    assert [(params, fold) for params, fold, _, _, _ in results] == [((1,), 1), ((2,), 0), ((2,), 2)]
+    assert [value for value, _ in _FOLDS_FIT] == [1, 2, 2]
+
+
+def test_run_grid_search__folds_resume(input_files, tmp_path):
+    seq_file, taxid_file = input_files
+    grid_search_file = str(tmp_path / 'results.csv')
+    fields = ['shape', 'L', 'c', 'k', 'value', 'score']
+
+    _FOLDS_FIT.clear()
+    helper.run_grid_search(seq_file, taxid_file, str(tmp_path / 'output'), '*.npy', [50], [1], [2], [(1,)],
+                           _score_and_remember_fold, 42, grid_search_file, fields, [], [], n_folds=3)
+    assert len(_FOLDS_FIT) == 3
+
+    # drop the last fold, as if the run was killed before it finished
+    for filename in [grid_search_file, grid_search_file + helper.LEDGER_SUFFIX]:
+        with open(filename, newline='') as f:
+            lines = f.readlines()
+        with open(filename, 'w', newline='') as f:
+            f.writelines(lines[:-1])
+
+    _FOLDS_FIT.clear()
+    helper.run_grid_search(seq_file, taxid_file, str(tmp_path / 'output'), '*.npy', [50], [1], [2], [(1,)],
+                           _score_and_remember_fold, 42, grid_search_file, fields, [], [], n_folds=3)
+    assert len(_FOLDS_FIT) == 1
+    assert len(helper.read_ledger(grid_search_file)) == 3
+    assert len(helper._read_results(grid_search_file)) == 3
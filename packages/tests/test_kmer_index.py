@@ -0,0 +1,89 @@
+from packages.metagenomics import kmer_index
+import numpy as np
+
+
+def _write_reference(tmp_path):
+    seq_file = tmp_path / 'reference.fasta'
+    seq_file.write_text('>NC_1\nAAAACCCC\n>NC_2\nggggtttt\n>NC_3\nAAAAGAGA\n')
+    taxid_file = tmp_path / 'reference.taxid'
+    taxid_file.write_text('1280\n1280\n562\n')
+    return str(seq_file), str(taxid_file)
+
+
+def test__merge_kmers():
+    kmers = np.array([5, 3, 5, 7, 3], dtype=np.uint64)
+    taxid_idx = np.array([0, 1, 1, 2, 1])
+
+    kmers_actual, taxids_actual = kmer_index._merge_kmers(kmers, taxid_idx)
+    np.testing.assert_array_equal(kmers_actual, np.array([3, 5, 7], dtype=np.uint64))
+    np.testing.assert_array_equal(taxids_actual, np.array([1, -1, 2]))
+
+
+def test_build_index(tmp_path):
+    seq_file, taxid_file = _write_reference(tmp_path)
+
+    index = kmer_index.build_index(seq_file, taxid_file, 4)
+    np.testing.assert_array_equal(index.labels, np.array(['1280', '562']))
+    assert np.all(np.diff(index.kmers.astype(np.int64)) > 0)  # sorted and distinct
+
+    # aaaa is in sequences of both taxids
+    assert index.lookup(np.array([0], dtype=np.uint64))[0] == kmer_index.AMBIGUOUS
+    assert index.lookup(np.array([85], dtype=np.uint64))[0] == 0  # cccc
+    assert index.lookup(np.array([136], dtype=np.uint64))[0] == 1  # gaga
+
+
+def test_lookup__missing_kmers(tmp_path):
+    seq_file, taxid_file = _write_reference(tmp_path)
+
+    index = kmer_index.build_index(seq_file, taxid_file, 4)
+    actual = index.lookup(np.array([17, 2 ** 63], dtype=np.uint64))  # acac, and a code larger than all kmers
+    np.testing.assert_array_equal(actual, np.array([-1, -1]))
+
+
+def test_predict(tmp_path):
+    seq_file, taxid_file = _write_reference(tmp_path)
+    index = kmer_index.build_index(seq_file, taxid_file, 4)
+
+    fragments = np.array([[b'a', b'a', b'c', b'c', b'c', b'c', b'1280'],
+                          [b'a', b'a', b'g', b'a', b'g', b'a', b'562'],
+                          [b'a', b'a', b'a', b'a', b'a', b'n', b'562'],
+                          [b't', b'c', b't', b'c', b't', b'c', b'562']])
+
+    expected = np.array(['1280', '562', kmer_index.UNCLASSIFIED, kmer_index.UNCLASSIFIED])
+    np.testing.assert_array_equal(index.predict(fragments), expected)
+
+
+def test_save_index__load_index(tmp_path):
+    seq_file, taxid_file = _write_reference(tmp_path)
+    index = kmer_index.build_index(seq_file, taxid_file, 4)
+
+    kmer_index.save_index(index, str(tmp_path / 'index'))
+    loaded = kmer_index.load_index(str(tmp_path / 'index'))
+
+    assert loaded.k == 4
+    assert isinstance(loaded.kmers, np.memmap)
+    np.testing.assert_array_equal(loaded.kmers, index.kmers)
+    np.testing.assert_array_equal(loaded.taxids, index.taxids)
+    np.testing.assert_array_equal(loaded.labels, index.labels)
+
+
+def test_build_index__minimizers(tmp_path):
+    rng = np.random.RandomState(0)
+    seqs = [''.join(rng.choice(list('acgt'), 2000)) for _ in range(2)]
+    seq_file = tmp_path / 'reference.fasta'
+    seq_file.write_text('>NC_1\n{}\n>NC_2\n{}\n'.format(*seqs))
+    taxid_file = tmp_path / 'reference.taxid'
+    taxid_file.write_text('1280\n562\n')
+
+    full = kmer_index.build_index(str(seq_file), str(taxid_file), 12)
+    index = kmer_index.build_index(str(seq_file), str(taxid_file), 12, w=10)
+    assert len(index.kmers) < len(full.kmers) / 3
+
+    # fragments sampled from each sequence are still classified
+    starts = rng.randint(0, 1900, 20)
+    fragments = np.array([list(seqs[i % 2][s:s + 100].encode()) for i, s in enumerate(starts)], dtype=np.uint8)
+    fragments = np.column_stack((fragments.view('S1'), np.array([b'1280', b'562'] * 10)))
+    np.testing.assert_array_equal(index.predict(fragments), fragments[:, -1].astype(str))
+
+    kmer_index.save_index(index, str(tmp_path / 'index'))
+    assert kmer_index.load_index(str(tmp_path / 'index')).w == 10
@@ -0,0 +1,54 @@
+from packages.gridsearch import mlr_search
+from packages.linear_model import MulticlassLogisticRegression as mlr
+from scipy.sparse import csr_matrix
+import numpy as np
+
+
+def _data():
+    X = csr_matrix(np.array([[1, 1],
+                             [0, 0],
+                             [1, 0],
+                             [5, 1],
+                             [5, 2],
+                             [5, -1]]))
+    y = np.array([0, 0, 0, 1, 1, 1])
+    return X, X, y, y
+
+
+def test_run_mlr_classification_recall__warm_start_along_l2_lambda():
+    X_train, X_test, y_train, y_test = _data()
+    path = mlr.regularization_path(X_train, y_train, [1.0, 0.1], 0.1, 0, max_iter=5)
+    expected = [model.weights for _, model in path]
+
+    model = mlr.MulticlassLogisticRegression(eta=None, epsilon=None, warm_start=True)
+    for l2_lambda, weights in zip([1.0, 0.1], expected):
+        mlr_search.run_mlr_classification_recall(X_train, X_test, y_train, y_test, 0.1, 0, 'l2', l2_lambda, 5,
+                                                 model=model)
+        np.testing.assert_allclose(model.weights, weights)
+
+
+def test_run_mlr_classification_recall__reset_when_max_iter_changes():
+    X_train, X_test, y_train, y_test = _data()
+    expected = mlr.MulticlassLogisticRegression(eta=0.1, epsilon=0, max_iter=10).fit(X_train, y_train).weights
+
+    model = mlr.MulticlassLogisticRegression(eta=None, epsilon=None, warm_start=True)
+    mlr_search.run_mlr_classification_recall(X_train, X_test, y_train, y_test, 0.1, 0, None, 0, 5, model=model)
+    mlr_search.run_mlr_classification_recall(X_train, X_test, y_train, y_test, 0.1, 0, None, 0, 10, model=model)
+
+    # max_iter=10 row is trained for 10 iterations from zero weights, not 15 iterations in total
+    np.testing.assert_allclose(model.weights, expected)
+
+
+def test_hyperparameter_generator__l1_lambda():
+    actual = list(mlr_search.hyperparameter_generator([0.1], [0.01], [None, 'l1'], [0], [100], [0.5, 1.0]))
+
+    # l1_lambda is only varied for the l1 penalty
+    assert actual == [(0.1, 0.01, None, 0, 100, 0), (0.1, 0.01, 'l1', 0, 100, 0.5), (0.1, 0.01, 'l1', 0, 100, 1.0)]
+
+
+def test_run_mlr_classification_recall__l1_lambda():
+    X_train, X_test, y_train, y_test = _data()
+    model = mlr.MulticlassLogisticRegression(eta=None, epsilon=None)
+
+    mlr_search.run_mlr_classification_recall(X_train, X_test, y_train, y_test, 0.1, 0, 'l1', 0, 5, 0.5, model=model)
+    assert model.l1_lambda == 0.5
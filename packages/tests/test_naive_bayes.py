@@ -0,0 +1,177 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from sklearn.naive_bayes import MultinomialNB
+from packages.generative_model import naive_bayes as nb
+from packages.metagenomics import encoding2
+
+X = csr_matrix(np.array([[1, 0, 1, 0],
+                         [1, 0, 0, 1],
+                         [0, 1, 1, 0],
+                         [0, 1, 0, 1],
+                         [0, 1, 1, 0]]))
+y = np.array(['1280', '1280', '210', '210', '210'])
+
+
+def _dense_log_prob(feature_count, alpha):
+    counts = feature_count + alpha
+    return np.log(counts) - np.log(counts.sum(axis=1)).reshape(-1, 1)
+
+
+def test_fit():
+    model = nb.NaiveBayes().fit(X, y)
+
+    np.testing.assert_array_equal(model.classes, np.array(['1280', '210']))
+    np.testing.assert_array_equal(model.class_count, np.array([2, 3]))
+    np.testing.assert_array_equal(model.feature_count.toarray(), np.array([[2, 0, 1, 1],
+                                                                           [0, 3, 2, 1]]))
+    np.testing.assert_allclose(model.class_log_prior, np.log([0.4, 0.6]))
+
+    # sparse parts combine into the smoothed log probabilities
+    expected = _dense_log_prob(model.feature_count.toarray(), 1.0)
+    actual = model.feature_log_prob.toarray() + model.feature_log_prob_offset.reshape(-1, 1)
+    np.testing.assert_allclose(actual, expected)
+
+
+def test__joint_log_likelihood():
+    model = nb.NaiveBayes(alpha=0.5).fit(X, y)
+    X_test = csr_matrix(np.array([[1, 0, 0, 1],
+                                  [0, 1, 1, 0],
+                                  [2, 0, 1, 0]]))
+
+    log_prob = _dense_log_prob(model.feature_count.toarray(), 0.5)
+    expected = X_test.toarray() @ log_prob.T + model.class_log_prior
+    actual = model._joint_log_likelihood(X_test)
+    np.testing.assert_allclose(actual, expected)
+
+
+def test_predict__matches_multinomial_naive_bayes():
+    rng = np.random.RandomState(0)
+    X_train = csr_matrix(rng.randint(0, 2, size=(50, 20)))
+    y_train = rng.randint(0, 4, size=50)
+    X_test = csr_matrix(rng.randint(0, 2, size=(30, 20)))
+
+    expected = MultinomialNB(alpha=1.0).fit(X_train, y_train).predict(X_test)
+    actual = nb.NaiveBayes(alpha=1.0).fit(X_train, y_train).predict(X_test)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_run_naive_bayes():
+    score = nb.run_naive_bayes(X, X, y, y)
+    assert score == 1.0
+
+
+def test_split_sparsemtx_by_taxid():
+    actual = nb.split_sparsemtx_by_taxid(X, y)
+    assert len(actual) == 2
+    np.testing.assert_array_equal(actual[0].toarray(), X.toarray()[:2])
+    np.testing.assert_array_equal(actual[1].toarray(), X.toarray()[2:])
+
+
+def test_split_sparsemtx_by_taxid__unordered_taxids():
+    taxids = np.array(['210', '1280', '210', '1280', '210'])
+    actual = nb.split_sparsemtx_by_taxid(X, taxids)
+    np.testing.assert_array_equal(actual[0].toarray(), X.toarray()[[1, 3]])
+    np.testing.assert_array_equal(actual[1].toarray(), X.toarray()[[0, 2, 4]])
+
+
+def test_count_features_by_taxid():
+    taxids = np.array(['210', '1280', '210', '1280', '210'])
+    taxids_list, taxid_counts, feature_counts = nb.count_features_by_taxid(X, taxids)
+
+    np.testing.assert_array_equal(taxids_list, np.array(['1280', '210']))
+    np.testing.assert_array_equal(taxid_counts, np.array([2, 3]))
+
+    expected = np.array([[1, 1, 0, 2],
+                         [1, 2, 3, 0]])
+    np.testing.assert_array_equal(feature_counts.toarray(), expected)
+
+
+def test_predict_proba():
+    model = nb.NaiveBayes().fit(X, y)
+    X_test = csr_matrix(np.array([[1, 0, 0, 1],
+                                  [0, 1, 1, 0]]))
+
+    expected = MultinomialNB(alpha=1.0).fit(X, y).predict_proba(X_test)
+    actual = model.predict_proba(X_test)
+    np.testing.assert_allclose(actual, expected)
+    np.testing.assert_allclose(actual.sum(axis=1), np.ones(2))
+
+
+def test_predict_proba__long_fragment():
+    model = nb.NaiveBayes().fit(X, y)
+
+    # probabilities multiplied in linear space would underflow to zero
+    X_test = csr_matrix(np.array([[5000, 0, 0, 5000]]))
+    actual = model.predict_proba(X_test)
+    assert np.all(np.isfinite(actual))
+    np.testing.assert_allclose(actual.sum(axis=1), np.ones(1))
+    np.testing.assert_array_equal(model.predict(X_test), np.array(['1280']))
+
+
+def test_test_new_data():
+    taxid_probabilities = nb.taxid_probability(y)
+    sparse_list = nb.split_sparsemtx_by_taxid(X, y)
+    model = nb.NaiveBayes().fit(X, y)
+
+    encoded = csr_matrix(np.array([[1, 0, 0, 1]]))
+    actual = nb.test_new_data(encoded, sparse_list, taxid_probabilities)
+
+    expected = model.predict_proba(encoded)[0]
+    assert list(actual.keys()) == ['1280', '210']
+    np.testing.assert_allclose([actual['1280'], actual['210']], expected)
+
+
+def test_partial_fit__matches_fit():
+    expected = nb.NaiveBayes().fit(X, y)
+    actual = nb.NaiveBayes().partial_fit(X[:3], y[:3]).partial_fit(X[3:], y[3:])
+
+    np.testing.assert_array_equal(actual.classes, expected.classes)
+    np.testing.assert_array_equal(actual.class_count, expected.class_count)
+    np.testing.assert_array_equal(actual.feature_count.toarray(), expected.feature_count.toarray())
+    np.testing.assert_allclose(actual.class_log_prior, expected.class_log_prior)
+    np.testing.assert_allclose(actual.predict_log_proba(X), expected.predict_log_proba(X))
+
+
+def test_partial_fit__new_class():
+    X_new = csr_matrix(np.array([[1, 1, 0, 0]]))
+    y_new = np.array(['1000'])
+
+    model = nb.NaiveBayes().fit(X, y).partial_fit(X_new, y_new)
+
+    np.testing.assert_array_equal(model.classes, np.array(['1000', '1280', '210']))
+    np.testing.assert_array_equal(model.class_count, np.array([1, 2, 3]))
+    np.testing.assert_array_equal(model.feature_count.toarray(), np.array([[1, 1, 0, 0],
+                                                                           [2, 0, 1, 1],
+                                                                           [0, 3, 2, 1]]))
+
+
+def test_partial_fit__feature_mismatch():
+    model = nb.NaiveBayes().fit(X, y)
+
+    with pytest.raises(ValueError):
+        model.partial_fit(csr_matrix(np.ones((1, 5))), np.array(['210']))
+
+
+def test_fit__discards_previous_counts():
+    model = nb.NaiveBayes().fit(X, y).fit(X[:2], y[:2])
+
+    np.testing.assert_array_equal(model.classes, np.array(['1280']))
+    np.testing.assert_array_equal(model.class_count, np.array([2]))
+
+
+def test_partial_fit_fragment_files(tmp_path):
+    f1 = np.array([[b'g', b'a', b't', b'g', b't', b'128221'],
+                   [b'g', b'c', b't', b'g', b'a', b'128221']])
+    f2 = np.array([[b't', b'a', b'g', b't', b't', b'88411'],
+                   [b'c', b'g', b'g', b'a', b'a', b'88411']])
+    np.save(tmp_path / 'fragment-00001.npy', f1)
+    np.save(tmp_path / 'fragment-00002.npy', f2)
+    k = 3
+
+    actual = nb.partial_fit_fragment_files(nb.NaiveBayes(), str(tmp_path), 'fragment*.npy', k)
+
+    X_all, y_all = encoding2.encode_fragment_dataset_fixed_width(np.vstack((f1, f2)), k)
+    expected = nb.NaiveBayes().fit(X_all, y_all)
+    np.testing.assert_array_equal(actual.classes, expected.classes)
+    np.testing.assert_array_equal(actual.feature_count.toarray(), expected.feature_count.toarray())
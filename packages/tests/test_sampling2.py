@@ -399,3 +399,46 @@ def test_read_fragments__multiple_files(tmp_path):
 
     actual = sampling2.read_fragments(str(d), 'fragment*.npy')
     np.testing.assert_array_equal(actual, expected)
+
+
+def test_read_fragment_records(tmp_path):
+    d = tmp_path  # use temp directory
+
+    f0 = np.array([[b'g', b'a', b't', b'g', b't', b'128221']])
+    f2 = np.array([[b't', b'a', b'g', b't', b't', b'88411'],
+                   [b'c', b'g', b'g', b'a', b'a', b'88411']])
+
+    # sequence 1 was too short to sample
+    np.save(d / 'fragments-00002.npy', f2)
+    np.save(d / 'fragments-00000.npy', f0)
+    np.save(d / 'fragments-00001.npy', np.empty(0, ))
+
+    actual = sampling2.read_fragment_records(str(d), 'fragments*.npy')
+    np.testing.assert_array_equal(actual, np.array([0, 2, 2]))
+    assert len(actual) == len(sampling2.read_fragments(str(d), 'fragments*.npy'))
+
+
+def test_read_sequence_ids(tmp_path):
+    seq_file = tmp_path / 'sequences.fasta'
+    seq_file.write_text('>NC_013451 first genome\nACGT\nACGT\n>NC_015723\nTTTT\n')
+
+    actual = sampling2.read_sequence_ids(str(seq_file))
+    np.testing.assert_array_equal(actual, np.array(['NC_013451', 'NC_015723']))
+
+
+def test_iter_fragments(tmp_path):
+    d = tmp_path  # use temp directory
+
+    f1 = np.array([[b'g', b'a', b't', b'g', b't', b'128221']])
+    f2 = np.array([[b't', b'a', b'g', b't', b't', b'88411'],
+                   [b'c', b'g', b'g', b'a', b'a', b'88411']])
+
+    # written out of order, plus an empty file which should be skipped
+    np.save(d / 'fragment-00002.npy', f2)
+    np.save(d / 'fragment-00001.npy', f1)
+    np.save(d / 'fragment-00003.npy', np.empty((0, 6), dtype='S6'))
+
+    actual = list(sampling2.iter_fragments(str(d), 'fragment*.npy'))
+    assert len(actual) == 2
+    np.testing.assert_array_equal(actual[0], f1)
+    np.testing.assert_array_equal(actual[1], f2)
@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix, issparse
+from packages.linear_model import serialization
+from packages.linear_model.LogisticRegression import LogisticRegression
+from packages.linear_model.MulticlassLogisticRegression import MulticlassLogisticRegression
+
+
+def _fit_multiclass(**kwargs):
+    X = csr_matrix(np.array([[1, 1],
+                             [0, 0],
+                             [1, 0],
+                             [0, 4],
+                             [5, 1],
+                             [5, 2],
+                             [5, -1],
+                             [5, 10],
+                             [3, 10],
+                             [3, 10.5],
+                             [3, 11]]))
+    y = np.array([0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2])
+    model = MulticlassLogisticRegression(eta=0.01, epsilon=0.01, **kwargs)
+    return model.fit(X, y)
+
+
+X_TEST = csr_matrix(np.array([[0, 1],
+                              [5, 0],
+                              [3, 10.25],
+                              [0, 5]]))
+
+
+def test__get_params():
+    model = LogisticRegression(eta=0.01, epsilon=0.5, penalty='l2', l2_lambda=5, dtype=np.float32)
+    actual = serialization._get_params(model)
+    assert actual['eta'] == 0.01
+    assert actual['penalty'] == 'l2'
+    assert actual['l2_lambda'] == 5
+    assert actual['dtype'] == 'float32'
+    assert 'verbose' not in actual
+
+
+def test__build_model():
+    params = {'eta': 0.01, 'epsilon': 0.5, 'penalty': None, 'l2_lambda': 0, 'l1_lambda': 0, 'max_iter': 10,
+              'warm_start': False, 'patience': None, 'dtype': 'float32', 'verbose': True}
+    actual = serialization._build_model('MulticlassLogisticRegression', params)
+    assert isinstance(actual, MulticlassLogisticRegression)
+    assert actual.max_iter == 10
+    assert actual.dtype == np.float32
+
+
+def test__build_model__unknown_type():
+    with pytest.raises(ValueError):
+        serialization._build_model('RandomForest', {'dtype': 'float64'})
+
+
+def test__set_classifiers():
+    model = MulticlassLogisticRegression(eta=0.01, epsilon=0.5)
+    model.weights = np.array([[.1, .4],
+                              [.2, 0],
+                              [.3, .6]])
+    serialization._set_classifiers(model)
+    assert len(model.classifiers) == 2
+    np.testing.assert_array_equal(model.classifiers[1].weights, np.array([.4, 0, .6]))
+
+
+def test_save_model__load_model__multiclass(tmp_path):
+    model = _fit_multiclass()
+    path = str(tmp_path / 'model')
+    classes = np.array(['1280', '1590', '210'])
+
+    serialization.save_model(model, path, classes=classes, k=4, sample_length=100, metadata={'coverage': 10})
+    loaded, info = serialization.load_model(path)
+
+    np.testing.assert_allclose(loaded.predict_proba(X_TEST), model.predict_proba(X_TEST))
+    np.testing.assert_array_equal(loaded.predict(X_TEST), model.predict(X_TEST))
+    assert isinstance(loaded.weights, np.memmap)
+    assert len(loaded.classifiers) == 3
+    assert loaded.eta == model.eta
+    np.testing.assert_array_equal(info['classes'], classes)
+    assert info['k'] == 4
+    assert info['sample_length'] == 100
+    assert info['metadata'] == {'coverage': 10}
+    assert info['categories'] is None
+
+
+def test_save_model__load_model__categories(tmp_path):
+    model = _fit_multiclass()
+    path = str(tmp_path / 'model')
+    categories = [np.array(['aa', 'ct', 'gg']), np.array(['tt'])]
+
+    serialization.save_model(model, path, classes=np.array(['1280', '1590', '210']), k=2, categories=categories)
+    _, info = serialization.load_model(path)
+
+    assert len(info['categories']) == 2
+    np.testing.assert_array_equal(info['categories'][0], categories[0])
+    np.testing.assert_array_equal(info['categories'][1], categories[1])
+
+
+def test_save_model__load_model__sparse(tmp_path):
+    model = _fit_multiclass(penalty='l1', l1_lambda=0.5).sparsify()
+    path = str(tmp_path / 'model')
+
+    serialization.save_model(model, path)
+    loaded, info = serialization.load_model(path)
+
+    assert issparse(loaded.weights)
+    np.testing.assert_allclose(loaded.predict_proba(X_TEST), model.predict_proba(X_TEST))
+    assert info['classes'] is None
+
+
+def test_save_model__load_model__binary(tmp_path):
+    model = LogisticRegression(eta=0.01, epsilon=0.5, dtype=np.float32)
+    model.fit(np.array([[4, 5], [3, 5]]), np.array([1, 0]))
+    path = str(tmp_path / 'model')
+
+    serialization.save_model(model, path)
+    loaded, _ = serialization.load_model(path, mmap=False)
+
+    assert loaded.dtype == np.float32
+    np.testing.assert_array_equal(loaded.weights, model.weights)
+
+
+def test_save_model__not_fit(tmp_path):
+    model = LogisticRegression(eta=0.01, epsilon=0.5)
+    with pytest.raises(ValueError):
+        serialization.save_model(model, str(tmp_path / 'model'))
@@ -0,0 +1,92 @@
+from packages.gridsearch import helper, successive_halving
+import numpy as np
+
+
+def test_calc_number_rungs():
+    assert successive_halving.calc_number_rungs(1 / 27, 3) == 4
+    assert successive_halving.calc_number_rungs(1 / 9, 3) == 3
+    assert successive_halving.calc_number_rungs(1 / 10, 3) == 3
+    assert successive_halving.calc_number_rungs(1, 3) == 1
+
+
+def test__get_configurations():
+    actual = successive_halving._get_configurations([100, 200] * 2, [1], [2], [(0.1,), (0.2,)])
+    assert actual == [(100, 1, 2, (0.1,)), (100, 1, 2, (0.2,)), (200, 1, 2, (0.1,)), (200, 1, 2, (0.2,))]
+
+
+def test__subsample_rows__every_class_kept():
+    y = np.array([0] * 100 + [2] * 5 + [4] * 30)
+
+    rows = successive_halving._subsample_rows(y, 1 / 27, 42)
+    classes, counts = np.unique(y[rows], return_counts=True)
+    np.testing.assert_array_equal(classes, np.array([0, 2, 4]))
+    np.testing.assert_array_equal(counts, np.array([4, 1, 1]))  # round(n / 27), at least one
+
+
+def test__subsample_rows__nested():
+    y = np.repeat(np.arange(12), 30)
+
+    previous = None
+    for fraction in [1 / 27, 1 / 9, 1 / 3, 1.0]:
+        rows = successive_halving._subsample_rows(y, fraction, 42)
+        assert len(np.unique(y[rows])) == 12
+        if previous is not None:
+            assert np.all(np.isin(previous, rows))
+        previous = rows
+
+    np.testing.assert_array_equal(previous, np.arange(len(y)))
+
+
+def _score_by_param(X_train, X_test, y_train, y_test, value, timings=None):
+    assert len(np.unique(y_train)) == 2  # every class is trained on at every rung
+    return value
+
+
+def test_successive_halving__survivors(input_files, tmp_path):
+    seq_file, taxid_file = input_files
+    grid_search_file = str(tmp_path / 'results.csv')
+    hyperparameters = [(value,) for value in [0.3, 0.9, 0.1, 0.5, 0.7, 0.2, 0.8, 0.4, 0.6]]
+
+    ranked = successive_halving.successive_halving(seq_file, taxid_file, str(tmp_path / 'output'), '*.npy', [50], [1],
+                                                   [2], hyperparameters, _score_by_param, 42, grid_search_file,
+                                                   ['shape', 'L', 'c', 'k', 'value', 'score'], [], [],
+                                                   min_fraction=1 / 9, eta=3)
+
+    assert ranked == [((50, 1, 2, (0.9,)), 0.9)]
+
+    # 9 combinations, then the best 3, then the best one, each on more of the training data
+    results = helper._read_results(grid_search_file)
+    assert list(results['value']) == [0.3, 0.9, 0.1, 0.5, 0.7, 0.2, 0.8, 0.4, 0.6, 0.9, 0.8, 0.7, 0.9]
+    n_rows = [int(shape.strip('()').split(',')[0]) for shape in results['shape']]
+    assert n_rows[0] < n_rows[9] < n_rows[12]
+
+
+_TEST_SETS = []
+
+
+def _score_and_remember_test_set(X_train, X_test, y_train, y_test, value, timings=None):
+    _TEST_SETS.append(X_test.toarray())
+    return value
+
+
+def test_successive_halving__data_built_once(input_files, tmp_path, monkeypatch):
+    seq_file, taxid_file = input_files
+    hyperparameters = [(value,) for value in [0.3, 0.9, 0.1]]
+    built = []
+
+    def build_fragments(*args, **kwargs):
+        built.append(args[3:5])
+        return helper.build_fragments(*args, **kwargs)
+
+    monkeypatch.setattr(successive_halving, 'build_fragments', build_fragments)
+    _TEST_SETS.clear()
+
+    # unseeded, so fragments would differ if they were sampled again for each rung
+    successive_halving.successive_halving(seq_file, taxid_file, str(tmp_path / 'output'), '*.npy', [50], [1], [2],
+                                          hyperparameters, _score_and_remember_test_set, None,
+                                          str(tmp_path / 'results.csv'), None, [], [], min_fraction=1 / 3, eta=3)
+
+    assert built == [(50, 1)]
+    assert len(_TEST_SETS) == 4
+    for X_test in _TEST_SETS[1:]:
+        np.testing.assert_array_equal(X_test, _TEST_SETS[0])  # every rung is scored on the same test set
@@ -0,0 +1,61 @@
+from packages.metagenomics import taxonomy
+import pytest
+import numpy as np
+
+
+@pytest.fixture
+def meta_file(tmp_path):
+    meta_file = tmp_path / 'train.meta'
+    meta_file.write_text('sequence.id\tgenome.id\ttaxid.strain\ttaxid.species\ttaxid.genus\n'
+                         'Cupriavidus_necator_N-1\tNC_015723\t1042878\t106590\t106589\n'
+                         'Cupriavidus_necator_N-1\tNC_015724\t1042878\t106590\t106589\n'
+                         'Cupriavidus_taiwanensis\tCU633749\t977880\t164546\t106589\n'
+                         'Staphylococcus_aureus_JH1\tNC_009632\t359787\t1280\t1279\n')
+    return str(meta_file)
+
+
+def test_read_taxonomy(meta_file):
+    actual = taxonomy.read_taxonomy(meta_file)
+    assert list(actual.columns) == ['strain', 'species', 'genus']
+    assert len(actual) == 3  # genomes of the same strain share a row
+    assert list(actual['species']) == ['106590', '164546', '1280']
+
+
+def test_get_rank_lookup(meta_file):
+    tax = taxonomy.read_taxonomy(meta_file)
+    keys, values = taxonomy.get_rank_lookup(tax, 'species', 'genus')
+    np.testing.assert_array_equal(keys, np.array(['106590', '1280', '164546']))
+    np.testing.assert_array_equal(values, np.array(['106589', '1279', '106589']))
+
+
+def test_get_rank_lookup__lower_rank(meta_file):
+    tax = taxonomy.read_taxonomy(meta_file)
+    with pytest.raises(ValueError):
+        taxonomy.get_rank_lookup(tax, 'genus', 'species')
+
+
+def test_map_to_rank(meta_file):
+    tax = taxonomy.read_taxonomy(meta_file)
+    taxids = np.array(['1280', '106590', '164546', '1280'])
+
+    expected = np.array(['1279', '106589', '106589', '1279'])
+    actual = taxonomy.map_to_rank(taxids, tax, 'species', 'genus')
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_map_to_rank__integer_taxids(meta_file):
+    tax = taxonomy.read_taxonomy(meta_file)
+    actual = taxonomy.map_to_rank(np.array([1042878, 359787]), tax, 'strain', 'species')
+    np.testing.assert_array_equal(actual, np.array(['106590', '1280']))
+
+
+def test_map_to_rank__missing_taxid(meta_file):
+    tax = taxonomy.read_taxonomy(meta_file)
+    with pytest.raises(ValueError):
+        taxonomy.map_to_rank(np.array(['1280', '99999999']), tax, 'species', 'genus')
+
+
+def test_map_to_rank__missing_value(meta_file):
+    tax = taxonomy.read_taxonomy(meta_file)
+    actual = taxonomy.map_to_rank(np.array(['1280', '99999999']), tax, 'species', 'genus', missing='unknown')
+    np.testing.assert_array_equal(actual, np.array(['1279', 'unknown']))
@@ -0,0 +1,163 @@
+from packages.gridsearch import helper, work_queue
+import pytest
+import json
+import os
+import time
+
+
+def _read_task(queue_dir, state, name):
+    with open(os.path.join(queue_dir, state, name)) as f:
+        return json.load(f)
+
+
+def _make_old(path, age):
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+
+
+def test_create_queue(tmp_path):
+    queue_dir = str(tmp_path / 'queue')
+
+    n_tasks = work_queue.create_queue(queue_dir, [100, 100], [1], [2, 4], [(0.1,), (0.2,)])
+    assert n_tasks == 8
+    assert work_queue.get_queue_status(queue_dir) == {'pending': 8, 'running': 0, 'done': 0}
+
+    names = sorted(os.listdir(os.path.join(queue_dir, 'pending')))
+    assert names[0] == '00000000.json'
+    assert _read_task(queue_dir, 'pending', names[0]) == {'sample_length': 100, 'coverage': 1, 'trial': 0, 'k': 2,
+                                                          'params': [0.1]}
+    assert _read_task(queue_dir, 'pending', names[3]) == {'sample_length': 100, 'coverage': 1, 'trial': 0, 'k': 4,
+                                                          'params': [0.2]}
+    assert _read_task(queue_dir, 'pending', names[4])['trial'] == 1  # repeated sample length is a second trial
+
+
+def test_create_queue__already_exists(tmp_path):
+    queue_dir = str(tmp_path / 'queue')
+    work_queue.create_queue(queue_dir, [100], [1], [2], [()])
+
+    with pytest.raises(ValueError):
+        work_queue.create_queue(queue_dir, [100], [1], [2], [()])
+
+
+def test__claim_task(tmp_path):
+    queue_dir = str(tmp_path / 'queue')
+    work_queue.create_queue(queue_dir, [100], [1], [2], [(0.1,), (0.2,)])
+
+    assert work_queue._claim_task(queue_dir) == '00000000.json'
+    assert work_queue._claim_task(queue_dir) == '00000001.json'
+    assert work_queue._claim_task(queue_dir) is None
+    assert work_queue.get_queue_status(queue_dir) == {'pending': 0, 'running': 2, 'done': 0}
+    assert not os.path.exists(os.path.join(queue_dir, work_queue.LOCK_FILE))
+
+
+def test__acquire_lock__stale_lock(tmp_path):
+    queue_dir = str(tmp_path)
+    lock_file = os.path.join(queue_dir, work_queue.LOCK_FILE)
+    with open(lock_file, 'w') as f:
+        f.write('dead-worker')
+    _make_old(lock_file, 1000)
+
+    owner = work_queue._acquire_lock(queue_dir, timeout=1, stale_after=300)
+    with open(lock_file) as f:
+        assert f.read() == owner
+
+    work_queue._release_lock(queue_dir, owner)
+    assert os.listdir(queue_dir) == []
+
+
+def test__acquire_lock__timeout(tmp_path):
+    queue_dir = str(tmp_path)
+    work_queue._acquire_lock(queue_dir)
+
+    with pytest.raises(TimeoutError):
+        work_queue._acquire_lock(queue_dir, timeout=0.2)
+
+
+def test__release_lock__other_owner(tmp_path):
+    queue_dir = str(tmp_path)
+    owner = work_queue._acquire_lock(queue_dir)
+
+    # lock was removed as stale and acquired by another worker
+    work_queue._release_lock(queue_dir, 'other-worker')
+    with open(os.path.join(queue_dir, work_queue.LOCK_FILE)) as f:
+        assert f.read() == owner
+    assert os.listdir(queue_dir) == [work_queue.LOCK_FILE]
+
+
+def test_requeue_stale_tasks(tmp_path):
+    queue_dir = str(tmp_path / 'queue')
+    work_queue.create_queue(queue_dir, [100], [1], [2], [(0.1,), (0.2,)])
+    stale = work_queue._claim_task(queue_dir)
+    work_queue._claim_task(queue_dir)
+    _make_old(os.path.join(queue_dir, 'running', stale), 1000)
+
+    assert work_queue.requeue_stale_tasks(queue_dir, 300) == [stale]
+    assert os.listdir(os.path.join(queue_dir, 'pending')) == [stale]
+    assert work_queue.get_queue_status(queue_dir) == {'pending': 1, 'running': 1, 'done': 0}
+
+
+def test__heartbeat(tmp_path):
+    path = str(tmp_path / 'task.json')
+    with open(path, 'w') as f:
+        f.write('{}')
+    _make_old(path, 1000)
+
+    with work_queue._heartbeat(path, 0.01):
+        time.sleep(0.2)
+    assert time.time() - os.path.getmtime(path) < 10
+
+
+def test__heartbeat__moved_file(tmp_path):
+    path = str(tmp_path / 'task.json')
+    with open(path, 'w') as f:
+        f.write('{}')
+
+    with work_queue._heartbeat(path, 0.01):
+        os.remove(path)
+        time.sleep(0.05)
+    assert not os.path.exists(path)
+
+
+def _write_shard(queue_dir, worker_id, entries, partial=''):
+    with open(os.path.join(queue_dir, 'results', '{}.jsonl'.format(worker_id)), 'w', newline='') as f:
+        for name, row in entries:
+            f.write(json.dumps({'task': name, 'row': helper._format_row(row)}) + '\n')
+        f.write(partial)
+
+
+def test_merge_results__duplicate_task(tmp_path):
+    queue_dir = str(tmp_path / 'queue')
+    grid_search_file = str(tmp_path / 'results.csv')
+    work_queue.create_queue(queue_dir, [100], [1], [2], [(0.1,), (0.2,), (0.3,)])
+
+    # task 1 was requeued and run again by a second worker; the second worker was killed while writing
+    _write_shard(queue_dir, 'a', [('00000001.json', ['b', 0.5]), ('00000002.json', ['c', 0.6])])
+    _write_shard(queue_dir, 'b', [('00000000.json', ['a', 0.4]), ('00000001.json', ['b', 0.5])], partial='{"task')
+
+    assert work_queue.merge_results(queue_dir, grid_search_file, ['name', 'score']) == 3
+    with open(grid_search_file) as f:
+        lines = f.read().splitlines()
+    assert lines[0] == ','.join(['name', 'score'] + helper.timing_fields())
+    assert lines[1:] == ['a,0.4', 'b,0.5', 'c,0.6']
+
+
+def _score_and_requeue(X_train, X_test, y_train, y_test, queue_dir, timings=None):
+    # simulates the task being requeued by another process while this worker runs it
+    work_queue.requeue_stale_tasks(queue_dir, -1)
+    return 0.5
+
+
+def test_run_worker(input_files, tmp_path):
+    seq_file, taxid_file = input_files
+    queue_dir = str(tmp_path / 'queue')
+    grid_search_file = str(tmp_path / 'results.csv')
+    work_queue.create_queue(queue_dir, [50], [1], [2, 3], [(queue_dir,)])
+
+    n_tasks = work_queue.run_worker(queue_dir, seq_file, taxid_file, str(tmp_path / 'output'), '*.npy',
+                                    _score_and_requeue, 42, ['mlr'], ['recall'], worker_id='w1',
+                                    heartbeat_interval=0.01)
+
+    # requeued tasks are still finished by the worker which ran them
+    assert n_tasks == 2
+    assert work_queue.get_queue_status(queue_dir) == {'pending': 0, 'running': 0, 'done': 2}
+    assert work_queue.merge_results(queue_dir, grid_search_file, ['classifier']) == 2